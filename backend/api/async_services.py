@@ -0,0 +1,161 @@
+import asyncio
+import copy
+import logging
+import time
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from . import services
+from .cache import AsyncSingleFlight
+from .lambda_client import ainvoke_meal_planner
+from .providers import get_async_provider_client
+from .tasks import resolve_context_data
+
+logger = logging.getLogger(__name__)
+
+# Concurrent weather lookups for the same location on an event loop share one call
+weather_flight = AsyncSingleFlight('weather')
+
+
+async def afetch_weather_data(location):
+    """
+    asyncio version of services.fetch_weather_data
+    """
+    start = time.monotonic()
+    try:
+        response = await get_async_provider_client('weather').get(services.build_weather_url(location))
+        if response.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{response.status_code} error from weather API")
+        weather_data = response.json()
+    finally:
+        services.weather_cache_stats.incr('upstream_calls')
+        services.weather_cache_stats.incr('upstream_seconds', time.monotonic() - start)
+    
+    return services.parse_weather_data(weather_data)
+
+
+async def aload_weather_data(location, key):
+    """
+    asyncio version of services.load_weather_data
+    """
+    try:
+        weather_data = await afetch_weather_data(location)
+    except requests.exceptions.RequestException as e:
+        return await sync_to_async(services.weather_fetch_failed, thread_sensitive=False)(key, e)
+    
+    await sync_to_async(services._cache_weather, thread_sensitive=False)(key, weather_data)
+    return weather_data
+
+
+async def aget_weather_data(location):
+    """
+    asyncio version of services.get_weather_data, sharing its cache
+    """
+    key = services.normalize_location(location)
+    # Cache reads and writes block, so they run in worker threads rather than on the event loop
+    weather_data = await sync_to_async(services.get_cached_weather_data, thread_sensitive=False)(location, key)
+    if weather_data is not None:
+        return weather_data
+    
+    weather_data = await weather_flight.do(key, aload_weather_data, location, key)
+    return dict(weather_data)
+
+
+async def aget_fitness_data(user_id, api_id):
+    """
+    asyncio version of services.get_fitness_data
+    """
+    if settings.FITNESS_API_MODE == 'roster':
+        # Usually an in-memory lookup, but the first one fetches the roster
+        return await sync_to_async(services.get_roster_fitness_data, thread_sensitive=False)(user_id, api_id)
+    
+    fitness_request = services.build_fitness_request(user_id, api_id)
+    if fitness_request is None:
+        return dict(services.DEFAULT_FITNESS_DATA)
+    url, headers = fitness_request
+    
+    try:
+        response = await get_async_provider_client('fitness').get(url, headers=headers)
+        return services.parse_fitness_response(response)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Fitness API error: {str(e)}")
+        return dict(services.DEFAULT_FITNESS_DATA)
+
+
+async def afetch_context_data(providers):
+    """
+    asyncio version of services.fetch_context_data
+    
+    providers maps a provider name to a (coroutine function, args, default) tuple.
+    Lookups run concurrently, each limited by its CONTEXT_PROVIDER_TIMEOUTS budget.
+    """
+    timeouts = settings.CONTEXT_PROVIDER_TIMEOUTS
+    
+    async def run(name, func, args, default):
+        timeout = timeouts.get(name, services.DEFAULT_PROVIDER_TIMEOUT)
+        try:
+            return await asyncio.wait_for(func(*args), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Context provider '{name}' timed out after {timeout}s")
+        except Exception as e:
+            logger.error(f"Context provider '{name}' error: {str(e)}")
+        return dict(default)
+    
+    names = list(providers)
+    results = await asyncio.gather(*(run(name, *providers[name]) for name in names))
+    return dict(zip(names, results))
+
+
+async def agenerate_meal_plan(user_profile, weather_data, fitness_data):
+    """
+    asyncio version of services.generate_meal_plan, sharing its memo
+    """
+    payload, memo_key, meal_plan = await sync_to_async(services.prepare_meal_plan_request, thread_sensitive=False)(
+        user_profile, weather_data, fitness_data
+    )
+    if meal_plan is not None:
+        return meal_plan
+    
+    try:
+        result = await ainvoke_meal_planner(payload)
+        
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        await sync_to_async(services.memoize_meal_plan, thread_sensitive=False)(memo_key, result)
+        return result
+    except Exception as e:
+        logger.error(f"AWS Lambda error: {str(e)}")
+        return copy.deepcopy(services.DEFAULT_MEAL_PLAN)
+
+
+async def agenerate_meal_plan_task(user_id, location, manual_fitness_data=None):
+    """
+    asyncio version of tasks.generate_meal_plan_task
+    
+    Upstream calls are awaited, so while they are in flight the event loop serves
+    other requests; only the final save runs in a (short-lived) thread.
+    """
+    try:
+        user = await User.objects.select_related('profile').aget(id=user_id)
+        user_profile = user.profile
+        
+        providers = {
+            'weather': (aget_weather_data, (location,), services.DEFAULT_WEATHER_DATA)
+        }
+        if not manual_fitness_data:
+            providers['fitness'] = (aget_fitness_data, (user_id, user_profile.fitness_api_id), services.DEFAULT_FITNESS_DATA)
+        context_data = await afetch_context_data(providers)
+        weather_data, fitness_data, warnings = resolve_context_data(context_data, manual_fitness_data)
+        
+        meal_plan_data = await agenerate_meal_plan(user_profile, weather_data, fitness_data)
+        meal_plan = await sync_to_async(services.save_meal_plan)(user, location, weather_data, fitness_data, meal_plan_data)
+        
+        return {
+            'meal_plan_id': meal_plan.id,
+            'warnings': warnings
+        }
+    
+    except Exception as e:
+        logger.error(f"Error generating meal plan: {str(e)}")
+        return None
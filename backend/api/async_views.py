@@ -0,0 +1,182 @@
+"""
+Async (ASGI) versions of the generate, latest and meal endpoints
+
+These are plain Django async views rather than DRF views: DRF doesn't run views
+natively on the event loop. They are only served under an ASGI server, e.g.
+    uvicorn dietplanner.asgi:application --workers 4
+Under WSGI every request would run on a new event loop, so the pooled per-loop
+httpx clients would be rebuilt (and left open) on every request; WSGI deployments
+use the /api/meal-plans/ endpoints instead.
+"""
+import json
+from functools import partial, wraps
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, Http404
+from django.urls import reverse
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from users.authentication import CachedTokenAuthentication
+from .async_services import agenerate_meal_plan_task
+from .idempotency import (
+    get_generate_request_keys, find_generate_result, reserve_generate_request,
+    release_generate_request, remember_generate_result
+)
+from .models import MealPlan
+from .plan_cache import get_latest_meal_plan_id, add_latest_meal_plan_id, NO_MEAL_PLAN
+from .views import get_user_meal_plan_entry, cached_response
+
+json_response = partial(JsonResponse, safe=False)
+
+
+async def aauthenticate(request):
+    """
+    Return the user for the request's "Authorization: Token <key>" header, or None
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    
+    try:
+        user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(auth[1])
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+def asgi_only(view):
+    """
+    Serve an async view only under ASGI, where the event loop (and with it the
+    pooled provider clients) lives as long as the worker
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'detail': 'This endpoint is only served under ASGI; use /api/meal-plans/ instead.'},
+                                status=501)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def unauthorized_response():
+    response = JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+def generated_response(meal_plan_id, warnings, headers=None):
+    return JsonResponse({
+        'message': 'Meal plan generated successfully',
+        'meal_plan_id': meal_plan_id,
+        'warnings': warnings
+    }, status=201, headers=headers)
+
+
+async def aget_user_meal_plan_entry(user, meal_plan_id):
+    # Even cache hits may be a Redis round trip, so the lookup runs in a thread
+    return await sync_to_async(get_user_meal_plan_entry)(user, meal_plan_id)
+
+
+@asgi_only
+async def generate_meal_plan(request):
+    """
+    Generate a new meal plan, awaiting the weather, fitness and meal planner calls
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthorized_response()
+    
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    
+    location = data.get('location')
+    if not location:
+        return JsonResponse({'error': 'Location is required to generate a meal plan'}, status=400)
+    manual_fitness_data = data.get('manual_fitness_data')
+    
+    request_keys = await sync_to_async(get_generate_request_keys)(
+        user, location, manual_fitness_data, idempotency_key=request.headers.get('Idempotency-Key')
+    )
+    try:
+        previous = await sync_to_async(find_generate_result)(user, request_keys)
+        if previous is None:
+            await sync_to_async(reserve_generate_request)(request_keys)
+    except APIException as e:
+        return JsonResponse({'detail': e.detail}, status=e.status_code)
+    if previous is not None:
+        headers = {'Idempotent-Replayed': 'true'}
+        if 'job' in previous:
+            job = previous['job']
+            return JsonResponse({
+                'message': 'Meal plan generation started',
+                'job_id': str(job.id),
+                'status': job.status,
+                'status_url': request.build_absolute_uri(reverse('meal-plan-job-status', kwargs={'job_id': job.id}))
+            }, status=202, headers=headers)
+        return generated_response(previous['meal_plan_id'], previous['warnings'], headers=headers)
+    
+    result = await agenerate_meal_plan_task(user.id, location, manual_fitness_data=manual_fitness_data)
+    if not result or not result.get('meal_plan_id'):
+        await sync_to_async(release_generate_request)(request_keys)
+        return JsonResponse({
+            'error': 'Failed to generate meal plan',
+            'warnings': (result or {}).get('warnings', [])
+        }, status=500)
+    
+    await sync_to_async(remember_generate_result)(request_keys, meal_plan_id=result['meal_plan_id'], warnings=result['warnings'])
+    return generated_response(result['meal_plan_id'], result['warnings'])
+
+
+# Token authenticated, so exempt from CSRF checks like the DRF views. Set directly
+# because csrf_exempt doesn't preserve coroutine functions before Django 5.0.
+generate_meal_plan.csrf_exempt = True
+
+
+@asgi_only
+async def latest_meal_plan(request):
+    """
+    Get the latest meal plan for the current user
+    """
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthorized_response()
+    
+    meal_plan_id = await sync_to_async(get_latest_meal_plan_id)(user.id)
+    if meal_plan_id is None:
+        meal_plan_id = await (MealPlan.objects.filter(user=user).order_by('-created_at', '-id')
+                              .values_list('id', flat=True).afirst())
+        # Only added, so a newer id stored by a save that committed meanwhile isn't overwritten
+        await sync_to_async(add_latest_meal_plan_id)(user.id, meal_plan_id)
+    
+    entry = None
+    if meal_plan_id and meal_plan_id != NO_MEAL_PLAN:
+        entry = await aget_user_meal_plan_entry(user, meal_plan_id)
+    if entry is None:
+        return JsonResponse({'message': 'No meal plans found for this user'}, status=404)
+    return cached_response(request, entry, entry['data'], response_class=json_response)
+
+
+@asgi_only
+async def meals(request, meal_plan_id, meal_id=None):
+    """
+    Get all meals of a meal plan, or one of them
+    """
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthorized_response()
+    
+    entry = await aget_user_meal_plan_entry(user, meal_plan_id)
+    if entry is None:
+        raise Http404
+    meal_list = entry['data']['meals']
+    
+    if meal_id:
+        meal = next((meal for meal in meal_list if meal['id'] == meal_id), None)
+        if meal is None:
+            raise Http404
+        return cached_response(request, entry, meal, response_class=json_response)
+    return cached_response(request, entry, meal_list, response_class=json_response)
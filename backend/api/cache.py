@@ -0,0 +1,252 @@
+import asyncio
+import threading
+import time
+import logging
+import weakref
+from collections import OrderedDict
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# All CacheStats instances by name, so they can be reported together
+_stats_registry = {}
+
+
+class CacheStats:
+    """
+    Thread-safe named counters (hits, misses, ...) for a cache layer
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counters = {}
+        _stats_registry[name] = self
+    
+    def incr(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+    
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        counters['hit_rate'] = round(counters.get('hits', 0) / lookups, 4) if lookups else 0.0
+        return counters
+    
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+def get_cache_stats():
+    """
+    Return a snapshot of every registered cache's counters
+    """
+    return {name: stats.snapshot() for name, stats in _stats_registry.items()}
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with per-entry expiry
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Cache backed by a Django cache alias, with an in-process LRU fallback
+    
+    Writes go to both tiers. Reads use the shared Django cache and only fall
+    back to the local LRU if the shared backend is unavailable (e.g. Redis is down).
+    """
+    def __init__(self, prefix, alias='default', maxsize=1024):
+        self.prefix = prefix
+        self.alias = alias
+        self.local = LRUCache(maxsize=maxsize)
+    
+    def make_key(self, key):
+        return f"{self.prefix}:{key}"
+    
+    def get(self, key, default=None):
+        key = self.make_key(key)
+        try:
+            return caches[self.alias].get(key, default)
+        except Exception as e:
+            logger.warning(f"Shared cache read failed, using local cache: {str(e)}")
+            return self.local.get(key, default)
+    
+    def set(self, key, value, timeout=None):
+        key = self.make_key(key)
+        self.local.set(key, value, timeout)
+        try:
+            caches[self.alias].set(key, value, timeout)
+        except Exception as e:
+            logger.warning(f"Shared cache write failed, stored locally only: {str(e)}")
+    
+    def add(self, key, value, timeout=None):
+        """
+        Set key only if it isn't set yet; returns whether it was
+        """
+        key = self.make_key(key)
+        try:
+            added = caches[self.alias].add(key, value, timeout)
+        except Exception as e:
+            logger.warning(f"Shared cache add failed, using local cache: {str(e)}")
+            added = self.local.get(key) is None
+        if added:
+            self.local.set(key, value, timeout)
+        return added
+    
+    def delete(self, key):
+        key = self.make_key(key)
+        self.local.delete(key)
+        try:
+            caches[self.alias].delete(key)
+        except Exception as e:
+            logger.warning(f"Shared cache delete failed: {str(e)}")
+    
+    def clear_local(self):
+        self.local.clear()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into a single call
+    
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait and share its result (or exception). Callers that shared a
+    call are counted as hits, callers that made it as misses.
+    
+    With lock_alias set the first caller across all workers also takes a lock in
+    that Django cache for up to lock_timeout seconds. Callers in other workers
+    then poll recheck() (e.g. "is it in the shared cache yet?") for up to
+    lock_wait seconds and return its first non-None value, only making the call
+    themselves if nothing turns up.
+    """
+    def __init__(self, name, lock_alias=None, lock_timeout=10, lock_wait=5, poll_interval=0.05):
+        self.name = name
+        self.lock_alias = lock_alias
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self.poll_interval = poll_interval
+        self.stats = CacheStats(f'{name}_flight')
+        self._lock = threading.Lock()
+        self._calls = {}
+    
+    def do(self, key, func, *args, recheck=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+        
+        if not leader:
+            self.stats.incr('hits')
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        
+        self.stats.incr('misses')
+        try:
+            call['result'] = self._call(key, func, args, recheck)
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+    
+    def _call(self, key, func, args, recheck):
+        if self.lock_alias is None:
+            return func(*args)
+        
+        lock_key = f"singleflight:{self.name}:{key}"
+        try:
+            acquired = caches[self.lock_alias].add(lock_key, 1, self.lock_timeout)
+        except Exception as e:
+            logger.warning(f"Single flight lock unavailable, calling directly: {str(e)}")
+            return func(*args)
+        
+        if acquired:
+            try:
+                return func(*args)
+            finally:
+                try:
+                    caches[self.lock_alias].delete(lock_key)
+                except Exception as e:
+                    logger.warning(f"Single flight unlock failed: {str(e)}")
+        
+        # Another worker is making the call; wait for its result to show up
+        if recheck is not None:
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                result = recheck()
+                if result is not None:
+                    self.stats.incr('remote_hits')
+                    return result
+        
+        self.stats.incr('lock_timeouts')
+        return func(*args)
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight (in-process only): concurrent awaits
+    for the same key on an event loop share one task
+    """
+    def __init__(self, name):
+        self.stats = CacheStats(f'{name}_async_flight')
+        self._tasks = weakref.WeakKeyDictionary()
+    
+    async def do(self, key, func, *args):
+        tasks = self._tasks.setdefault(asyncio.get_running_loop(), {})
+        task = tasks.get(key)
+        if task is not None:
+            self.stats.incr('hits')
+        else:
+            self.stats.incr('misses')
+            task = tasks[key] = asyncio.ensure_future(func(*args))
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+        # Shielded so one caller timing out doesn't cancel the call for the others
+        return await asyncio.shield(task)
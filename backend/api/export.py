@@ -0,0 +1,63 @@
+import csv
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import MealPlan
+from .serializers import MealPlanSerializer, MealSerializer
+
+# Export formats: (content type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+PLAN_COLUMNS = [field for field in MealPlanSerializer.Meta.fields if field != 'meals']
+MEAL_COLUMNS = MealSerializer.Meta.fields
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value, so csv.writer rows can be yielded
+    """
+    def write(self, value):
+        return value
+
+
+def iter_meal_plans(user):
+    """
+    Yield the user's serialized meal plans, newest first, with their meals
+    
+    Plans are read EXPORT_CHUNK_SIZE at a time (through a server-side cursor on
+    PostgreSQL, unless DB_POOL_MODE=pgbouncer disables them) and meals are
+    prefetched per chunk, so memory use doesn't grow with the length of the history.
+    """
+    queryset = (MealPlan.objects.filter(user=user).select_related('user')
+                .prefetch_related('meals').order_by('-created_at', '-id'))
+    for meal_plan in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield MealPlanSerializer(meal_plan).data
+
+
+def export_ndjson(user):
+    """
+    One JSON meal plan (with nested meals) per line
+    """
+    for data in iter_meal_plans(user):
+        yield json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_csv(user):
+    """
+    One row per meal, prefixed with its plan's columns (plans without meals get
+    a single row with empty meal columns)
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(PLAN_COLUMNS + [f'meal_{column}' for column in MEAL_COLUMNS])
+    
+    for data in iter_meal_plans(user):
+        plan_row = [data[column] for column in PLAN_COLUMNS]
+        for meal in data['meals'] or [{}]:
+            yield writer.writerow(plan_row + [meal.get(column, '') for column in MEAL_COLUMNS])
+
+
+def export_meal_plans(user, export_format):
+    return {'ndjson': export_ndjson, 'csv': export_csv}[export_format](user)
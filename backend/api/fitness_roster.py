@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+import requests
+from .cache import CacheStats
+from .providers import get_provider_client
+
+logger = logging.getLogger(__name__)
+
+fitness_roster_stats = CacheStats('fitness_roster')
+
+
+def map_fitness_class_to_activity(fitness_class):
+    # Map fitness class (A, B, C) to activity level
+    mapping = {
+        "A": "active",
+        "B": "moderate",
+        "C": "light",
+        # Default
+        "": "moderate"
+    }
+    return mapping.get(fitness_class, "moderate")
+
+
+def estimate_calories_by_age(age, activity_level):
+    # Estimate base calories based on age and activity level
+    # Very rough estimate - would be better with height/weight
+    base_calories = 2000  # Default for adult
+    
+    # Age adjustments
+    if age < 18:
+        base_calories = 1800
+    elif age > 50:
+        base_calories = 1900
+    
+    # Activity multipliers
+    multipliers = {
+        "sedentary": 1.2,
+        "light": 1.375,
+        "moderate": 1.55,
+        "active": 1.725,
+        "very_active": 1.9
+    }
+    
+    return int(base_calories * multipliers.get(activity_level, 1.55))
+
+
+def estimate_active_minutes(activity_level):
+    # Estimate active minutes based on activity level
+    mapping = {
+        "sedentary": 15,
+        "light": 30,
+        "moderate": 45,
+        "active": 60,
+        "very_active": 90
+    }
+    return mapping.get(activity_level, 45)
+
+
+def member_to_fitness_data(member):
+    """
+    Derive daily fitness data from a roster member's fitness class and age
+    """
+    activity_level = map_fitness_class_to_activity(member.get("fitness_class", "B"))
+    
+    try:
+        age = int(member.get("age", 25))
+    except (ValueError, TypeError):
+        age = 25  # Default if age is not a valid number
+    
+    estimated_calories = estimate_calories_by_age(age, activity_level)
+    return {
+        'calories_burned': int(estimated_calories * 0.3),
+        'steps': int(estimated_calories * 2.5),
+        'active_minutes': estimate_active_minutes(activity_level),
+        'using_default': False
+    }
+
+
+class FitnessRoster:
+    """
+    In-process index of the fitness API's member roster, by member id
+    
+    The roster endpoint only returns every member at once, so it is fetched at
+    most once per ttl seconds and indexed; lookups are then dict hits. After ttl
+    the old index keeps being served while a background thread refetches it.
+    Past ttl + stale_ttl (and before the first fetch) the caller fetches it
+    itself. A failed fetch keeps the previous index and isn't retried for
+    retry_interval seconds.
+    """
+    def __init__(self, url, ttl=300, stale_ttl=600, retry_interval=30, client=None):
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.retry_interval = retry_interval
+        self.client = client or get_provider_client('fitness')
+        self._fetch_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._index = None
+        self._fetched_at = 0.0
+        self._retry_at = 0.0
+        self._refreshing = False
+    
+    def fetch(self):
+        """
+        Fetch the roster and return it indexed by member id (as a string)
+        """
+        response = self.client.get(self.url)
+        if response.status_code != 200:
+            raise requests.exceptions.RequestException(f"API returned {response.status_code}")
+        
+        data = response.json()
+        members = data.get("body") if isinstance(data, dict) else None
+        if not isinstance(members, list):
+            raise ValueError("Unexpected fitness API response structure")
+        
+        return {str(member["memberid"]): member for member in members if member.get("memberid") is not None}
+    
+    def refresh(self):
+        """
+        Refetch the roster, keeping the current index if that fails; returns success
+        """
+        start = time.monotonic()
+        try:
+            index = self.fetch()
+        except Exception as e:
+            logger.error(f"Fitness roster error: {str(e)}")
+            fitness_roster_stats.incr('upstream_errors')
+            self._retry_at = time.monotonic() + self.retry_interval
+            return False
+        finally:
+            fitness_roster_stats.incr('upstream_calls')
+            fitness_roster_stats.incr('upstream_seconds', time.monotonic() - start)
+        
+        # Swapped in whole, so readers never see a half-built index
+        self._index = index
+        self._fetched_at = time.monotonic()
+        return True
+    
+    def _refresh_in_background(self):
+        try:
+            with self._fetch_lock:
+                self.refresh()
+        finally:
+            with self._state_lock:
+                self._refreshing = False
+    
+    def _expired(self):
+        return self._index is None or time.monotonic() - self._fetched_at >= self.ttl + self.stale_ttl
+    
+    def get_index(self):
+        """
+        Return the current {member id: member} index, fetching or refreshing it as needed
+        """
+        now = time.monotonic()
+        if now >= self._retry_at:
+            if self._expired():
+                with self._fetch_lock:
+                    # Another thread may have fetched it while we waited
+                    if self._expired() and time.monotonic() >= self._retry_at:
+                        self.refresh()
+            elif now - self._fetched_at >= self.ttl:
+                with self._state_lock:
+                    start_refresh = not self._refreshing
+                    self._refreshing = True
+                if start_refresh:
+                    threading.Thread(target=self._refresh_in_background, daemon=True,
+                                     name='fitness-roster-refresh').start()
+        
+        return self._index or {}
+    
+    def get(self, member_id):
+        """
+        Return the roster member with this id, or None
+        """
+        member = self.get_index().get(str(member_id))
+        fitness_roster_stats.incr('hits' if member is not None else 'misses')
+        return member
+    
+    def get_many(self, member_ids):
+        """
+        Return {member id: member or None} for many ids from a single index read
+        """
+        index = self.get_index()
+        members = {member_id: index.get(str(member_id)) for member_id in member_ids}
+        found = sum(member is not None for member in members.values())
+        fitness_roster_stats.incr('hits', found)
+        fitness_roster_stats.incr('misses', len(members) - found)
+        return members
+    
+    def clear(self):
+        self._index = None
+        self._fetched_at = 0.0
+        self._retry_at = 0.0
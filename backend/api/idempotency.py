@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .cache import TieredCache, CacheStats
+from .models import MealPlan, MealPlanJob
+from .services import normalize_location
+
+logger = logging.getLogger(__name__)
+
+# Profile fields that change the generated meal plan
+PROFILE_VERSION_FIELDS = ('age', 'gender', 'height', 'weight', 'activity_level',
+                          'dietary_preference', 'allergies', 'fitness_api_id')
+
+# Results of recent generate requests, by request fingerprint and Idempotency-Key
+generate_results = TieredCache('generate_result')
+generate_result_stats = CacheStats('generate_result')
+
+
+class IdempotencyKeyInUse(APIException):
+    """
+    The Idempotency-Key is claimed by a request that is still generating
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyReused(APIException):
+    """
+    The Idempotency-Key was already used for a request with a different body
+    """
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def get_profile_version(profile):
+    """
+    Short hash of the profile fields that affect meal planning
+    """
+    values = [getattr(profile, field) for field in PROFILE_VERSION_FIELDS]
+    return hashlib.sha256(json.dumps(values, default=str).encode()).hexdigest()[:16]
+
+
+def get_generate_request_keys(user, location, manual_fitness_data=None, idempotency_key=None):
+    """
+    Return the (cache key, timeout, request digest) tuples a generate request is
+    remembered under
+    
+    Every request has a fingerprint of the user, normalized location, manual
+    fitness data and profile version, remembered for MEAL_PLAN_GENERATE_WINDOW
+    seconds. A client supplied Idempotency-Key is checked first and remembered
+    for MEAL_PLAN_IDEMPOTENCY_KEY_TTL seconds, bound to a digest of the request
+    body (None for the fingerprint, which already covers it).
+    """
+    keys = []
+    if idempotency_key:
+        digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        body = json.dumps([normalize_location(location), manual_fitness_data or None], sort_keys=True, default=str)
+        keys.append((f"key:{user.id}:{digest}", settings.MEAL_PLAN_IDEMPOTENCY_KEY_TTL,
+                     hashlib.sha256(body.encode()).hexdigest()))
+    
+    try:
+        profile_version = get_profile_version(user.profile)
+    except ObjectDoesNotExist:
+        # No profile row: generation fails with its own error response
+        profile_version = None
+    
+    fingerprint = json.dumps([
+        normalize_location(location),
+        manual_fitness_data or None,
+        profile_version,
+    ], sort_keys=True, default=str)
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()
+    keys.append((f"request:{user.id}:{digest}", settings.MEAL_PLAN_GENERATE_WINDOW, None))
+    return keys
+
+
+def find_generate_result(user, request_keys):
+    """
+    Return the result of an earlier equivalent generate request, or None
+    
+    The result is {'meal_plan_id', 'warnings'} for a finished plan or
+    {'job': MealPlanJob} for a job that is still running. Plans that have since
+    been deleted and failed jobs don't count. Raises IdempotencyKeyReused if the
+    Idempotency-Key was used for a different body, and IdempotencyKeyInUse if
+    its first request is still generating.
+    """
+    for key, _, request in request_keys:
+        result = generate_results.get(key)
+        if result is None:
+            continue
+        
+        if request is not None:
+            if result.get('request', request) != request:
+                raise IdempotencyKeyReused()
+            if result.get('pending'):
+                raise IdempotencyKeyInUse()
+        
+        if 'job_id' in result:
+            job = MealPlanJob.objects.filter(id=result['job_id'], user=user).first()
+            if job is not None and job.status == 'pending':
+                generate_result_stats.incr('hits')
+                return {'job': job}
+            if job is None or job.status == 'failed':
+                result = {}
+            else:
+                result = {'meal_plan_id': job.meal_plan_id, 'warnings': job.warnings}
+        
+        if result.get('meal_plan_id') and MealPlan.objects.filter(id=result['meal_plan_id'], user=user).exists():
+            generate_result_stats.incr('hits')
+            return {'meal_plan_id': result['meal_plan_id'], 'warnings': result['warnings']}
+        
+        if request is not None:
+            # Nothing to replay, so the key can be claimed again
+            generate_results.delete(key)
+    
+    generate_result_stats.incr('misses')
+    return None
+
+
+def reserve_generate_request(request_keys):
+    """
+    Claim a generate request's Idempotency-Key before generating, so a
+    concurrent retry with the same key can't generate a second plan
+    
+    Call once find_generate_result() found nothing to replay. Raises
+    IdempotencyKeyInUse if another request claimed the key first.
+    """
+    for key, _, request in request_keys:
+        if request is None:
+            continue
+        if not generate_results.add(key, {'pending': True, 'request': request},
+                                    settings.MEAL_PLAN_IDEMPOTENCY_LOCK_TTL):
+            raise IdempotencyKeyInUse()
+
+
+def release_generate_request(request_keys):
+    """
+    Give up the Idempotency-Key claim of a request that failed, so it can be retried
+    """
+    for key, _, request in request_keys:
+        if request is not None:
+            generate_results.delete(key)
+
+
+def remember_generate_result(request_keys, meal_plan_id=None, warnings=None, job_id=None):
+    """
+    Remember a generate request's meal plan (or queued job) under all its keys
+    """
+    if job_id is not None:
+        result = {'job_id': str(job_id)}
+    else:
+        result = {'meal_plan_id': meal_plan_id, 'warnings': warnings or []}
+    
+    for key, timeout, request in request_keys:
+        generate_results.set(key, dict(result, request=request) if request else result, timeout)
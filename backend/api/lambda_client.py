@@ -0,0 +1,126 @@
+import importlib
+import json
+import sys
+import threading
+import logging
+import boto3
+import httpx
+from asgiref.sync import sync_to_async
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.config import Config
+from django.conf import settings
+from .providers import get_async_provider_client
+
+logger = logging.getLogger(__name__)
+
+_lambda_client = None
+_lambda_client_lock = threading.Lock()
+_local_module = None
+_local_module_lock = threading.Lock()
+_credentials = None
+
+
+def get_lambda_client():
+    """
+    Return the process-wide boto3 Lambda client
+    
+    boto3 clients are thread-safe once built, but building one (credential and
+    endpoint resolution) is slow and not thread-safe, so it happens once under a lock.
+    """
+    global _lambda_client
+    if _lambda_client is None:
+        with _lambda_client_lock:
+            if _lambda_client is None:
+                _lambda_client = boto3.client('lambda', region_name=settings.AWS_REGION, config=Config(
+                    max_pool_connections=settings.AWS_LAMBDA_MAX_POOL_CONNECTIONS,
+                    connect_timeout=settings.AWS_LAMBDA_CONNECT_TIMEOUT,
+                    read_timeout=settings.AWS_LAMBDA_READ_TIMEOUT,
+                    retries={'max_attempts': settings.AWS_LAMBDA_MAX_ATTEMPTS, 'mode': 'standard'},
+                ))
+    return _lambda_client
+
+
+def load_meal_planner_module():
+    """
+    Import lambda/meal_planner/lambda_function.py for in-process execution
+    """
+    global _local_module
+    if _local_module is None:
+        with _local_module_lock:
+            if _local_module is None:
+                path = str(settings.MEAL_PLANNER_LOCAL_PATH)
+                if path not in sys.path:
+                    sys.path.insert(0, path)
+                _local_module = importlib.import_module('lambda_function')
+    return _local_module
+
+
+def invoke_meal_planner(payload):
+    """
+    Run the meal planner for a payload and return its decoded result
+    
+    With MEAL_PLANNER_MODE = 'local' the handler is called directly in this
+    process, otherwise the AWS Lambda function is invoked (RequestResponse).
+    """
+    if settings.MEAL_PLANNER_MODE == 'local':
+        # Round-trip through JSON so the handler sees exactly what Lambda would
+        return load_meal_planner_module().lambda_handler(json.loads(json.dumps(payload)), None)
+    
+    response = get_lambda_client().invoke(
+        FunctionName=settings.AWS_LAMBDA_FUNCTION_NAME,
+        InvocationType='RequestResponse',
+        Payload=json.dumps(payload)
+    )
+    result = json.loads(response['Payload'].read().decode())
+    
+    if response.get('FunctionError'):
+        raise RuntimeError(f"Lambda function error: {result}")
+    return result
+
+
+def get_aws_credentials():
+    """
+    Return the process-wide (auto-refreshing) AWS credentials used to sign async invokes
+    """
+    global _credentials
+    if _credentials is None:
+        with _lambda_client_lock:
+            if _credentials is None:
+                _credentials = boto3.Session().get_credentials()
+    return _credentials
+
+
+def sign_lambda_invoke(body):
+    """
+    Return the URL and SigV4-signed headers for a RequestResponse Invoke call
+    """
+    url = (f"https://lambda.{settings.AWS_REGION}.amazonaws.com/2015-03-31/functions/"
+           f"{settings.AWS_LAMBDA_FUNCTION_NAME}/invocations")
+    request = AWSRequest(method='POST', url=url, data=body, headers={'Content-Type': 'application/json'})
+    SigV4Auth(get_aws_credentials().get_frozen_credentials(), 'lambda', settings.AWS_REGION).add_auth(request)
+    return url, dict(request.headers.items())
+
+
+async def ainvoke_meal_planner(payload):
+    """
+    asyncio version of invoke_meal_planner
+    
+    In 'lambda' mode the Invoke API is called over a pooled httpx connection
+    (signed with botocore), so the event loop is free while the function runs.
+    Local mode runs the handler in a worker thread.
+    """
+    if settings.MEAL_PLANNER_MODE == 'local':
+        return await sync_to_async(invoke_meal_planner, thread_sensitive=False)(payload)
+    
+    body = json.dumps(payload)
+    url, headers = sign_lambda_invoke(body)
+    response = await get_async_provider_client('lambda').request(
+        'POST', url, content=body, headers=headers,
+        timeout=httpx.Timeout(settings.AWS_LAMBDA_READ_TIMEOUT, connect=settings.AWS_LAMBDA_CONNECT_TIMEOUT)
+    )
+    result = response.json()
+    
+    if response.status_code != 200 or response.headers.get('X-Amz-Function-Error'):
+        raise RuntimeError(f"Lambda function error: {result}")
+    return result
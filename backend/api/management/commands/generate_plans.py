@@ -0,0 +1,168 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api import services
+from api.models import MealPlan
+
+
+def generate_chunk(entries):
+    """
+    Generate meal plans for (user_profile, weather_data, fitness_data) entries;
+    runs in a pool worker
+    """
+    return services.generate_meal_plans_bulk(entries)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate today's meal plan for many users: users are streamed in chunks, "
+        "weather and fitness are looked up once per distinct location / fitness id, "
+        "plans are generated across a process pool and written with bulk inserts. "
+        "Progress is checkpointed so an interrupted run can be resumed with --resume."
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', help='Comma-separated user ids (default: all active users)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Generation processes (0 generates in this process)')
+        parser.add_argument('--chunk-size', type=int, default=settings.MEAL_PLANNER_BATCH_SIZE,
+                            help='Users per chunk')
+        parser.add_argument('--location', help='Location for users without one in their profile')
+        parser.add_argument('--checkpoint', default=str(settings.BASE_DIR / 'generate_plans.checkpoint'),
+                            help='Progress file used to resume an interrupted run')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue after the last user recorded in the checkpoint')
+    
+    def get_users(self, options, checkpoint):
+        # Users who already got a plan during this run are skipped, including any
+        # saved after the last checkpoint was written
+        generated = MealPlan.objects.filter(created_at__gte=checkpoint['started_at']).values('user_id')
+        # Users without a profile row (e.g. created before profiles existed) can't be planned for
+        users = (User.objects.filter(is_active=True, id__gt=checkpoint['last_user_id'], profile__isnull=False)
+                 .exclude(id__in=generated).select_related('profile').order_by('id'))
+        if options['users']:
+            try:
+                user_ids = [int(user_id) for user_id in options['users'].split(',') if user_id.strip()]
+            except ValueError:
+                raise CommandError('--users must be a comma-separated list of user ids')
+            users = users.filter(id__in=user_ids)
+        if not options['location']:
+            users = users.exclude(profile__location='')
+        return users
+    
+    def iter_chunks(self, users, options):
+        """
+        Yield lists of (user, location) from the streamed users, chunk_size at a time
+        """
+        chunk = []
+        for user in users.iterator(chunk_size=options['chunk_size']):
+            chunk.append((user, user.profile.location or options['location']))
+            if len(chunk) == options['chunk_size']:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    def get_entries(self, chunk):
+        """
+        Look up the generation context of a chunk of (user, location) pairs
+        """
+        weather = services.get_weather_data_bulk(location for _, location in chunk)
+        fitness = services.get_fitness_data_bulk(user.profile.fitness_api_id for user, _ in chunk)
+        return [(user.profile, weather[location], fitness[user.profile.fitness_api_id]) for user, location in chunk]
+    
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            raise CommandError(f'Checkpoint {path} is corrupt; delete it to start over')
+    
+    def write_checkpoint(self, path, checkpoint):
+        # Written to a temporary file and renamed, so an interruption can't leave half a checkpoint
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(f'{path}.tmp', path)
+    
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        
+        path = options['checkpoint']
+        checkpoint = self.read_checkpoint(path)
+        if checkpoint is not None and not options['resume']:
+            raise CommandError(f'Checkpoint {path} exists from an interrupted run; '
+                               f'pass --resume to continue it or delete it to start over')
+        if checkpoint is None:
+            checkpoint = {'started_at': timezone.now().isoformat(), 'last_user_id': 0, 'plans': 0}
+        else:
+            self.stdout.write(f"Resuming after user {checkpoint['last_user_id']} "
+                              f"({checkpoint['plans']} plans already generated)")
+        
+        users = self.get_users(options, checkpoint)
+        start = time.monotonic()
+        plans = 0
+        
+        if options['workers'] > 0:
+            # Workers are spawned rather than forked, so they inherit neither this
+            # process's database connections nor its threads; they only generate,
+            # every query stays here
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup,
+                                           mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = None
+        
+        try:
+            pending = []
+            for chunk in self.iter_chunks(users, options):
+                entries = self.get_entries(chunk)
+                if executor is None:
+                    pending.append((chunk, entries, None))
+                else:
+                    pending.append((chunk, entries, executor.submit(generate_chunk, entries)))
+                
+                # Keep the pool busy while bounding how many chunks are held in memory
+                while pending and (executor is None or len(pending) > options['workers']):
+                    plans += self.save_chunk(*pending.pop(0), checkpoint, path, start, plans)
+            
+            while pending:
+                plans += self.save_chunk(*pending.pop(0), checkpoint, path, start, plans)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        
+        if os.path.exists(path):
+            os.remove(path)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {plans} meal plans in {elapsed:.1f}s ({plans / elapsed if elapsed else 0:.1f} plans/s)"
+        ))
+    
+    def save_chunk(self, chunk, entries, future, checkpoint, path, start, plans):
+        """
+        Bulk write a generated chunk and record it in the checkpoint; returns its plan count
+        """
+        meal_plan_data = future.result() if future is not None else generate_chunk(entries)
+        services.save_meal_plans([
+            (user, location, weather_data, fitness_data, data)
+            for (user, location), (_, weather_data, fitness_data), data in zip(chunk, entries, meal_plan_data)
+        ])
+        
+        checkpoint['last_user_id'] = chunk[-1][0].id
+        checkpoint['plans'] += len(chunk)
+        self.write_checkpoint(path, checkpoint)
+        
+        plans += len(chunk)
+        elapsed = time.monotonic() - start
+        self.stdout.write(f"{plans} plans, up to user {checkpoint['last_user_id']} "
+                          f"({plans / elapsed if elapsed else 0:.1f} plans/s)")
+        return len(chunk)
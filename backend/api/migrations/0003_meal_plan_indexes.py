@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_mealplanjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['meal_plan', 'meal_type'], name='meal_plan_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealplan',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='mealplan_user_created_idx'),
+        ),
+    ]
@@ -1,5 +1,9 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .plan_cache import invalidate_meal_plan, invalidate_latest_meal_plan
 
 class MealPlan(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meal_plans')
@@ -10,6 +14,12 @@ class MealPlan(models.Model):
     calories_burned = models.IntegerField()
     steps = models.IntegerField()
     
+    class Meta:
+        indexes = [
+            # Per-user history, newest first (list, latest and cursor pagination)
+            models.Index(fields=['user', '-created_at', '-id'], name='mealplan_user_created_idx'),
+        ]
+    
     def __str__(self):
         return f"Meal Plan for {self.user.username} on {self.created_at.strftime('%Y-%m-%d')}"
 
@@ -32,5 +42,39 @@ class Meal(models.Model):
     ingredients = models.TextField()
     preparation = models.TextField()
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['meal_plan', 'meal_type'], name='meal_plan_type_idx'),
+        ]
+    
     def __str__(self):
-        return f"{self.meal_type} - {self.name}"
\ No newline at end of file
+        return f"{self.meal_type} - {self.name}"
+
+class MealPlanJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed')
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meal_plan_jobs')
+    location = models.CharField(max_length=100)
+    manual_fitness_data = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    warnings = models.JSONField(default=list, blank=True)
+    meal_plan = models.ForeignKey(MealPlan, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Meal plan job {self.id} for {self.user.username} ({self.status})"
+
+@receiver([post_save, post_delete], sender=MealPlan)
+def invalidate_cached_meal_plan(sender, instance, **kwargs):
+    invalidate_meal_plan(instance.id)
+    invalidate_latest_meal_plan(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Meal)
+def invalidate_cached_meal(sender, instance, **kwargs):
+    invalidate_meal_plan(instance.meal_plan_id)
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MealPlanCursorPagination(CursorPagination):
+    """
+    Cursor pagination over a user's meal plans, newest first
+    
+    Cursors stay stable while new plans are generated and, unlike page numbers,
+    don't need a COUNT or OFFSET scan over the user's whole history.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .cache import TieredCache, CacheStats
+
+# Serialized meal plans by id, and each user's latest meal plan id
+meal_plan_cache = TieredCache('meal_plan', maxsize=settings.MEAL_PLAN_CACHE_MAX_ENTRIES)
+meal_plan_cache_stats = CacheStats('meal_plan')
+
+# Cached in place of a latest meal plan id for users without any plans
+NO_MEAL_PLAN = 0
+
+
+def make_cache_entry(data):
+    """
+    Wrap a serialized meal plan with its ETag
+    """
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return {
+        'data': json.loads(body),
+        'etag': f'"{hashlib.sha256(body.encode()).hexdigest()[:32]}"',
+    }
+
+
+def get_meal_plan_entry(meal_plan_id, load=None):
+    """
+    Return the cache entry for a meal plan, calling load() to build it on a miss
+    
+    load() returns the serialized plan, or None if the plan doesn't exist
+    (which isn't cached). Without load a miss returns None.
+    """
+    entry = meal_plan_cache.get(f"plan:{meal_plan_id}")
+    if entry is not None:
+        meal_plan_cache_stats.incr('hits')
+        return entry
+    if load is None:
+        return None
+    
+    meal_plan_cache_stats.incr('misses')
+    loaded = load()
+    if loaded is None:
+        return None
+    
+    return set_meal_plan_entry(meal_plan_id, loaded)
+
+
+def set_meal_plan_entry(meal_plan_id, data):
+    entry = make_cache_entry(data)
+    meal_plan_cache.set(f"plan:{meal_plan_id}", entry, settings.MEAL_PLAN_CACHE_TTL)
+    return entry
+
+
+def get_latest_meal_plan_id(user_id):
+    """
+    Return the cached id of a user's latest meal plan, NO_MEAL_PLAN if they
+    have none, or None if it isn't cached
+    """
+    return meal_plan_cache.get(f"latest:{user_id}")
+
+
+def set_latest_meal_plan_id(user_id, meal_plan_id):
+    meal_plan_cache.set(f"latest:{user_id}", meal_plan_id or NO_MEAL_PLAN, settings.MEAL_PLAN_CACHE_TTL)
+
+
+def add_latest_meal_plan_id(user_id, meal_plan_id):
+    """
+    Cache a latest meal plan id read from the database unless one is cached already
+    
+    A save that committed after the read stores its newer id, which the reader
+    must not overwrite.
+    """
+    meal_plan_cache.add(f"latest:{user_id}", meal_plan_id or NO_MEAL_PLAN, settings.MEAL_PLAN_CACHE_TTL)
+
+
+def invalidate_meal_plan(meal_plan_id):
+    meal_plan_cache.delete(f"plan:{meal_plan_id}")
+
+
+def invalidate_latest_meal_plan(user_id):
+    meal_plan_cache.delete(f"latest:{user_id}")
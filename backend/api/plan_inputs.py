@@ -0,0 +1,58 @@
+"""
+The meal planner's inputs (calorie target, protein ratio, weather meal style),
+computed in the backend for memoizing generated plans
+
+The backend is deployed on its own (Elastic Beanstalk), without the Lambda
+source, so these mirror get_plan_inputs() in lambda/meal_planner/lambda_function.py
+operation by operation. Change both together; the tests compare them.
+"""
+
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+    'very_active': 1.9
+}
+
+
+def get_base_calorie_needs(user_data):
+    # Harris-Benedict equation
+    age = user_data.get('age', 30)
+    gender = user_data.get('gender', 'male')
+    weight = user_data.get('weight', 70)
+    height = user_data.get('height', 170)
+    
+    if gender == 'male':
+        return 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
+    return 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+
+
+def get_weather_meal_style(weather_data):
+    """
+    'comfort' for the rainy/snowy day meals the planner prefers, otherwise 'regular'
+    """
+    condition = weather_data.get('weather_condition', 'Clear').lower()
+    return 'comfort' if 'rain' in condition or 'snow' in condition else 'regular'
+
+
+def get_plan_inputs(user_data, weather_data, fitness_data):
+    """
+    Return the calorie target, protein ratio and weather meal style for a user
+    """
+    calories = get_base_calorie_needs(user_data) * ACTIVITY_MULTIPLIERS.get(
+        user_data.get('activity_level', 'moderate'), 1.55)
+    
+    temperature = weather_data.get('temperature', 20)
+    if temperature < 10:
+        calories *= 1.05
+    elif temperature > 30:
+        calories *= 0.95
+    
+    if fitness_data.get('steps', 0) > 10000 or fitness_data.get('calories_burned', 0) > 500:
+        calories += 300
+        protein_ratio = 0.3
+    else:
+        protein_ratio = 0.25
+    
+    return calories, protein_ratio, get_weather_meal_style(weather_data)
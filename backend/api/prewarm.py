@@ -0,0 +1,148 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import repeat
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from users.models import UserProfile
+from . import services
+from .models import MealPlan
+from .providers import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+def get_profile_locations():
+    """
+    Return {normalized location: location} for every distinct profile location
+    """
+    locations = {}
+    profile_locations = UserProfile.objects.exclude(location='').values_list('location', flat=True).distinct()
+    for location in profile_locations.iterator():
+        locations.setdefault(services.normalize_location(location), location)
+    return locations
+
+
+def weather_needs_refresh(key, min_ttl):
+    """
+    True if the cached weather for a location key is missing, failed, or fresh
+    for less than min_ttl more seconds
+    """
+    entry = services.weather_cache.get(key)
+    if entry is None or entry['failed']:
+        return True
+    return time.time() - entry['fetched_at'] > settings.WEATHER_CACHE_TTL - min_ttl
+
+
+def get_prewarm_rate_limiter():
+    """
+    RateLimiter for PREWARM_WEATHER_BUDGET_SHARE of the weather API budget, or
+    None if the weather API has no budget
+    
+    Prewarm calls take from this and from the shared budget, so users always
+    have the rest of each window. Both budgets have the same window length.
+    """
+    rate, burst = settings.PROVIDER_RATE_LIMITS.get('weather', (0, None))
+    if not rate:
+        return None
+    share = settings.PREWARM_WEATHER_BUDGET_SHARE
+    burst = burst or max(1, int(rate))
+    return RateLimiter('weather_prewarm', rate * share, max(1, int(burst * share)))
+
+
+def refresh_weather(location, key, limiter=None):
+    """
+    Fetch and cache the weather for a location; a failure leaves the cached entry as it is
+    
+    Returns True on success, False on failure and None if the prewarm share of
+    the budget is used up (the location is left for the next run).
+    """
+    if limiter is not None and not limiter.acquire():
+        return None
+    try:
+        services._cache_weather(key, services.fetch_weather_data(location))
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Weather prewarm for '{key}' failed: {str(e)}")
+        services.weather_cache_stats.incr('upstream_errors')
+        return False
+
+
+def prewarm_weather(concurrency=None, min_ttl=None):
+    """
+    Refresh the cached weather of every profile location that is missing or
+    about to expire, at most `concurrency` fetches at a time
+    
+    Returns counts of locations, refreshed, failed, skipped (still fresh) and
+    deferred (over the prewarm share of the weather API budget).
+    """
+    concurrency = concurrency or settings.PREWARM_CONCURRENCY
+    min_ttl = settings.PREWARM_WEATHER_MIN_TTL if min_ttl is None else min_ttl
+    
+    locations = get_profile_locations()
+    stale = {key: location for key, location in locations.items() if weather_needs_refresh(key, min_ttl)}
+    limiter = get_prewarm_rate_limiter()
+    
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='prewarm-weather') as executor:
+        results = list(executor.map(refresh_weather, stale.values(), stale.keys(), repeat(limiter)))
+    
+    summary = {
+        'locations': len(locations),
+        'refreshed': results.count(True),
+        'failed': results.count(False),
+        'skipped': len(locations) - len(stale),
+        'deferred': results.count(None),
+    }
+    logger.info(f"Weather prewarm: {summary}")
+    return summary
+
+
+def get_active_users():
+    """
+    Users with a profile location who generated a meal plan in the last PREWARM_ACTIVE_DAYS days
+    """
+    since = timezone.now() - timedelta(days=settings.PREWARM_ACTIVE_DAYS)
+    user_ids = (MealPlan.objects.filter(created_at__gte=since)
+                .values_list('user_id', flat=True).distinct())
+    return (User.objects.filter(id__in=user_ids, is_active=True, profile__isnull=False)
+            .exclude(profile__location='').select_related('profile').order_by('id'))
+
+
+def prewarm_meal_plan_chunk(profiles):
+    # Weather was just prewarmed, so these are mostly cache hits
+    weather = services.get_weather_data_bulk(profile.location for profile in profiles)
+    fitness = services.get_fitness_data_bulk(profile.fitness_api_id for profile in profiles)
+    
+    # Plans already memoized today are skipped; the rest go to the meal planner in batches
+    services.generate_meal_plans_bulk([
+        (profile, weather[profile.location], fitness[profile.fitness_api_id]) for profile in profiles
+    ])
+
+
+def prewarm_meal_plans(chunk_size=None):
+    """
+    Memoize today's meal plan for recently active users, so their first
+    generate of the day doesn't wait on the meal planner
+    
+    Users are processed chunk_size at a time. Returns the number of users.
+    """
+    chunk_size = chunk_size or settings.MEAL_PLANNER_BATCH_SIZE
+    users = 0
+    
+    chunk = []
+    for user in get_active_users().iterator(chunk_size=chunk_size):
+        chunk.append(user.profile)
+        if len(chunk) == chunk_size:
+            prewarm_meal_plan_chunk(chunk)
+            users += len(chunk)
+            chunk = []
+    if chunk:
+        prewarm_meal_plan_chunk(chunk)
+        users += len(chunk)
+    
+    summary = {'users': users}
+    logger.info(f"Meal plan prewarm: {summary}")
+    return summary
@@ -0,0 +1,429 @@
+import asyncio
+import math
+import random
+import threading
+import time
+import logging
+import weakref
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import caches
+from .cache import CacheStats
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying - the upstream may recover on the next attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    Raised instead of calling a provider whose circuit breaker is open
+    """
+
+
+class RateLimitedError(requests.exceptions.RequestException):
+    """
+    Raised instead of calling a provider whose request budget is used up
+    """
+
+
+class RateLimitStats(CacheStats):
+    """
+    Counters for a RateLimiter, reported with the current window's budget use
+    """
+    def __init__(self, limiter):
+        super().__init__(f'{limiter.name}_rate_limit')
+        self.limiter = limiter
+    
+    def snapshot(self):
+        counters = super().snapshot()
+        counters.pop('hit_rate')
+        counters.update(self.limiter.usage())
+        return counters
+
+
+class RateLimiter:
+    """
+    Request budget for a provider, shared by all workers through a Django cache
+    
+    A token bucket holding `burst` calls and refilled at `rate` calls per second,
+    refilled in one go every burst / rate seconds: each window draws from one
+    counter with an atomic cache.incr, so workers don't need compare-and-set.
+    acquire() waits (queues) up to max_wait seconds for the next window, after
+    which the call is shed. If the cache is unavailable each process counts on
+    its own.
+    """
+    def __init__(self, name, rate, burst=None, alias='default', max_wait=0.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.alias = alias
+        self.max_wait = max_wait
+        self.window = self.burst / rate
+        self.stats = RateLimitStats(self)
+        self._lock = threading.Lock()
+        self._local = {}
+    
+    def _current_window(self):
+        window, into = divmod(time.time(), self.window)
+        return int(window), self.window - into
+    
+    def _count(self, window):
+        key = f"ratelimit:{self.name}:{window}"
+        try:
+            cache = caches[self.alias]
+            cache.add(key, 0, math.ceil(self.window) + 1)
+            return cache.incr(key)
+        except Exception as e:
+            logger.warning(f"Shared rate limit unavailable, counting locally: {str(e)}")
+            with self._lock:
+                self._local = {window: self._local.get(window, 0) + 1}
+                return self._local[window]
+    
+    def try_acquire(self):
+        """
+        Take one call from the budget; returns (allowed, seconds until the budget refills)
+        """
+        window, remaining = self._current_window()
+        return self._count(window) <= self.burst, remaining
+    
+    def acquire(self):
+        """
+        Take one call from the budget, waiting up to max_wait seconds; returns success
+        """
+        deadline = time.monotonic() + self.max_wait
+        queued = False
+        while True:
+            allowed, retry_in = self.try_acquire()
+            if allowed:
+                self.stats.incr('queued' if queued else 'allowed')
+                return True
+            if time.monotonic() + retry_in > deadline:
+                self.stats.incr('shed')
+                return False
+            queued = True
+            time.sleep(retry_in)
+    
+    async def aacquire(self):
+        """
+        asyncio version of acquire()
+        """
+        deadline = time.monotonic() + self.max_wait
+        queued = False
+        while True:
+            # The shared counter is a blocking cache call, so keep it off the event loop
+            allowed, retry_in = await sync_to_async(self.try_acquire, thread_sensitive=False)()
+            if allowed:
+                self.stats.incr('queued' if queued else 'allowed')
+                return True
+            if time.monotonic() + retry_in > deadline:
+                self.stats.incr('shed')
+                return False
+            queued = True
+            await asyncio.sleep(retry_in)
+    
+    def usage(self):
+        """
+        Budget used in the current window
+        """
+        window, _ = self._current_window()
+        try:
+            used = caches[self.alias].get(f"ratelimit:{self.name}:{window}", 0)
+        except Exception:
+            used = self._local.get(window, 0)
+        used = min(used, self.burst)
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'window_used': used,
+            'utilization': round(used / self.burst, 4),
+        }
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+    
+    After failure_threshold failures in a row the circuit opens and calls are
+    rejected for reset_timeout seconds. The next call after that is let through
+    as a trial (half-open); success closes the circuit, failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+    
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+    
+    def allow_request(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let a single trial request through
+                self._state = self.HALF_OPEN
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+    
+    def release_trial(self):
+        """
+        Give back a half-open trial that ended without reaching the provider, so
+        the next call can make the trial instead
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ProviderClient:
+    """
+    HTTP client for one upstream provider
+    
+    Wraps a pooled keep-alive requests.Session with connect/read timeouts,
+    bounded retries with jittered exponential backoff, a circuit breaker and
+    an optional RateLimiter that every attempt draws from.
+    """
+    def __init__(self, name, pool_maxsize=10, connect_timeout=3.05, read_timeout=5.0,
+                 max_retries=2, backoff_base=0.2, backoff_max=2.0,
+                 failure_threshold=5, reset_timeout=30.0, rate_limiter=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.rate_limiter = rate_limiter
+        self.session = self.create_session(pool_maxsize)
+    
+    def create_session(self, pool_maxsize):
+        # One connection pool per host, each keeping up to pool_maxsize connections alive
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    def backoff(self, attempt):
+        # "Full jitter" so retries from many workers don't line up
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def get(self, url, **kwargs):
+        """
+        GET url, retrying connection errors, timeouts and retryable status codes
+        
+        Raises CircuitOpenError without calling the provider if its circuit is open,
+        and RateLimitedError if its request budget is used up. Any other response
+        is returned as-is for the caller to inspect.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} provider circuit is open")
+        
+        try:
+            return self._get(url, **kwargs)
+        except BaseException:
+            # Shed by the rate limiter (which says nothing about the provider's
+            # health) or interrupted: a half-open trial that wasn't settled must be
+            # handed back, or the breaker would stay half-open for good
+            self.breaker.release_trial()
+            raise
+    
+    def _get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        response = None
+        error = None
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff(attempt - 1))
+            if self.rate_limiter is not None and not self.rate_limiter.acquire():
+                raise RateLimitedError(f"{self.name} provider request budget exhausted")
+            
+            try:
+                response = self.session.get(url, **kwargs)
+                error = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                logger.warning(f"{self.name} provider request failed (attempt {attempt + 1}): {str(e)}")
+                response, error = None, e
+                continue
+            except requests.exceptions.RequestException as e:
+                # e.g. a broken chunked body or too many redirects: not worth retrying,
+                # but still a provider failure
+                logger.warning(f"{self.name} provider request failed: {str(e)}")
+                self.breaker.record_failure()
+                raise
+            
+            if response.status_code not in RETRY_STATUS_CODES:
+                self.breaker.record_success()
+                return response
+            
+            logger.warning(f"{self.name} provider returned {response.status_code} (attempt {attempt + 1})")
+            if response.status_code == 429 and self.rate_limiter is not None:
+                self.rate_limiter.stats.incr('throttled')
+        
+        self.breaker.record_failure()
+        if error is not None:
+            raise error
+        return response
+
+
+class AsyncProviderClient(ProviderClient):
+    """
+    asyncio version of ProviderClient on a pooled httpx.AsyncClient
+    
+    Waiting on the provider doesn't hold a thread, so one process can have many
+    requests in flight. Transport errors are raised as the equivalent
+    requests exceptions, so callers handle both clients the same way.
+    """
+    def create_session(self, pool_maxsize):
+        connect_timeout, read_timeout = self.timeout
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+        )
+    
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request, retrying connection errors, timeouts and retryable status codes
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} provider circuit is open")
+        
+        try:
+            return await self._request(method, url, **kwargs)
+        except BaseException:
+            # Shed by the rate limiter or cancelled (e.g. by a context provider
+            # timeout) before the provider answered: a half-open trial must be
+            # handed back, or the shared breaker would stay half-open for good
+            self.breaker.release_trial()
+            raise
+    
+    async def _request(self, method, url, **kwargs):
+        response = None
+        error = None
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff(attempt - 1))
+            if self.rate_limiter is not None and not await self.rate_limiter.aacquire():
+                raise RateLimitedError(f"{self.name} provider request budget exhausted")
+            
+            try:
+                response = await self.session.request(method, url, **kwargs)
+                error = None
+            except httpx.TimeoutException as e:
+                logger.warning(f"{self.name} provider request timed out (attempt {attempt + 1}): {str(e)}")
+                response, error = None, requests.exceptions.Timeout(str(e))
+                continue
+            except httpx.TransportError as e:
+                logger.warning(f"{self.name} provider request failed (attempt {attempt + 1}): {str(e)}")
+                response, error = None, requests.exceptions.ConnectionError(str(e))
+                continue
+            except httpx.HTTPError as e:
+                logger.warning(f"{self.name} provider request failed: {str(e)}")
+                self.breaker.record_failure()
+                raise requests.exceptions.RequestException(str(e)) from e
+            
+            if response.status_code not in RETRY_STATUS_CODES:
+                self.breaker.record_success()
+                return response
+            
+            logger.warning(f"{self.name} provider returned {response.status_code} (attempt {attempt + 1})")
+            if response.status_code == 429 and self.rate_limiter is not None:
+                self.rate_limiter.stats.incr('throttled')
+        
+        self.breaker.record_failure()
+        if error is not None:
+            raise error
+        return response
+    
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+# httpx connections belong to the event loop that opened them, so async clients are per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def create_rate_limiter(name):
+    """
+    Return a RateLimiter for a provider from PROVIDER_RATE_LIMITS, or None if it has no budget
+    """
+    rate, burst = settings.PROVIDER_RATE_LIMITS.get(name, (0, None))
+    if not rate:
+        return None
+    return RateLimiter(name, rate, burst, max_wait=settings.PROVIDER_RATE_LIMIT_MAX_WAIT)
+
+
+def create_provider_client(name, client_class=ProviderClient):
+    return client_class(
+        name,
+        pool_maxsize=settings.PROVIDER_POOL_MAXSIZE,
+        connect_timeout=settings.PROVIDER_CONNECT_TIMEOUT,
+        read_timeout=settings.PROVIDER_READ_TIMEOUT,
+        max_retries=settings.PROVIDER_MAX_RETRIES,
+        backoff_base=settings.PROVIDER_BACKOFF_BASE,
+        backoff_max=settings.PROVIDER_BACKOFF_MAX,
+        failure_threshold=settings.PROVIDER_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.PROVIDER_BREAKER_RESET_TIMEOUT,
+        rate_limiter=create_rate_limiter(name) if client_class is ProviderClient else None,
+    )
+
+
+def get_provider_client(name):
+    """
+    Return the process-wide ProviderClient for a provider, creating it on first use
+    """
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = create_provider_client(name)
+            _clients[name] = client
+        return client
+
+
+def get_async_provider_client(name):
+    """
+    Return the AsyncProviderClient for a provider on the running event loop
+    
+    Clients live as long as their loop, so this is meant for long-lived loops
+    (an ASGI worker's); a loop per request would get a new pool every time.
+    
+    It shares the circuit breaker and rate limiter of the provider's sync client,
+    so both see the same provider health and budget.
+    """
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(name)
+    if client is None:
+        client = create_provider_client(name, AsyncProviderClient)
+        client.breaker = get_provider_client(name).breaker
+        client.rate_limiter = get_provider_client(name).rate_limiter
+        clients[name] = client
+    return client
@@ -1,20 +1,49 @@
 from rest_framework import serializers
-from .models import MealPlan, Meal
+from .models import MealPlan, Meal, MealPlanJob
 
-class MealSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that takes an optional `fields` argument limiting which
+    fields are rendered (unknown names are ignored)
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+class MealSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Meal
         fields = ['id', 'meal_type', 'name', 'description', 'calories', 
                  'protein', 'carbs', 'fat', 'ingredients', 'preparation']
         read_only_fields = ['id']
 
-class MealPlanSerializer(serializers.ModelSerializer):
+class MealPlanSerializer(DynamicFieldsModelSerializer):
     meals = MealSerializer(many=True, read_only=True)
     username = serializers.ReadOnlyField(source='user.username')
     
+    def __init__(self, *args, **kwargs):
+        meal_fields = kwargs.pop('meal_fields', None)
+        super().__init__(*args, **kwargs)
+        
+        if meal_fields is not None and 'meals' in self.fields:
+            self.fields['meals'] = MealSerializer(many=True, read_only=True, fields=meal_fields)
+    
     class Meta:
         model = MealPlan
         fields = ['id', 'user', 'username', 'created_at', 'location', 
                  'temperature', 'weather_condition', 'calories_burned', 
                  'steps', 'meals']
-        read_only_fields = ['id', 'user', 'username', 'created_at']
\ No newline at end of file
+        read_only_fields = ['id', 'user', 'username', 'created_at']
+
+class MealPlanJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    meal_plan_id = serializers.PrimaryKeyRelatedField(source='meal_plan', read_only=True)
+    
+    class Meta:
+        model = MealPlanJob
+        fields = ['job_id', 'status', 'warnings', 'meal_plan_id', 'created_at', 'updated_at']
+        read_only_fields = fields
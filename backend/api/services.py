@@ -1,181 +1,242 @@
-import requests
+import copy
+import hashlib
 import json
-import boto3
+import requests
+import time
+import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from botocore.exceptions import ClientError
+from .cache import TieredCache, CacheStats, SingleFlight
+from .providers import get_provider_client, RateLimitedError
+from .fitness_roster import FitnessRoster, member_to_fitness_data
+from .lambda_client import invoke_meal_planner
+from .plan_inputs import get_plan_inputs
+from .models import MealPlan, Meal
+from .plan_cache import invalidate_latest_meal_plan, set_latest_meal_plan_id
 
 logger = logging.getLogger(__name__)
 
-def get_weather_data(location):
+# Default values used if an upstream API fails
+DEFAULT_WEATHER_DATA = {
+    'temperature': 20.0,
+    'weather_condition': 'Unknown',
+    'humidity': 50
+}
+
+DEFAULT_FITNESS_DATA = {
+    'calories_burned': 2000,
+    'steps': 5000,
+    'active_minutes': 30,
+    'using_default': True  # Flag to indicate default values are being used
+}
+
+# Timeout budget (seconds) for context providers without an entry in CONTEXT_PROVIDER_TIMEOUTS
+DEFAULT_PROVIDER_TIMEOUT = 5.0
+
+# Shared pool for running independent upstream lookups concurrently
+_context_executor = ThreadPoolExecutor(
+    max_workers=settings.CONTEXT_PROVIDER_MAX_WORKERS,
+    thread_name_prefix='context-provider'
+)
+
+# Pooled, timeout-bounded HTTP clients with retries and circuit breakers
+weather_client = get_provider_client('weather')
+fitness_client = get_provider_client('fitness')
+
+# Member roster of the fitness API (FITNESS_API_MODE='roster'), indexed in-process
+fitness_roster = FitnessRoster(
+    settings.FITNESS_ROSTER_URL,
+    ttl=settings.FITNESS_ROSTER_TTL,
+    stale_ttl=settings.FITNESS_ROSTER_STALE_TTL,
+    retry_interval=settings.FITNESS_ROSTER_RETRY_INTERVAL,
+    client=fitness_client
+)
+
+# Weather per normalized location, shared across workers through the Django cache
+weather_cache = TieredCache('weather', maxsize=settings.WEATHER_CACHE_MAX_ENTRIES)
+weather_cache_stats = CacheStats('weather')
+_weather_refreshing = set()
+_weather_refresh_lock = threading.Lock()
+
+# Concurrent identical upstream lookups share one call (weather optionally across workers)
+weather_flight = SingleFlight(
+    'weather',
+    lock_alias='default' if settings.SINGLE_FLIGHT_CACHE_LOCK else None,
+    lock_timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT,
+    lock_wait=settings.SINGLE_FLIGHT_LOCK_WAIT
+)
+fitness_flight = SingleFlight('fitness')
+
+# Generated meal plans keyed on their quantized inputs, reused for the rest of the day
+meal_plan_memo = TieredCache('meal_plan_memo', maxsize=settings.MEAL_PLAN_MEMO_MAX_ENTRIES)
+meal_plan_memo_stats = CacheStats('meal_plan_memo')
+
+def normalize_location(location):
     """
-    Fetch weather data for a given location using a public Weather API
+    Normalize a location so equivalent spellings share a cache entry
+    (e.g. "  Dublin , IE" and "dublin,ie")
     """
+    parts = [' '.join(part.split()) for part in str(location).lower().split(',')]
+    return ','.join(part for part in parts if part)
+
+def build_weather_url(location):
     api_key = settings.WEATHER_API_KEY
-    url = f"https://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}&units=metric"
+    return f"https://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}&units=metric"
+
+def parse_weather_data(weather_data):
+    """
+    Extract the fields we use from an OpenWeatherMap response body
+    """
+    return {
+        'temperature': weather_data['main']['temp'],
+        'weather_condition': weather_data['weather'][0]['main'],
+        'humidity': weather_data['main']['humidity']
+    }
+
+def fetch_weather_data(location):
+    """
+    Fetch current weather for a location from OpenWeatherMap, bypassing the cache
     
+    Raises requests.exceptions.RequestException if the API call fails
+    """
+    start = time.monotonic()
     try:
-        response = requests.get(url)
+        response = weather_client.get(build_weather_url(location))
         response.raise_for_status()
         weather_data = response.json()
-        
-        return {
-            'temperature': weather_data['main']['temp'],
-            'weather_condition': weather_data['weather'][0]['main'],
-            'humidity': weather_data['main']['humidity']
-        }
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Weather API error: {str(e)}")
-        return {
-            'temperature': 20.0,  # Default values if API fails
-            'weather_condition': 'Unknown',
-            'humidity': 50
-        }
-        
-""" for the testing purpose as my friend's API does not contain the specific fieleds yet I needed to generate the meal plan
-def get_fitness_data(user_id, api_id):
+    finally:
+        weather_cache_stats.incr('upstream_calls')
+        weather_cache_stats.incr('upstream_seconds', time.monotonic() - start)
     
-    # Fetch fitness data from classmate's Fitness Tracker API
+    return parse_weather_data(weather_data)
 
-    fitness_api_url = settings.FITNESS_API_URL
+def _cache_weather(key, data):
+    # Keep entries past their TTL so they can still be served stale while refreshing,
+    # and after that as a fallback for when the API can't be called
+    weather_cache.set(key, {
+        'data': data,
+        'fetched_at': time.time(),
+        'failed': data is None
+    }, timeout=settings.WEATHER_CACHE_NEGATIVE_TTL if data is None
+        else max(settings.WEATHER_CACHE_TTL + settings.WEATHER_CACHE_STALE_TTL, settings.WEATHER_CACHE_FALLBACK_TTL))
+
+def _weather_expired(entry):
+    # Past the stale window the entry is only kept as a fallback
+    return time.time() - entry['fetched_at'] > settings.WEATHER_CACHE_TTL + settings.WEATHER_CACHE_STALE_TTL
+
+def weather_fetch_failed(key, error):
+    """
+    Return the weather to serve after a failed fetch for a location key
     
-    # Log the request details for debugging
-    logger.info(f"Attempting to fetch fitness data for user_id: {user_id}, api_id: {api_id}")
+    That is the last successful lookup if one is still kept, otherwise the
+    default weather. Provider failures with no fallback are negatively cached;
+    running out of request budget isn't, so the next call tries again.
+    """
+    logger.error(f"Weather API error: {str(error)}")
+    weather_cache_stats.incr('rate_limited' if isinstance(error, RateLimitedError) else 'upstream_errors')
     
-    if not api_id:
-        logger.error(f"No fitness_api_id provided for user {user_id}")
-        return {
-            'calories_burned': 2000,  # Default values if API fails
-            'steps': 5000,
-            'active_minutes': 30,
-            'using_default': True  # Flag to indicate default values are being used
-        }
+    entry = weather_cache.get(key)
+    if entry is not None and not entry['failed']:
+        weather_cache_stats.incr('fallback_hits')
+        return entry['data']
+    
+    if not isinstance(error, RateLimitedError):
+        _cache_weather(key, None)
+    return DEFAULT_WEATHER_DATA
+
+def _refresh_weather(location, key):
+    """
+    Background revalidation of a stale weather entry. On failure the stale
+    entry is left in place rather than replaced with a negative one.
+    """
+    try:
+        _cache_weather(key, fetch_weather_data(location))
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Weather refresh for '{key}' failed: {str(e)}")
+        weather_cache_stats.incr('upstream_errors')
+    finally:
+        with _weather_refresh_lock:
+            _weather_refreshing.discard(key)
+
+def get_cached_weather_data(location, key):
+    """
+    Return cached weather for a normalized location key, or None on a miss
     
-    # api_id is a string to match the format in the API response
-    api_id = str(api_id)
-    logger.info(f"Looking for member with ID: {api_id}")
+    Negative entries return the default weather, and stale entries are returned
+    while a background refresh is started.
+    """
+    entry = weather_cache.get(key)
+    if entry is None or (not entry['failed'] and _weather_expired(entry)):
+        weather_cache_stats.incr('misses')
+        return None
     
-    # For this API, don't need to construct a per-user URL
-    # fetch all members and find the one matching the api_id
-    url = fitness_api_url
+    weather_cache_stats.incr('hits')
     
-    try:
-        response = requests.get(url)
-        # Log the response status
-        logger.info(f"Fitness API response status: {response.status_code}")
-        
-        if response.status_code != 200:
-            logger.error(f"Fitness API error: {response.text if hasattr(response, 'text') else 'No response text'}")
-            raise requests.exceptions.RequestException(f"API returned {response.status_code}")
-        
-        # Parse the response
-        data = response.json()
-        logger.info(f"Fitness API response: {data}")
-        
-        # Check if the response has the expected structure
-        if "body" in data and isinstance(data["body"], list):
-            members = data["body"]
-            
-            # Log all available member IDs for debugging
-            member_ids = [m.get("memberid") for m in members]
-            logger.info(f"Available member IDs: {member_ids}")
-            
-            # Find the member with the matching ID
-            member = next((m for m in members if m.get("memberid") == api_id), None)
-            logger.info(f"Found member: {member}")
-            
-            # If no match, use the first member as a fallback
-            if not member and members:
-                logger.warning(f"Member with ID {api_id} not found. Using first available member instead.")
-                member = members[0]
-            
-            if member:
-                logger.info(f"Using fitness data for member: {member.get('name', 'Unknown')}")
-                
-                # Map fitness class to activity level
-                fitness_class = member.get("fitness_class", "B")
-                activity_level = map_fitness_class_to_activity(fitness_class)
-                
-                # Use age to estimate calorie needs
-                try:
-                    age = int(member.get("age", 25))
-                except (ValueError, TypeError):
-                    age = 25  # Default if age is not a valid number
-                
-                estimated_calories = estimate_calories_by_age(age, activity_level)
-                
-                # Return derived fitness data
-                return {
-                    'calories_burned': int(estimated_calories * 0.3),
-                    'steps': int(estimated_calories * 2.5),
-                    'active_minutes': estimate_active_minutes(activity_level),
-                    'using_default': False
-                }
-            else:
-                logger.error(f"No members found in fitness data")
-        else:
-            logger.error("Unexpected fitness API response structure")
-            
-        # If we reach here, something went wrong with finding or processing the member data
-        raise Exception("Could not process fitness data")
-            
-    except Exception as e:
-        logger.error(f"Fitness API error: {str(e)}")
-        return {
-            'calories_burned': 2000,  # Default values if API fails
-            'steps': 5000,
-            'active_minutes': 30,
-            'using_default': True  # Flag to indicate default values are being used
-        }
+    if entry['failed']:
+        weather_cache_stats.incr('negative_hits')
+        return dict(DEFAULT_WEATHER_DATA)
+    
+    if time.time() - entry['fetched_at'] > settings.WEATHER_CACHE_TTL:
+        weather_cache_stats.incr('stale_hits')
+        with _weather_refresh_lock:
+            refresh = key not in _weather_refreshing
+            _weather_refreshing.add(key)
+        if refresh:
+            _context_executor.submit(_refresh_weather, location, key)
+    
+    return dict(entry['data'])
 
-def map_fitness_class_to_activity(fitness_class):
-    # Map fitness class (A, B, C) to activity level
-    mapping = {
-        "A": "active",
-        "B": "moderate",
-        "C": "light",
-        # Default
-        "": "moderate"
-    }
-    return mapping.get(fitness_class, "moderate")
-
-def estimate_calories_by_age(age, activity_level):
-    # Estimate base calories based on age and activity level
-    # Very rough estimate - would be better with height/weight
-    base_calories = 2000  # Default for adult
-    
-    # Age adjustments
-    if age < 18:
-        base_calories = 1800
-    elif age > 50:
-        base_calories = 1900
-    
-    # Activity multipliers
-    multipliers = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "moderate": 1.55,
-        "active": 1.725,
-        "very_active": 1.9
-    }
+def peek_weather_data(key):
+    """
+    Return cached weather (or the default for a negative entry) without counting
+    a lookup or refreshing it, or None if there is no entry
+    """
+    entry = weather_cache.get(key)
+    if entry is None:
+        return None
+    if entry['failed']:
+        return DEFAULT_WEATHER_DATA
+    return None if _weather_expired(entry) else entry['data']
+
+def load_weather_data(location, key):
+    """
+    Fetch and cache weather for a location after a cache miss
+    """
+    try:
+        weather_data = fetch_weather_data(location)
+    except requests.exceptions.RequestException as e:
+        return weather_fetch_failed(key, e)
     
-    return int(base_calories * multipliers.get(activity_level, 1.55))
+    _cache_weather(key, weather_data)
+    return weather_data
 
-def estimate_active_minutes(activity_level):
-    #Estimate active minutes based on activity level
-    mapping = {
-        "sedentary": 15,
-        "light": 30,
-        "moderate": 45,
-        "active": 60,
-        "very_active": 90
-    }
-    return mapping.get(activity_level, 45)
+def get_weather_data(location):
+    """
+    Fetch weather data for a given location using a public Weather API
     
-"""
-def get_fitness_data(user_id, api_id):
+    Results are cached per normalized location for WEATHER_CACHE_TTL seconds.
+    Entries up to WEATHER_CACHE_STALE_TTL seconds past that are served while being
+    refreshed in the background, and failed lookups are cached for
+    WEATHER_CACHE_NEGATIVE_TTL seconds so a failing API is not retried on every call.
+    Concurrent misses for the same location share one upstream call.
     """
-    Fetch fitness data from classmate's Fitness Tracker API
+    key = normalize_location(location)
+    weather_data = get_cached_weather_data(location, key)
+    if weather_data is not None:
+        return weather_data
+    
+    weather_data = weather_flight.do(key, load_weather_data, location, key,
+                                     recheck=lambda: peek_weather_data(key))
+    return dict(weather_data)
+
+def build_fitness_request(user_id, api_id):
+    """
+    Return the (url, headers) to fetch a user's daily fitness data, or None if
+    the user has no fitness API id or the API isn't configured
     """
     fitness_api_url = settings.FITNESS_API_URL
     fitness_api_key = settings.FITNESS_API_KEY
@@ -185,12 +246,7 @@ def get_fitness_data(user_id, api_id):
     
     if not api_id:
         logger.error(f"No fitness_api_id provided for user {user_id}")
-        return {
-            'calories_burned': 2000,  # Default values if API fails
-            'steps': 5000,
-            'active_minutes': 30,
-            'using_default': True  # Flag to indicate default values are being used
-        }
+        return None
     
     url = f"{fitness_api_url}/fitness/{api_id}/daily"
     headers = {
@@ -203,49 +259,178 @@ def get_fitness_data(user_id, api_id):
     
     if not fitness_api_url or fitness_api_url == 'https://your-classmates-fitness-api.com/api':
         logger.error("Fitness API URL is not properly configured")
-        return {
-            'calories_burned': 2000,  # Default values if API fails
-            'steps': 5000,
-            'active_minutes': 30,
-            'using_default': True  # Flag to indicate default values are being used
-        }
+        return None
     
-    try:
-        response = requests.get(url, headers=headers)
-        # Log the response status and content for debugging
-        logger.info(f"Fitness API response status: {response.status_code}")
-        
-        if response.status_code != 200:
-            logger.error(f"Fitness API error: {response.text if hasattr(response, 'text') else 'No response text'}")
-            raise requests.exceptions.RequestException(f"API returned {response.status_code}")
-            
-        fitness_data = response.json()
-        logger.info(f"Fitness data retrieved successfully: {fitness_data}")
+    return url, headers
+
+def parse_fitness_response(response):
+    """
+    Turn a fitness API response (requests or httpx) into fitness data
+    
+    Raises requests.exceptions.RequestException for non-200 responses
+    """
+    # Log the response status and content for debugging
+    logger.info(f"Fitness API response status: {response.status_code}")
+    
+    if response.status_code != 200:
+        logger.error(f"Fitness API error: {response.text if hasattr(response, 'text') else 'No response text'}")
+        raise requests.exceptions.RequestException(f"API returned {response.status_code}")
         
-        return {
-            'calories_burned': fitness_data.get('calories_burned', 0),
-            'steps': fitness_data.get('steps', 0),
-            'active_minutes': fitness_data.get('active_minutes', 0),
-            'using_default': False  # Flag to indicate actual values are being used
-        }
+    fitness_data = response.json()
+    logger.info(f"Fitness data retrieved successfully: {fitness_data}")
+    
+    return {
+        'calories_burned': fitness_data.get('calories_burned', 0),
+        'steps': fitness_data.get('steps', 0),
+        'active_minutes': fitness_data.get('active_minutes', 0),
+        'using_default': False  # Flag to indicate actual values are being used
+    }
+
+def fetch_fitness_data(url, headers):
+    return parse_fitness_response(fitness_client.get(url, headers=headers))
+
+def get_roster_fitness_data(user_id, api_id):
+    """
+    Look up a user's fitness data in the fitness API's member roster
+    """
+    if not api_id:
+        logger.error(f"No fitness_api_id provided for user {user_id}")
+        return dict(DEFAULT_FITNESS_DATA)
+    
+    member = fitness_roster.get(api_id)
+    if member is None:
+        logger.warning(f"Member with ID {api_id} not found in fitness roster")
+        return dict(DEFAULT_FITNESS_DATA)
+    return member_to_fitness_data(member)
+
+def get_fitness_data(user_id, api_id):
+    """
+    Fetch fitness data from classmate's Fitness Tracker API
+    """
+    if settings.FITNESS_API_MODE == 'roster':
+        return get_roster_fitness_data(user_id, api_id)
+    
+    fitness_request = build_fitness_request(user_id, api_id)
+    if fitness_request is None:
+        return dict(DEFAULT_FITNESS_DATA)
+    url, headers = fitness_request
+    
+    try:
+        # Concurrent lookups for the same fitness API id share one upstream call
+        return dict(fitness_flight.do(str(api_id), fetch_fitness_data, url, headers))
     except requests.exceptions.RequestException as e:
         logger.error(f"Fitness API error: {str(e)}")
+        return dict(DEFAULT_FITNESS_DATA)
+
+def get_weather_data_bulk(locations):
+    """
+    Return {location: weather data} for many locations, looking up each distinct
+    location once, concurrently on the context provider pool
+    """
+    locations = list(dict.fromkeys(locations))
+    return dict(zip(locations, _context_executor.map(get_weather_data, locations)))
+
+def get_fitness_data_bulk(api_ids):
+    """
+    Return {api_id: fitness data} for many fitness API ids
+    
+    In roster mode this is a single read of the in-memory roster index; otherwise
+    the per-user lookups run concurrently on the context provider pool.
+    """
+    api_ids = list(dict.fromkeys(api_ids))
+    
+    if settings.FITNESS_API_MODE == 'roster':
+        members = fitness_roster.get_many(api_id for api_id in api_ids if api_id)
         return {
-            'calories_burned': 2000,  # Default values if API fails
-            'steps': 5000,
-            'active_minutes': 30,
-            'using_default': True  # Flag to indicate default values are being used
+            api_id: member_to_fitness_data(members[api_id]) if members.get(api_id) else dict(DEFAULT_FITNESS_DATA)
+            for api_id in api_ids
         }
+    
+    return dict(zip(api_ids, _context_executor.map(lambda api_id: get_fitness_data(None, api_id), api_ids)))
 
-def generate_meal_plan(user_profile, weather_data, fitness_data):
+def fetch_context_data(providers):
     """
-    Generate meal plan using AWS Lambda function
+    Run independent context lookups (weather, fitness, ...) concurrently
+    
+    providers maps a provider name to a (func, args, default) tuple. Each lookup
+    gets its own timeout budget from CONTEXT_PROVIDER_TIMEOUTS; if it raises or
+    runs over budget a copy of its default value is used instead.
     """
-    # Create Lambda client without explicit credentials
-    lambda_client = boto3.client('lambda', region_name=settings.AWS_REGION)
+    timeouts = settings.CONTEXT_PROVIDER_TIMEOUTS
+    start = time.monotonic()
     
-    # Prepare the payload for the Lambda function
-    payload = {
+    futures = {
+        name: _context_executor.submit(func, *args)
+        for name, (func, args, default) in providers.items()
+    }
+    
+    results = {}
+    for name, future in futures.items():
+        default = providers[name][2]
+        budget = timeouts.get(name, DEFAULT_PROVIDER_TIMEOUT)
+        remaining = max(0.0, budget - (time.monotonic() - start))
+        
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            logger.error(f"Context provider '{name}' timed out after {budget}s")
+            future.cancel()
+            results[name] = dict(default)
+        except Exception as e:
+            logger.error(f"Context provider '{name}' error: {str(e)}")
+            results[name] = dict(default)
+    
+    return results
+
+# Basic meal plan used as a fallback if the meal planner fails
+DEFAULT_MEAL_PLAN = {
+    'breakfast': {
+        'name': 'Default Breakfast',
+        'description': 'A balanced breakfast option',
+        'calories': 500,
+        'protein': 20,
+        'carbs': 60,
+        'fat': 15,
+        'ingredients': 'Eggs, Whole grain bread, Avocado',
+        'preparation': 'Prepare eggs as desired. Toast bread. Slice avocado and serve together.'
+    },
+    'lunch': {
+        'name': 'Default Lunch',
+        'description': 'A nutritious lunch option',
+        'calories': 700,
+        'protein': 30,
+        'carbs': 80,
+        'fat': 20,
+        'ingredients': 'Chicken breast, Brown rice, Mixed vegetables',
+        'preparation': 'Grill chicken. Cook rice. Steam vegetables. Serve together.'
+    },
+    'dinner': {
+        'name': 'Default Dinner',
+        'description': 'A wholesome dinner option',
+        'calories': 600,
+        'protein': 35,
+        'carbs': 50,
+        'fat': 20,
+        'ingredients': 'Salmon fillet, Quinoa, Spinach',
+        'preparation': 'Bake salmon. Cook quinoa. Sauté spinach. Plate and serve.'
+    },
+    'snack': {
+        'name': 'Default Snack',
+        'description': 'A healthy snack option',
+        'calories': 200,
+        'protein': 10,
+        'carbs': 20,
+        'fat': 8,
+        'ingredients': 'Greek yogurt, Berries, Honey',
+        'preparation': 'Mix yogurt with berries and a drizzle of honey.'
+    }
+}
+
+def build_meal_plan_payload(user_profile, weather_data, fitness_data):
+    """
+    Build the meal planner (Lambda) input for one user
+    """
+    return {
         'user_data': {
             'age': user_profile.age,
             'gender': user_profile.gender,
@@ -258,60 +443,203 @@ def generate_meal_plan(user_profile, weather_data, fitness_data):
         'weather_data': weather_data,
         'fitness_data': fitness_data
     }
+
+def get_meal_plan_memo_key(payload):
+    """
+    Memoization key for a meal planner payload, or None if it can't be memoized
     
+    A plan depends on the inputs only through the diet, the calorie target, the
+    protein ratio (set by fitness level) and the weather meal preferences, so the
+    key is built from those, with the calorie target bucketed, plus allergies and
+    today's date. They are computed by api.plan_inputs, which mirrors the planner.
+    """
+    if not settings.MEAL_PLAN_MEMO_ENABLED:
+        return None
+    
+    user_data = payload['user_data']
     try:
-        # Invoke the Lambda function
-        response = lambda_client.invoke(
-            FunctionName=settings.AWS_LAMBDA_FUNCTION_NAME,
-            InvocationType='RequestResponse',
-            Payload=json.dumps(payload)
-        )
+        calories, protein_ratio, weather_class = get_plan_inputs(
+            user_data, payload['weather_data'], payload['fitness_data'])
+    except Exception as e:
+        logger.warning(f"Meal plan not memoizable: {str(e)}")
+        return None
+    
+    parts = [
+        user_data.get('dietary_preference'),
+        int(calories // settings.MEAL_PLAN_MEMO_CALORIE_BUCKET),
+        weather_class,
+        protein_ratio,
+        sorted(user_data.get('allergies') or []),
+        timezone.localdate().isoformat(),
+    ]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+def get_meal_plan_seed(user_id, memo_key):
+    """
+    Meal selection seed for a user and memo key (which covers the date and inputs)
+    """
+    return int(hashlib.sha256(f"{user_id}:{memo_key}".encode()).hexdigest()[:16], 16)
+
+def prepare_meal_plan_request(user_profile, weather_data, fitness_data):
+    """
+    Build the meal planner payload for a user and look it up in the memo
+    
+    Returns (payload, memo_key, memoized_meal_plan). Memoizable payloads are
+    seeded, so the plan is reproducible; memoized_meal_plan is None on a miss.
+    """
+    payload = build_meal_plan_payload(user_profile, weather_data, fitness_data)
+    memo_key = get_meal_plan_memo_key(payload)
+    if memo_key is None:
+        return payload, None, None
+    
+    meal_plan = meal_plan_memo.get(memo_key)
+    if meal_plan is not None:
+        meal_plan_memo_stats.incr('hits')
+        return payload, memo_key, copy.deepcopy(meal_plan)
+    
+    meal_plan_memo_stats.incr('misses')
+    payload['seed'] = get_meal_plan_seed(user_profile.user_id, memo_key)
+    return payload, memo_key, None
+
+def memoize_meal_plan(memo_key, meal_plan):
+    if memo_key is not None:
+        meal_plan_memo.set(memo_key, meal_plan, settings.MEAL_PLAN_MEMO_TTL)
+
+def generate_meal_plan(user_profile, weather_data, fitness_data):
+    """
+    Generate meal plan using AWS Lambda function
+    
+    Plans already generated today for equivalent inputs are served from the memo.
+    """
+    # Prepare the payload for the Lambda function
+    payload, memo_key, meal_plan = prepare_meal_plan_request(user_profile, weather_data, fitness_data)
+    if meal_plan is not None:
+        return meal_plan
+    
+    try:
+        # Invoke the Lambda function (or its handler in-process in local mode)
+        result = invoke_meal_planner(payload)
         
-        # Parse the response
-        result = json.loads(response['Payload'].read().decode())
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        memoize_meal_plan(memo_key, result)
         return result
     except Exception as e:
         logger.error(f"AWS Lambda error: {str(e)}")
         # Return a basic meal plan as fallback
-        return {
-            'breakfast': {
-                'name': 'Default Breakfast',
-                'description': 'A balanced breakfast option',
-                'calories': 500,
-                'protein': 20,
-                'carbs': 60,
-                'fat': 15,
-                'ingredients': 'Eggs, Whole grain bread, Avocado',
-                'preparation': 'Prepare eggs as desired. Toast bread. Slice avocado and serve together.'
-            },
-            'lunch': {
-                'name': 'Default Lunch',
-                'description': 'A nutritious lunch option',
-                'calories': 700,
-                'protein': 30,
-                'carbs': 80,
-                'fat': 20,
-                'ingredients': 'Chicken breast, Brown rice, Mixed vegetables',
-                'preparation': 'Grill chicken. Cook rice. Steam vegetables. Serve together.'
-            },
-            'dinner': {
-                'name': 'Default Dinner',
-                'description': 'A wholesome dinner option',
-                'calories': 600,
-                'protein': 35,
-                'carbs': 50,
-                'fat': 20,
-                'ingredients': 'Salmon fillet, Quinoa, Spinach',
-                'preparation': 'Bake salmon. Cook quinoa. Sauté spinach. Plate and serve.'
-            },
-            'snack': {
-                'name': 'Default Snack',
-                'description': 'A healthy snack option',
-                'calories': 200,
-                'protein': 10,
-                'carbs': 20,
-                'fat': 8,
-                'ingredients': 'Greek yogurt, Berries, Honey',
-                'preparation': 'Mix yogurt with berries and a drizzle of honey.'
-            }
-        }
\ No newline at end of file
+        return copy.deepcopy(DEFAULT_MEAL_PLAN)
+
+def generate_meal_plans_bulk(entries):
+    """
+    Generate meal plans for many users with one meal planner invocation per batch
+    
+    entries is a list of (user_profile, weather_data, fitness_data) tuples. Users are
+    sent to the Lambda in batches of MEAL_PLANNER_BATCH_SIZE, except those served
+    from the memo. Returns one meal plan per entry, in order; entries that fail get
+    the default meal plan.
+    """
+    meal_plans = []
+    pending = []
+    for index, entry in enumerate(entries):
+        payload, memo_key, meal_plan = prepare_meal_plan_request(*entry)
+        meal_plans.append(meal_plan)
+        if meal_plan is None:
+            pending.append((index, payload, memo_key))
+    
+    batch_size = settings.MEAL_PLANNER_BATCH_SIZE
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        
+        try:
+            results = invoke_meal_planner({'users': [payload for _, payload, _ in batch]})['meal_plans']
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} meal plans, got {len(results)}")
+        except Exception as e:
+            logger.error(f"AWS Lambda batch error: {str(e)}")
+            results = [{'error': str(e)}] * len(batch)
+        
+        for (index, _, memo_key), result in zip(batch, results):
+            if 'error' in result:
+                logger.error(f"Meal plan generation failed: {result['error']}")
+                meal_plans[index] = copy.deepcopy(DEFAULT_MEAL_PLAN)
+            else:
+                memoize_meal_plan(memo_key, result)
+                meal_plans[index] = result
+    
+    return meal_plans
+
+def build_meal_plan(user, location, weather_data, fitness_data):
+    """
+    Build an unsaved MealPlan from the generation context
+    """
+    return MealPlan(
+        user=user,
+        location=location,
+        temperature=weather_data.get('temperature', 20),
+        weather_condition=weather_data.get('weather_condition', 'Unknown'),
+        calories_burned=fitness_data.get('calories_burned', 0),
+        steps=fitness_data.get('steps', 0)
+    )
+
+def build_meals(meal_plan, meal_plan_data):
+    """
+    Build unsaved Meal records for a generated meal plan
+    """
+    return [
+        Meal(
+            meal_plan=meal_plan,
+            meal_type=meal_type,
+            name=meal_info['name'],
+            description=meal_info['description'],
+            calories=meal_info['calories'],
+            protein=meal_info['protein'],
+            carbs=meal_info['carbs'],
+            fat=meal_info['fat'],
+            ingredients=meal_info['ingredients'],
+            preparation=meal_info['preparation']
+        )
+        for meal_type, meal_info in meal_plan_data.items()
+    ]
+
+def save_meal_plans(entries, batch_size=500):
+    """
+    Persist many generated meal plans at once
+    
+    entries is a list of (user, location, weather_data, fitness_data, meal_plan_data)
+    tuples. All plans and their meals are written with two bulk INSERTs per batch
+    inside a single transaction. Returns the saved MealPlan objects in order.
+    """
+    meal_plans = [
+        build_meal_plan(user, location, weather_data, fitness_data)
+        for user, location, weather_data, fitness_data, meal_plan_data in entries
+    ]
+    
+    with transaction.atomic():
+        meal_plans = MealPlan.objects.bulk_create(meal_plans, batch_size=batch_size)
+        meals = [
+            meal
+            for meal_plan, entry in zip(meal_plans, entries)
+            for meal in build_meals(meal_plan, entry[4])
+        ]
+        Meal.objects.bulk_create(meals, batch_size=batch_size)
+        
+        # Once the plans are visible, point the cached latest ids at them, so a
+        # reader that loaded the previous plan meanwhile can't leave its id behind
+        latest_ids = {}
+        for meal_plan in meal_plans:
+            latest_ids[meal_plan.user_id] = max(latest_ids.get(meal_plan.user_id, 0), meal_plan.id)
+        transaction.on_commit(lambda: [set_latest_meal_plan_id(user_id, meal_plan_id)
+                                       for user_id, meal_plan_id in latest_ids.items()])
+    
+    # bulk_create doesn't send post_save, so drop the cached latest plan ids here
+    # too, in case this runs inside a transaction that commits later
+    for user_id in latest_ids:
+        invalidate_latest_meal_plan(user_id)
+    
+    return meal_plans
+
+def save_meal_plan(user, location, weather_data, fitness_data, meal_plan_data):
+    """
+    Persist one generated meal plan and its meals atomically
+    """
+    return save_meal_plans([(user, location, weather_data, fitness_data, meal_plan_data)])[0]
@@ -1,77 +1,77 @@
 from celery import shared_task
-from .models import MealPlan, Meal
+from .models import MealPlan, Meal, MealPlanJob
 from .services import get_weather_data, get_fitness_data, generate_meal_plan
 from django.contrib.auth.models import User
 import logging
 
 logger = logging.getLogger(__name__)
 
+def resolve_context_data(context_data, manual_fitness_data=None):
+    """
+    Pick the weather and fitness data for generation from fetched context data
+    (or manually entered fitness data) and return (weather_data, fitness_data, warnings)
+    """
+    warnings = []
+    
+    # Get weather data
+    weather_data = context_data['weather']
+    if weather_data.get('weather_condition') == 'Unknown':
+        warnings.append("Could not retrieve accurate weather data. Using default weather conditions.")
+    
+    # Get fitness data - either from API or manual entry
+    if manual_fitness_data:
+        # Use manually entered fitness data
+        fitness_data = {
+            'calories_burned': manual_fitness_data.get('calories_burned', 2000),
+            'steps': manual_fitness_data.get('steps', 5000),
+            'active_minutes': manual_fitness_data.get('active_minutes', 30),
+            'using_default': False,  # Not using default values since user provided them
+            'manual_entry': True     # Flag to indicate manual entry
+        }
+        warnings.append("Using manually entered fitness data for meal planning.")
+    else:
+        # Fitness data fetched from the API
+        fitness_data = context_data['fitness']
+        
+        if fitness_data.get('using_default', False):
+            warnings.append("Could not retrieve your fitness data. Using default activity values for meal planning.")
+            warnings.append("You can provide your own fitness data by using the manual entry option.")
+    
+    return weather_data, fitness_data, warnings
+
 # Regular function (Celery is optional to use)
 def generate_meal_plan_task(user_id, location, manual_fitness_data=None):
     """
     Synchronous version of meal plan generation
+    
+    Returns {'meal_plan_id', 'warnings'}. If generation fails, meal_plan_id is
+    None and warnings are the ones gathered before the failure.
     """
     from django.contrib.auth.models import User
-    from .services import get_weather_data, get_fitness_data, generate_meal_plan
-    from .models import MealPlan, Meal
+    from .services import (
+        get_weather_data, get_fitness_data, generate_meal_plan, fetch_context_data,
+        save_meal_plan, DEFAULT_WEATHER_DATA, DEFAULT_FITNESS_DATA
+    )
     
     warnings = []
-    
     try:
         user = User.objects.get(id=user_id)
         user_profile = user.profile
         
-        # Get weather data
-        weather_data = get_weather_data(location)
-        if weather_data.get('weather_condition') == 'Unknown':
-            warnings.append("Could not retrieve accurate weather data. Using default weather conditions.")
-        
-        # Get fitness data - either from API or manual entry
-        if manual_fitness_data:
-            # Use manually entered fitness data
-            fitness_data = {
-                'calories_burned': manual_fitness_data.get('calories_burned', 2000),
-                'steps': manual_fitness_data.get('steps', 5000),
-                'active_minutes': manual_fitness_data.get('active_minutes', 30),
-                'using_default': False,  # Not using default values since user provided them
-                'manual_entry': True     # Flag to indicate manual entry
-            }
-            warnings.append("Using manually entered fitness data for meal planning.")
-        else:
-            # Try to get fitness data from API
-            fitness_data = get_fitness_data(user_id, user_profile.fitness_api_id)
-            
-            if fitness_data.get('using_default', False):
-                warnings.append("Could not retrieve your fitness data. Using default activity values for meal planning.")
-                warnings.append("You can provide your own fitness data by using the manual entry option.")
+        # Weather and fitness lookups are independent, so fetch them concurrently
+        providers = {
+            'weather': (get_weather_data, (location,), DEFAULT_WEATHER_DATA)
+        }
+        if not manual_fitness_data:
+            providers['fitness'] = (get_fitness_data, (user_id, user_profile.fitness_api_id), DEFAULT_FITNESS_DATA)
+        context_data = fetch_context_data(providers)
+        weather_data, fitness_data, warnings = resolve_context_data(context_data, manual_fitness_data)
         
         # Generate meal plan
         meal_plan_data = generate_meal_plan(user_profile, weather_data, fitness_data)
         
-        # Create MealPlan record
-        meal_plan = MealPlan.objects.create(
-            user=user,
-            location=location,
-            temperature=weather_data.get('temperature', 20),
-            weather_condition=weather_data.get('weather_condition', 'Unknown'),
-            calories_burned=fitness_data.get('calories_burned', 0),
-            steps=fitness_data.get('steps', 0)
-        )
-        
-        # Create Meal records
-        for meal_type, meal_info in meal_plan_data.items():
-            Meal.objects.create(
-                meal_plan=meal_plan,
-                meal_type=meal_type,
-                name=meal_info['name'],
-                description=meal_info['description'],
-                calories=meal_info['calories'],
-                protein=meal_info['protein'],
-                carbs=meal_info['carbs'],
-                fat=meal_info['fat'],
-                ingredients=meal_info['ingredients'],
-                preparation=meal_info['preparation']
-            )
+        # Create the MealPlan and its Meal records in one transaction
+        meal_plan = save_meal_plan(user, location, weather_data, fitness_data, meal_plan_data)
         
         return {
             'meal_plan_id': meal_plan.id,
@@ -80,4 +80,54 @@ def generate_meal_plan_task(user_id, location, manual_fitness_data=None):
         
     except Exception as e:
         logger.error(f"Error generating meal plan: {str(e)}")
-        return None
\ No newline at end of file
+        return {
+            'meal_plan_id': None,
+            'warnings': warnings
+        }
+
+@shared_task
+def generate_meal_plan_job(job_id):
+    """
+    Celery task that runs meal plan generation for a queued MealPlanJob
+    and records the outcome on the job
+    """
+    try:
+        job = MealPlanJob.objects.get(id=job_id)
+    except MealPlanJob.DoesNotExist:
+        logger.error(f"Meal plan job {job_id} not found")
+        return None
+    
+    result = generate_meal_plan_task(
+        job.user_id,
+        job.location,
+        manual_fitness_data=job.manual_fitness_data
+    )
+    
+    if result and result.get('meal_plan_id'):
+        job.status = 'succeeded'
+        job.meal_plan_id = result['meal_plan_id']
+        job.warnings = result.get('warnings', [])
+    else:
+        # Keep the warnings gathered before the failure, so clients can see why
+        job.status = 'failed'
+        job.warnings = (result or {}).get('warnings', [])
+    
+    job.save(update_fields=['status', 'meal_plan', 'warnings', 'updated_at'])
+    return job.status
+
+@shared_task
+def prewarm_weather_task():
+    """
+    Celery beat task: refresh the weather of profile locations about to expire
+    """
+    from .prewarm import prewarm_weather
+    return prewarm_weather()
+
+@shared_task
+def prewarm_meal_plans_task():
+    """
+    Celery beat task: memoize today's meal plans for recently active users
+    """
+    from .prewarm import prewarm_weather, prewarm_meal_plans
+    prewarm_weather()
+    return prewarm_meal_plans()
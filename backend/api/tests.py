@@ -1,3 +1,1293 @@
-from django.test import TestCase
+import asyncio
+import csv
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from dietplanner.celery import app as celery_app
+from users.models import UserProfile
+from . import lambda_client, plan_inputs, services, views
+from .async_services import agenerate_meal_plan_task, aget_weather_data
+from .cache import SingleFlight, get_cache_stats
+from .fitness_roster import FitnessRoster, member_to_fitness_data
+from .idempotency import generate_results
+from .models import MealPlan, Meal, MealPlanJob
+from .plan_cache import meal_plan_cache, get_latest_meal_plan_id
+from .prewarm import prewarm_weather, prewarm_meal_plans
+from .providers import ProviderClient, AsyncProviderClient, CircuitBreaker, CircuitOpenError, RateLimiter, RateLimitedError
+from .services import (
+    fetch_context_data, generate_meal_plan, generate_meal_plans_bulk, get_fitness_data_bulk, get_weather_data,
+    normalize_location, save_meal_plan, save_meal_plans, weather_cache, weather_cache_stats,
+    DEFAULT_WEATHER_DATA, DEFAULT_FITNESS_DATA, DEFAULT_MEAL_PLAN
+)
+
+WEATHER_DATA = {'temperature': 18.0, 'weather_condition': 'Clear', 'humidity': 60}
+FITNESS_DATA = {'calories_burned': 450, 'steps': 8000, 'active_minutes': 40, 'using_default': False}
+MEAL_PLAN_DATA = {
+    meal_type: {
+        'name': f'Test {meal_type}',
+        'description': 'A test meal',
+        'calories': 500,
+        'protein': 25.0,
+        'carbs': 50.0,
+        'fat': 15.0,
+        'ingredients': 'Test ingredients',
+        'preparation': 'Test preparation'
+    }
+    for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']
+}
+
+
+def mock_generation_services(test_case):
+    """
+    Patch the upstream weather, fitness and Lambda calls used during generation
+    """
+    patchers = [
+        mock.patch('api.services.get_weather_data', return_value=dict(WEATHER_DATA)),
+        mock.patch('api.services.get_fitness_data', return_value=dict(FITNESS_DATA)),
+        mock.patch('api.services.generate_meal_plan', return_value=MEAL_PLAN_DATA),
+    ]
+    for patcher in patchers:
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+
+
+class AsyncMealPlanGenerationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        mock_generation_services(self)
+        cache.clear()
+        
+        # Run Celery tasks inline so no broker is required
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+        self.addCleanup(setattr, celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', settings.CELERY_TASK_ALWAYS_EAGER)
+    
+    def test_generate_async_returns_job_and_status_reports_result(self):
+        response = self.client.post('/api/meal-plans/generate/', {'location': 'Dublin', 'async': True}, format='json')
+        
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+        
+        status_response = self.client.get(f'/api/meal-plans/jobs/{job_id}/')
+        self.assertEqual(status_response.status_code, 200)
+        self.assertEqual(status_response.data['status'], 'succeeded')
+        self.assertEqual(status_response.data['meal_plan_id'], MealPlan.objects.get(user=self.user).id)
+        self.assertIsInstance(status_response.data['warnings'], list)
+    
+    def test_failed_generation_marks_job_failed(self):
+        with mock.patch('api.tasks.generate_meal_plan_task', return_value=None):
+            response = self.client.post('/api/meal-plans/generate/', {'location': 'Dublin', 'async': True}, format='json')
+        
+        job = MealPlanJob.objects.get(id=response.data['job_id'])
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(job.meal_plan_id)
+    
+    def test_failed_job_keeps_warnings(self):
+        data = {'location': 'Dublin', 'async': True, 'manual_fitness_data': {'steps': 9000}}
+        with mock.patch('api.services.save_meal_plan', side_effect=RuntimeError('database is down')):
+            response = self.client.post('/api/meal-plans/generate/', data, format='json')
+        
+        job = MealPlanJob.objects.get(id=response.data['job_id'])
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.warnings, ['Using manually entered fitness data for meal planning.'])
+    
+    def test_unavailable_broker_fails_job(self):
+        with mock.patch('api.views.generate_meal_plan_job.delay', side_effect=ConnectionError('broker down')):
+            response = self.client.post('/api/meal-plans/generate/', {'location': 'Dublin', 'async': True}, format='json')
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(MealPlanJob.objects.get().status, 'failed')
+        
+        retry = self.client.post('/api/meal-plans/generate/', {'location': 'Dublin', 'async': True}, format='json')
+        self.assertEqual(retry.status_code, 202)
+    
+    def test_job_status_is_scoped_to_owner(self):
+        job = MealPlanJob.objects.create(user=self.user, location='Dublin')
+        other = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.client.force_authenticate(other)
+        
+        response = self.client.get(f'/api/meal-plans/jobs/{job.id}/')
+        self.assertEqual(response.status_code, 404)
+    
+    def test_generate_without_async_stays_synchronous(self):
+        response = self.client.post('/api/meal-plans/generate/', {'location': 'Dublin'}, format='json')
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(MealPlanJob.objects.exists())
+
+
+class GenerateIdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        generate_results.clear_local()
+        self.user = User.objects.create_user(username='erin', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        mock_generation_services(self)
+    
+    def generate(self, data, **extra):
+        return self.client.post('/api/meal-plans/generate/', data, format='json', **extra)
+    
+    def test_repeated_request_returns_existing_plan(self):
+        first = self.generate({'location': 'Dublin'})
+        second = self.generate({'location': ' dublin '})
+        
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data['meal_plan_id'], first.data['meal_plan_id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(MealPlan.objects.filter(user=self.user).count(), 1)
+        services.generate_meal_plan.assert_called_once()
+    
+    def test_changed_inputs_generate_new_plan(self):
+        self.generate({'location': 'Dublin'})
+        self.generate({'location': 'Dublin', 'manual_fitness_data': {'steps': 12000}})
+        
+        profile = self.user.profile
+        profile.weight = 80
+        profile.save()
+        self.generate({'location': 'Dublin'})
+        
+        self.assertEqual(MealPlan.objects.filter(user=self.user).count(), 3)
+    
+    @override_settings(MEAL_PLAN_GENERATE_WINDOW=0)
+    def test_idempotency_key_outlives_window(self):
+        first = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        retry = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        other = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='def-456')
+        
+        self.assertEqual(retry.data['meal_plan_id'], first.data['meal_plan_id'])
+        self.assertNotEqual(other.data['meal_plan_id'], first.data['meal_plan_id'])
+    
+    def test_retry_during_generation_is_rejected(self):
+        retries = []
+        
+        def generate_with_retry(*args):
+            retries.append(self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123'))
+            return MEAL_PLAN_DATA
+        
+        services.generate_meal_plan.side_effect = generate_with_retry
+        first = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(first.status_code, 201)
+        services.generate_meal_plan.assert_called_once()
+        
+        replayed = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(replayed.data['meal_plan_id'], first.data['meal_plan_id'])
+    
+    def test_key_reused_for_different_request_is_rejected(self):
+        self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        response = self.generate({'location': 'Cork'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(MealPlan.objects.filter(user=self.user).count(), 1)
+    
+    def test_failed_generation_releases_key(self):
+        with mock.patch('api.views.generate_meal_plan_task', return_value=None):
+            failed = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        retry = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(retry.status_code, 201)
+    
+    def test_user_without_profile_gets_json_error(self):
+        self.user.profile.delete()
+        self.client.force_authenticate(User.objects.get(id=self.user.id))
+        
+        response = self.generate({'location': 'Dublin'}, HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data['error'], 'Failed to generate meal plan')
+    
+    def test_deleted_plan_is_not_replayed(self):
+        first = self.generate({'location': 'Dublin'})
+        MealPlan.objects.filter(id=first.data['meal_plan_id']).delete()
+        
+        second = self.generate({'location': 'Dublin'})
+        self.assertNotEqual(second.data['meal_plan_id'], first.data['meal_plan_id'])
+        self.assertNotIn('Idempotent-Replayed', second)
+
+
+class AsyncGenerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        weather_cache.clear_local()
+        self.user = User.objects.create_user(username='lena', password='secret-pass-123')
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+    
+    @override_settings(MEAL_PLAN_MEMO_ENABLED=False)
+    async def test_generations_wait_on_upstreams_concurrently(self):
+        async def slow_weather(location):
+            await asyncio.sleep(0.2)
+            return dict(WEATHER_DATA)
+        
+        async def slow_planner(payload):
+            await asyncio.sleep(0.2)
+            return MEAL_PLAN_DATA
+        
+        with mock.patch('api.async_services.afetch_weather_data', side_effect=slow_weather), \
+                mock.patch('api.async_services.ainvoke_meal_planner', side_effect=slow_planner):
+            start = time.monotonic()
+            results = await asyncio.gather(*(
+                agenerate_meal_plan_task(self.user.id, f'City {i}', manual_fitness_data={'steps': 9000})
+                for i in range(50)
+            ))
+            elapsed = time.monotonic() - start
+        
+        # 50 sequential generations would take 20s
+        self.assertLess(elapsed, 5)
+        self.assertTrue(all(result and result['meal_plan_id'] for result in results))
+        self.assertEqual(await MealPlan.objects.filter(user=self.user).acount(), 50)
+    
+    async def test_generate_and_read_endpoints(self):
+        with mock.patch('api.async_services.aget_weather_data', return_value=dict(WEATHER_DATA)), \
+                mock.patch('api.async_services.agenerate_meal_plan', return_value=MEAL_PLAN_DATA):
+            response = await self.async_client.post('/api/async/meal-plans/generate/', {'location': 'Dublin'},
+                                                    content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        meal_plan_id = response.json()['meal_plan_id']
+        
+        latest = await self.async_client.get('/api/async/meal-plans/latest/', headers=self.headers)
+        self.assertEqual(latest.status_code, 200)
+        self.assertEqual(latest.json()['id'], meal_plan_id)
+        
+        revalidated = await self.async_client.get('/api/async/meal-plans/latest/',
+                                                  headers={**self.headers, 'If-None-Match': latest['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        
+        meals = await self.async_client.get(f'/api/async/meal-plans/{meal_plan_id}/meals/', headers=self.headers)
+        self.assertEqual(len(meals.json()), 4)
+        meal = await self.async_client.get(f"/api/async/meal-plans/{meal_plan_id}/meals/{meals.json()[0]['id']}/",
+                                          headers=self.headers)
+        self.assertEqual(meal.json(), meals.json()[0])
+    
+    async def test_cache_lookups_dont_block_the_event_loop(self):
+        def slow_cache_read(location, key):
+            time.sleep(0.2)
+            return dict(WEATHER_DATA)
+        
+        with mock.patch.object(services, 'get_cached_weather_data', side_effect=slow_cache_read):
+            start = time.monotonic()
+            await asyncio.gather(*(aget_weather_data(f'City {i}') for i in range(10)))
+            elapsed = time.monotonic() - start
+        
+        # On the event loop the 10 reads would take 2s
+        self.assertLess(elapsed, 1)
+    
+    async def test_cancelled_trial_doesnt_wedge_the_breaker(self):
+        client = AsyncProviderClient('stub', failure_threshold=1, reset_timeout=0, max_retries=0)
+        client.breaker.record_failure()
+        
+        async def slow_request(method, url, **kwargs):
+            await asyncio.sleep(1)
+        
+        # The half-open trial is cancelled by a context provider timeout
+        with mock.patch.object(client.session, 'request', side_effect=slow_request):
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.get('http://weather.test/'), 0.05)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        
+        with mock.patch.object(client.session, 'request', return_value=mock.Mock(status_code=200)):
+            await client.get('http://weather.test/')
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+    
+    async def test_user_without_profile_gets_json_error(self):
+        await UserProfile.objects.filter(user=self.user).adelete()
+        response = await self.async_client.post('/api/async/meal-plans/generate/', {'location': 'Dublin'},
+                                                content_type='application/json', headers=self.headers)
+        
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['error'], 'Failed to generate meal plan')
+    
+    def test_not_served_under_wsgi(self):
+        response = self.client.get('/api/async/meal-plans/latest/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 501)
+    
+    async def test_requires_token(self):
+        response = await self.async_client.get('/api/async/meal-plans/latest/')
+        self.assertEqual(response.status_code, 401)
+
+
+class ContextFanOutTests(TestCase):
+    def test_providers_run_concurrently(self):
+        weather_started = threading.Event()
+        fitness_started = threading.Event()
+        
+        def weather(location):
+            weather_started.set()
+            # Only succeeds if the fitness lookup is running at the same time
+            return {'overlapped': fitness_started.wait(timeout=2)}
+        
+        def fitness(user_id, api_id):
+            fitness_started.set()
+            return {'overlapped': weather_started.wait(timeout=2)}
+        
+        results = fetch_context_data({
+            'weather': (weather, ('Dublin',), DEFAULT_WEATHER_DATA),
+            'fitness': (fitness, (1, 'abc'), DEFAULT_FITNESS_DATA),
+        })
+        
+        self.assertTrue(results['weather']['overlapped'])
+        self.assertTrue(results['fitness']['overlapped'])
+    
+    @override_settings(CONTEXT_PROVIDER_TIMEOUTS={'weather': 0.1})
+    def test_slow_provider_falls_back_to_default(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        
+        results = fetch_context_data({
+            'weather': (lambda location: release.wait(timeout=2), ('Dublin',), DEFAULT_WEATHER_DATA),
+        })
+        
+        self.assertEqual(results['weather'], DEFAULT_WEATHER_DATA)
+    
+    def test_failing_provider_falls_back_to_default(self):
+        def fitness(user_id, api_id):
+            raise ValueError('upstream exploded')
+        
+        results = fetch_context_data({
+            'fitness': (fitness, (1, 'abc'), DEFAULT_FITNESS_DATA),
+        })
+        
+        self.assertTrue(results['fitness']['using_default'])
+
+
+def weather_response(temperature=12.5, condition='Clouds'):
+    response = mock.Mock()
+    response.raise_for_status.return_value = None
+    response.json.return_value = {
+        'main': {'temp': temperature, 'humidity': 70},
+        'weather': [{'main': condition}]
+    }
+    return response
+
+
+@override_settings(WEATHER_CACHE_TTL=600, WEATHER_CACHE_STALE_TTL=300, WEATHER_CACHE_NEGATIVE_TTL=60)
+class WeatherCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        weather_cache.clear_local()
+        weather_cache_stats.reset()
+    
+    def test_normalize_location(self):
+        self.assertEqual(normalize_location('  Dublin ,  IE '), 'dublin,ie')
+        self.assertEqual(normalize_location('New   York'), 'new york')
+    
+    def test_equivalent_locations_share_one_upstream_call(self):
+        with mock.patch.object(services.weather_client, 'get', return_value=weather_response()) as get:
+            first = get_weather_data('Dublin, IE')
+            second = get_weather_data(' dublin,ie')
+        
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first['temperature'], 12.5)
+        
+        stats = weather_cache_stats.snapshot()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['upstream_calls'], 1)
+    
+    def test_failed_lookup_is_negatively_cached(self):
+        error = requests.exceptions.ConnectionError('down')
+        with mock.patch.object(services.weather_client, 'get', side_effect=error) as get:
+            self.assertEqual(get_weather_data('Dublin'), DEFAULT_WEATHER_DATA)
+            self.assertEqual(get_weather_data('Dublin'), DEFAULT_WEATHER_DATA)
+        
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(weather_cache_stats.snapshot()['negative_hits'], 1)
+    
+    @override_settings(WEATHER_CACHE_TTL=0)
+    def test_stale_entry_is_served_while_revalidating(self):
+        with mock.patch.object(services.weather_client, 'get', return_value=weather_response(10.0)):
+            get_weather_data('Dublin')
+        
+        # Run the background refresh inline so the test is deterministic
+        run_inline = lambda func, *args: func(*args)
+        with mock.patch.object(services.weather_client, 'get', return_value=weather_response(25.0)), \
+                mock.patch.object(services._context_executor, 'submit', side_effect=run_inline):
+            # The stale entry is returned immediately and refreshed behind the scenes
+            self.assertEqual(get_weather_data('Dublin')['temperature'], 10.0)
+            self.assertEqual(get_weather_data('Dublin')['temperature'], 25.0)
+        
+        self.assertEqual(weather_cache_stats.snapshot()['stale_hits'], 2)
+    
+    def test_rate_limited_lookup_falls_back_to_last_known_weather(self):
+        with mock.patch.object(services.weather_client, 'get', return_value=weather_response(10.0)):
+            get_weather_data('Dublin')
+        
+        error = RateLimitedError('budget exhausted')
+        with override_settings(WEATHER_CACHE_TTL=0, WEATHER_CACHE_STALE_TTL=0), \
+                mock.patch.object(services.weather_client, 'get', side_effect=error) as get:
+            time.sleep(0.01)
+            self.assertEqual(get_weather_data('Dublin')['temperature'], 10.0)
+            # Not negatively cached, so the next lookup tries the API again
+            self.assertEqual(get_weather_data('Dublin')['temperature'], 10.0)
+            self.assertEqual(get_weather_data('Cork'), DEFAULT_WEATHER_DATA)
+        
+        self.assertEqual(get.call_count, 3)
+        stats = weather_cache_stats.snapshot()
+        self.assertEqual(stats['fallback_hits'], 2)
+        self.assertEqual(stats['rate_limited'], 3)
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """
+    Minimal keep-alive upstream: /ok returns JSON, /fail returns 503, /slow stalls
+    """
+    protocol_version = 'HTTP/1.1'
+    
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+    
+    def do_GET(self):
+        self.server.requests += 1
+        if self.path == '/slow':
+            time.sleep(0.5)
+        status_code = 503 if self.path == '/fail' else 200
+        body = b'{"ok": true}'
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        weather_cache.clear_local()
+    
+    def run_concurrently(self, func, *args, count=20):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(func(*args))) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_concurrent_weather_misses_share_one_call(self):
+        def slow_get(url):
+            time.sleep(0.2)
+            return weather_response()
+        
+        with mock.patch.object(services.weather_client, 'get', side_effect=slow_get) as get:
+            results = self.run_concurrently(get_weather_data, 'Dublin')
+        
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(result['temperature'] == 12.5 for result in results))
+    
+    def test_concurrent_fitness_lookups_share_one_call(self):
+        def slow_get(url, headers=None):
+            time.sleep(0.2)
+            return mock.Mock(status_code=200, json=lambda: {'calories_burned': 300, 'steps': 6000, 'active_minutes': 20})
+        
+        with mock.patch.object(services.fitness_client, 'get', side_effect=slow_get) as get:
+            results = self.run_concurrently(services.get_fitness_data, 1, 'member-1')
+        
+        self.assertEqual(get.call_count, 1)
+        self.assertTrue(all(result['steps'] == 6000 and not result['using_default'] for result in results))
+    
+    def test_cache_lock_waits_for_other_worker(self):
+        flight = SingleFlight('test', lock_alias='default', lock_wait=1, poll_interval=0.01)
+        func = mock.Mock(return_value='fetched')
+        # Another worker is already fetching
+        cache.add('singleflight:test:dublin', 1)
+        
+        recheck = mock.Mock(side_effect=[None, None, 'cached'])
+        self.assertEqual(flight.do('dublin', func, recheck=recheck), 'cached')
+        func.assert_not_called()
+        
+        flight.lock_wait = 0.05
+        self.assertEqual(flight.do('dublin', func, recheck=lambda: None), 'fetched')
+        self.assertEqual(flight.stats.snapshot()['lock_timeouts'], 1)
+        
+        cache.delete('singleflight:test:dublin')
+        self.assertEqual(flight.do('dublin', func), 'fetched')
+        self.assertIsNone(cache.get('singleflight:test:dublin'))
+    
+    async def test_async_weather_misses_share_one_call(self):
+        async def slow_weather(location):
+            await asyncio.sleep(0.1)
+            return dict(WEATHER_DATA)
+        
+        with mock.patch('api.async_services.afetch_weather_data', side_effect=slow_weather) as fetch:
+            results = await asyncio.gather(*(aget_weather_data('Dublin') for _ in range(20)))
+        
+        self.assertEqual(fetch.call_count, 1)
+        self.assertTrue(all(result == WEATHER_DATA for result in results))
+
+
+def roster_response(*members):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = {'statusCode': 200, 'body': list(members)}
+    return response
+
+
+ROSTER_MEMBERS = [
+    {'memberid': '1', 'name': 'Ann', 'age': '30', 'fitness_class': 'A'},
+    {'memberid': '2', 'name': 'Bob', 'age': '60', 'fitness_class': 'C'},
+]
+
+
+class FitnessRosterTests(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.get.return_value = roster_response(*ROSTER_MEMBERS)
+        self.roster = FitnessRoster('https://fitness.test/Prod', ttl=60, stale_ttl=60, retry_interval=60,
+                                    client=self.client)
+    
+    def test_roster_is_fetched_once_and_indexed(self):
+        self.assertEqual(self.roster.get('1')['name'], 'Ann')
+        self.assertEqual(self.roster.get(2)['name'], 'Bob')
+        self.assertIsNone(self.roster.get('3'))
+        members = self.roster.get_many(['1', '2', '3'])
+        
+        self.assertEqual(self.client.get.call_count, 1)
+        self.assertEqual({key: member and member['name'] for key, member in members.items()},
+                         {'1': 'Ann', '2': 'Bob', '3': None})
+    
+    def test_stale_roster_is_served_while_refreshing_in_background(self):
+        self.roster.ttl = 0
+        self.roster.get('1')
+        release = threading.Event()
+        
+        def slow_fetch(url):
+            release.wait(5)
+            return roster_response({'memberid': '1', 'name': 'Ann Updated'})
+        
+        self.client.get.side_effect = slow_fetch
+        self.assertEqual(self.roster.get('1')['name'], 'Ann')
+        self.assertEqual(self.roster.get('1')['name'], 'Ann')
+        release.set()
+        for _ in range(100):
+            if not self.roster._refreshing:
+                break
+            time.sleep(0.01)
+        
+        self.assertEqual(self.client.get.call_count, 2)
+        self.assertEqual(self.roster.get_index()['1']['name'], 'Ann Updated')
+    
+    def test_failed_refresh_keeps_index_and_backs_off(self):
+        self.roster.ttl = self.roster.stale_ttl = 0
+        self.roster.get('1')
+        self.client.get.side_effect = requests.exceptions.ConnectionError('down')
+        
+        self.assertEqual(self.roster.get('1')['name'], 'Ann')
+        self.assertEqual(self.roster.get('2')['name'], 'Bob')
+        self.assertEqual(self.client.get.call_count, 2)
+    
+    @override_settings(FITNESS_API_MODE='roster')
+    def test_bulk_fitness_lookup_from_roster(self):
+        with mock.patch.object(services, 'fitness_roster', self.roster):
+            fitness_data = get_fitness_data_bulk(['1', '2', '3', None, '1'])
+            single = services.get_fitness_data(7, '2')
+        
+        self.assertEqual(self.client.get.call_count, 1)
+        self.assertEqual(list(fitness_data), ['1', '2', '3', None])
+        self.assertEqual(fitness_data['1'], member_to_fitness_data(ROSTER_MEMBERS[0]))
+        self.assertEqual(fitness_data['2']['active_minutes'], 30)
+        self.assertTrue(fitness_data['3']['using_default'])
+        self.assertTrue(fitness_data[None]['using_default'])
+        self.assertEqual(single, fitness_data['2'])
+
+
+class ProviderClientTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviderHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.requests = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+    
+    def make_client(self, **kwargs):
+        options = {'max_retries': 0, 'backoff_base': 0.0, 'read_timeout': 2.0}
+        options.update(kwargs)
+        client = ProviderClient('stub', **options)
+        self.addCleanup(client.session.close)
+        return client
+    
+    def test_connections_are_reused(self):
+        client = self.make_client()
+        for _ in range(5):
+            self.assertEqual(client.get(f'{self.base_url}/ok').json(), {'ok': True})
+        
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual(self.server.connections, 1)
+    
+    def test_retryable_status_is_retried(self):
+        client = self.make_client(max_retries=2)
+        response = client.get(f'{self.base_url}/fail')
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests, 3)
+    
+    def test_read_timeout_is_enforced(self):
+        client = self.make_client(read_timeout=0.1)
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.get(f'{self.base_url}/slow')
+    
+    def test_breaker_opens_and_short_circuits(self):
+        client = self.make_client(failure_threshold=2, reset_timeout=60)
+        client.get(f'{self.base_url}/fail')
+        client.get(f'{self.base_url}/fail')
+        
+        with self.assertRaises(CircuitOpenError):
+            client.get(f'{self.base_url}/ok')
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+    
+    def test_breaker_closes_after_successful_trial(self):
+        client = self.make_client(failure_threshold=1, reset_timeout=0)
+        client.get(f'{self.base_url}/fail')
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        
+        client.get(f'{self.base_url}/ok')
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_other_request_errors_settle_the_trial(self):
+        client = self.make_client(failure_threshold=1, reset_timeout=0)
+        client.get(f'{self.base_url}/fail')
+        
+        # The half-open trial fails with an error that isn't retried
+        error = requests.exceptions.ChunkedEncodingError('connection broken')
+        with mock.patch.object(client.session, 'get', side_effect=error):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                client.get(f'{self.base_url}/ok')
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        
+        self.assertEqual(client.get(f'{self.base_url}/ok').status_code, 200)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_other_request_errors_count_as_failures(self):
+        client = self.make_client(failure_threshold=2, reset_timeout=60)
+        with mock.patch.object(client.session, 'get', side_effect=requests.exceptions.TooManyRedirects('loop')):
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.TooManyRedirects):
+                    client.get(f'{self.base_url}/ok')
+        
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+    
+    def test_rate_limiter_sheds_calls_over_budget(self):
+        cache.clear()
+        client = self.make_client(rate_limiter=RateLimiter('stub', rate=0.01, burst=2))
+        client.get(f'{self.base_url}/ok')
+        client.get(f'{self.base_url}/ok')
+        
+        with self.assertRaises(RateLimitedError):
+            client.get(f'{self.base_url}/ok')
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+        
+        stats = get_cache_stats()['stub_rate_limit']
+        self.assertEqual((stats['allowed'], stats['shed'], stats['utilization']), (2, 1, 1.0))
+    
+    def test_rate_limited_trial_doesnt_wedge_the_breaker(self):
+        cache.clear()
+        limiter = RateLimiter('trial', rate=0.01, burst=1)
+        client = self.make_client(failure_threshold=1, reset_timeout=0, rate_limiter=limiter)
+        client.get(f'{self.base_url}/fail')
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        
+        # The half-open trial is shed by the limiter, which hands it back
+        with self.assertRaises(RateLimitedError):
+            client.get(f'{self.base_url}/ok')
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        
+        # Once the budget refills, the next call makes the trial and closes the circuit
+        cache.clear()
+        self.assertEqual(client.get(f'{self.base_url}/ok').status_code, 200)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_rate_limiter_queues_calls_until_the_budget_refills(self):
+        cache.clear()
+        limiter = RateLimiter('queued', rate=20, burst=2, max_wait=1)
+        start = time.monotonic()
+        self.assertTrue(all(limiter.acquire() for _ in range(6)))
+        
+        self.assertGreater(time.monotonic() - start, 0.1)
+        self.assertGreaterEqual(limiter.stats.snapshot()['queued'], 2)
+    
+    def test_open_breaker_falls_back_to_default_weather(self):
+        cache.clear()
+        weather_cache.clear_local()
+        client = self.make_client(failure_threshold=1, reset_timeout=60)
+        client.breaker.record_failure()
+        
+        with mock.patch.object(services, 'weather_client', client):
+            self.assertEqual(get_weather_data('Dublin'), DEFAULT_WEATHER_DATA)
+        self.assertEqual(self.server.requests, 0)
+
+
+class MealPlannerInvocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        services.meal_plan_memo.clear_local()
+        services.meal_plan_memo_stats.reset()
+        self.user = User.objects.create_user(username='carol', password='secret-pass-123')
+        profile = self.user.profile
+        profile.age, profile.gender, profile.height, profile.weight = 30, 'female', 165, 60
+        profile.dietary_preference = 'vegan'
+    
+    @override_settings(MEAL_PLANNER_MODE='local')
+    def test_local_mode_runs_handler_in_process(self):
+        with mock.patch('api.lambda_client.get_lambda_client') as get_client:
+            meal_plan = generate_meal_plan(self.user.profile, WEATHER_DATA, FITNESS_DATA)
+        
+        get_client.assert_not_called()
+        self.assertEqual(set(meal_plan), {'breakfast', 'lunch', 'dinner', 'snack'})
+        self.assertEqual(meal_plan['breakfast']['name'], 'Vegan Smoothie Bowl')
+        self.assertGreater(meal_plan['lunch']['calories'], 0)
+    
+    @override_settings(MEAL_PLANNER_MODE='local')
+    def test_local_handler_does_not_mutate_meal_catalog(self):
+        planner = lambda_client.load_meal_planner_module()
+        first = planner.generate_meal('lunch', 2000, 0.25, 'keto')
+        second = planner.generate_meal('lunch', 3000, 0.3, 'keto')
+        
+        self.assertNotEqual(first['calories'], second['calories'])
+        self.assertNotIn('calories', planner.MEAL_CATALOG['keto']['lunch'][0])
+        with self.assertRaises(TypeError):
+            planner.MEAL_CATALOG['keto']['lunch'][0]['calories'] = 1
+    
+    @override_settings(MEAL_PLANNER_MODE='local', MEAL_PLANNER_BATCH_SIZE=2)
+    def test_bulk_generation_batches_users(self):
+        broken = mock.Mock(age=None, gender='male', height=None, weight=None, activity_level='active',
+                           dietary_preference='omnivore', allergies='')
+        entries = [(self.user.profile, WEATHER_DATA, FITNESS_DATA)] * 3 + [(broken, WEATHER_DATA, FITNESS_DATA)]
+        
+        with mock.patch('api.services.invoke_meal_planner', wraps=lambda_client.invoke_meal_planner) as invoke:
+            meal_plans = generate_meal_plans_bulk(entries)
+        
+        self.assertEqual(invoke.call_count, 2)
+        self.assertEqual(len(meal_plans), 4)
+        single = generate_meal_plan(self.user.profile, WEATHER_DATA, FITNESS_DATA)
+        self.assertEqual(meal_plans[0]['lunch']['calories'], single['lunch']['calories'])
+        self.assertEqual(meal_plans[3], DEFAULT_MEAL_PLAN)
+    
+    def test_nutrition_engine_matches_scalar_functions(self):
+        planner = lambda_client.load_meal_planner_module()
+        if planner.nutrition.np is None:
+            self.skipTest('NumPy is not installed')
+        
+        users = [
+            {'age': 30, 'gender': 'female', 'height': 165, 'weight': 60, 'activity_level': 'moderate'},
+            {'age': 52, 'gender': 'male', 'height': 181.5, 'weight': 93.2, 'activity_level': 'very_active'},
+            {'age': 19, 'gender': 'male', 'height': 172, 'weight': 58, 'activity_level': 'sedentary'},
+        ]
+        weather = [{'temperature': 4.5}, {'temperature': 33.0}, {}]
+        fitness = [{'steps': 12000}, {'calories_burned': 200}, {'steps': 3000, 'calories_burned': 650}]
+        
+        calories, protein_ratio, macros, valid = planner.nutrition.compute_nutrition(users, weather, fitness)
+        
+        self.assertTrue(valid.all())
+        for i, user_data in enumerate(users):
+            expected = planner.get_base_calorie_needs(user_data)
+            expected *= planner.get_activity_multiplier(user_data['activity_level'])
+            expected, _ = planner.adjust_for_weather(expected, weather[i])
+            expected, expected_ratio = planner.adjust_for_fitness(expected, fitness[i])
+            
+            self.assertEqual(calories[i], expected)
+            self.assertEqual(protein_ratio[i], expected_ratio)
+            meal = planner.generate_meal('lunch', expected, expected_ratio, 'omnivore')
+            self.assertEqual(round(macros['lunch']['fat'].tolist()[i], 1), meal['fat'])
+    
+    @override_settings(MEAL_PLANNER_MODE='local')
+    def test_equivalent_inputs_are_served_from_memo(self):
+        warmer = dict(WEATHER_DATA, temperature=WEATHER_DATA['temperature'] + 0.1)
+        with mock.patch('api.services.invoke_meal_planner', wraps=lambda_client.invoke_meal_planner) as invoke:
+            first = generate_meal_plan(self.user.profile, WEATHER_DATA, FITNESS_DATA)
+            second = generate_meal_plan(self.user.profile, warmer, FITNESS_DATA)
+        
+        invoke.assert_called_once()
+        self.assertIn('seed', invoke.call_args[0][0])
+        self.assertEqual(first, second)
+        self.assertEqual(services.meal_plan_memo_stats.snapshot()['hit_rate'], 0.5)
+    
+    def test_plan_inputs_match_the_planner(self):
+        planner = lambda_client.load_meal_planner_module()
+        users = [
+            {'age': 30, 'gender': 'female', 'height': 165, 'weight': 60, 'activity_level': 'moderate'},
+            {'age': 52, 'gender': 'male', 'height': 181.5, 'weight': 93.2, 'activity_level': 'very_active'},
+            {'age': 19, 'height': 172, 'weight': 58, 'activity_level': 'unknown'},
+        ]
+        weather = [{'temperature': 4.5, 'weather_condition': 'Light Rain'}, {'temperature': 33.0}, {}]
+        fitness = [{'steps': 12000}, {'calories_burned': 650}, {}]
+        
+        for user_data, weather_data, fitness_data in itertools.product(users, weather, fitness):
+            calories, protein_ratio, preferences = planner.get_plan_inputs(user_data, weather_data, fitness_data)
+            style = 'comfort' if preferences is planner.COMFORT_MEAL_PREFERENCES else 'regular'
+            self.assertEqual(plan_inputs.get_plan_inputs(user_data, weather_data, fitness_data),
+                             (calories, protein_ratio, style))
+    
+    def test_memo_works_without_the_lambda_source(self):
+        # As deployed to Elastic Beanstalk, where lambda/meal_planner isn't shipped
+        with mock.patch('api.lambda_client.load_meal_planner_module', side_effect=ImportError), \
+                mock.patch('api.services.invoke_meal_planner', return_value=MEAL_PLAN_DATA) as invoke:
+            generate_meal_plan(self.user.profile, WEATHER_DATA, FITNESS_DATA)
+            generate_meal_plan(self.user.profile, WEATHER_DATA, FITNESS_DATA)
+        
+        invoke.assert_called_once()
+    
+    @override_settings(MEAL_PLANNER_MODE='local')
+    def test_seeded_generation_is_reproducible(self):
+        planner = lambda_client.load_meal_planner_module()
+        payload = dict(services.build_meal_plan_payload(self.user.profile, WEATHER_DATA, FITNESS_DATA), seed=1234)
+        payload['user_data']['dietary_preference'] = 'omnivore'
+        
+        plans = [planner.lambda_handler(payload, None) for _ in range(5)]
+        batched = planner.lambda_handler({'users': [payload] * 3}, None)['meal_plans']
+        
+        self.assertTrue(all(plan == plans[0] for plan in plans + batched))
+    
+    @override_settings(MEAL_PLANNER_MODE='local')
+    def test_different_fitness_level_is_not_memoized_together(self):
+        active = dict(FITNESS_DATA, steps=15000)
+        with mock.patch('api.services.invoke_meal_planner', wraps=lambda_client.invoke_meal_planner) as invoke:
+            generate_meal_plan(self.user.profile, WEATHER_DATA, FITNESS_DATA)
+            generate_meal_plan(self.user.profile, WEATHER_DATA, active)
+        
+        self.assertEqual(invoke.call_count, 2)
+    
+    def test_lambda_client_is_shared(self):
+        with mock.patch.object(lambda_client, '_lambda_client', None), \
+                mock.patch('api.lambda_client.boto3.client') as make_client:
+            clients = {lambda_client.get_lambda_client() for _ in range(3)}
+        
+        self.assertEqual(len(clients), 1)
+        make_client.assert_called_once()
+    
+    def test_lambda_error_falls_back_to_default_plan(self):
+        with mock.patch('api.services.invoke_meal_planner', return_value={'error': 'boom'}):
+            meal_plan = generate_meal_plan(self.user.profile, WEATHER_DATA, FITNESS_DATA)
+        
+        self.assertEqual(meal_plan['breakfast']['name'], 'Default Breakfast')
+
+
+class PrewarmTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        weather_cache.clear_local()
+        services.meal_plan_memo.clear_local()
+        self.users = []
+        for username, location in [('kim', 'Dublin'), ('lee', ' dublin '), ('max', 'Cork'), ('ned', '')]:
+            user = User.objects.create_user(username=username, password='secret-pass-123')
+            profile = user.profile
+            profile.age, profile.gender, profile.height, profile.weight = 30, 'female', 165, 60
+            profile.location = location
+            profile.save()
+            self.users.append(user)
+    
+    def test_weather_prewarm_only_refreshes_stale_locations(self):
+        with mock.patch.object(services.weather_client, 'get', return_value=weather_response()) as get:
+            first = prewarm_weather(concurrency=2)
+            second = prewarm_weather(concurrency=2)
+            cached = get_weather_data('Dublin')
+        
+        self.assertEqual(first, {'locations': 2, 'refreshed': 2, 'failed': 0, 'skipped': 0, 'deferred': 0})
+        self.assertEqual(second, {'locations': 2, 'refreshed': 0, 'failed': 0, 'skipped': 2, 'deferred': 0})
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(cached['temperature'], 12.5)
+    
+    def test_failed_weather_prewarm_keeps_cached_entry(self):
+        with mock.patch.object(services.weather_client, 'get', return_value=weather_response(10.0)):
+            prewarm_weather()
+        
+        error = requests.exceptions.ConnectionError('down')
+        with mock.patch.object(services.weather_client, 'get', side_effect=error):
+            summary = prewarm_weather(min_ttl=settings.WEATHER_CACHE_TTL)
+        
+        self.assertEqual(summary['failed'], 2)
+        self.assertEqual(get_weather_data('Cork')['temperature'], 10.0)
+    
+    @override_settings(PROVIDER_RATE_LIMITS={'weather': (4 / 600, 4)}, PREWARM_WEATHER_BUDGET_SHARE=0.5)
+    def test_weather_prewarm_leaves_budget_for_users(self):
+        for i, city in enumerate(['Galway', 'Limerick', 'Sligo', 'Athlone']):
+            user = User.objects.create_user(username=f'user-{i}')
+            user.profile.location = city
+            user.profile.save()
+        
+        limiter = RateLimiter('weather', rate=4 / 600, burst=4)
+        with mock.patch.object(services.weather_client, 'rate_limiter', limiter), \
+                mock.patch.object(services.weather_client.session, 'get', return_value=weather_response()):
+            summary = prewarm_weather()
+            # Half of the window's budget is still there for users
+            first = get_weather_data('Kilkenny')
+            second = get_weather_data('Wexford')
+        
+        self.assertEqual((summary['refreshed'], summary['deferred']), (2, 4))
+        self.assertEqual(first['temperature'], 12.5)
+        self.assertEqual(second['temperature'], 12.5)
+    
+    @override_settings(MEAL_PLANNER_MODE='local', MEAL_PLANNER_BATCH_SIZE=2)
+    def test_meal_plan_prewarm_memoizes_plans_for_active_users(self):
+        for user in self.users:
+            save_meal_plan(user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        
+        with mock.patch.object(services, 'get_weather_data', return_value=dict(WEATHER_DATA)), \
+                mock.patch.object(services, 'get_fitness_data', return_value=dict(FITNESS_DATA)), \
+                mock.patch('api.services.invoke_meal_planner', wraps=lambda_client.invoke_meal_planner) as invoke:
+            summary = prewarm_meal_plans(chunk_size=2)
+            self.assertEqual(summary, {'users': 3})
+            self.assertEqual(invoke.call_count, 1)
+            
+            invoke.reset_mock()
+            profile = User.objects.get(username='max').profile
+            generate_meal_plan(profile, WEATHER_DATA, FITNESS_DATA)
+            invoke.assert_not_called()
+
+
+@override_settings(MEAL_PLANNER_MODE='local')
+class GeneratePlansCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        services.meal_plan_memo.clear_local()
+        self.users = []
+        for username, location in [('ava', 'Dublin'), ('bo', 'Cork'), ('cy', 'Dublin'), ('di', '')]:
+            user = User.objects.create_user(username=username, password='secret-pass-123')
+            profile = user.profile
+            profile.age, profile.gender, profile.height, profile.weight = 30, 'female', 165, 60
+            profile.location = location
+            profile.save()
+            self.users.append(user)
+        
+        checkpoint_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(checkpoint_dir.cleanup)
+        self.checkpoint = os.path.join(checkpoint_dir.name, 'generate_plans.checkpoint')
+        
+        patches = [
+            mock.patch.object(services, 'get_weather_data', return_value=dict(WEATHER_DATA)),
+            mock.patch.object(services, 'get_fitness_data', return_value=dict(FITNESS_DATA)),
+        ]
+        self.get_weather_data = patches[0].start()
+        for patch in patches[1:]:
+            patch.start()
+        for patch in patches:
+            self.addCleanup(patch.stop)
+    
+    def generate_plans(self, **options):
+        out = StringIO()
+        options = {'workers': 0, 'chunk_size': 2, **options}
+        call_command('generate_plans', checkpoint=self.checkpoint, stdout=out, **options)
+        return out.getvalue()
+    
+    def test_generates_a_plan_per_user_with_a_location(self):
+        output = self.generate_plans()
+        
+        planned = set(MealPlan.objects.values_list('user__username', flat=True))
+        self.assertEqual(planned, {'ava', 'bo', 'cy'})
+        self.assertFalse(MealPlan.objects.filter(meals__isnull=True).exists())
+        # One lookup per distinct location
+        self.assertEqual(self.get_weather_data.call_count, 3)
+        self.assertIn('Generated 3 meal plans', output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+    
+    def test_fallback_location_and_user_selection(self):
+        ned = self.users[3]
+        self.generate_plans(users=f'{self.users[0].id},{ned.id}', location='Galway')
+        
+        self.assertEqual(set(MealPlan.objects.values_list('user__username', flat=True)), {'ava', 'di'})
+        self.assertEqual(MealPlan.objects.get(user=ned).location, 'Galway')
+    
+    def test_users_without_a_profile_are_skipped(self):
+        no_profile = User.objects.create_user(username='eve', password='secret-pass-123')
+        no_profile.profile.delete()
+        
+        output = self.generate_plans(location='Galway')
+        
+        self.assertFalse(MealPlan.objects.filter(user=no_profile).exists())
+        self.assertIn('Generated 4 meal plans', output)
+    
+    def test_resume_continues_after_checkpoint(self):
+        started_at = timezone.now().isoformat()
+        save_meal_plan(self.users[2], 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'started_at': started_at, 'last_user_id': self.users[0].id, 'plans': 1}, f)
+        
+        with self.assertRaises(CommandError):
+            self.generate_plans()
+        
+        output = self.generate_plans(resume=True)
+        
+        # ava is before the checkpoint and cy was saved after it was written
+        self.assertEqual(MealPlan.objects.filter(user=self.users[1]).count(), 1)
+        self.assertEqual(MealPlan.objects.filter(user=self.users[2]).count(), 1)
+        self.assertFalse(MealPlan.objects.filter(user=self.users[0]).exists())
+        self.assertIn('Resuming after user', output)
+    
+    def test_process_pool_workers(self):
+        # Spawned workers load settings from the environment, not override_settings
+        with mock.patch.dict(os.environ, {'MEAL_PLANNER_MODE': 'local'}):
+            self.generate_plans(workers=2, chunk_size=1)
+        
+        self.assertEqual(MealPlan.objects.count(), 3)
+        self.assertFalse(MealPlan.objects.filter(meals__isnull=True).exists())
+
+
+class MealPlanPersistenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dave', password='secret-pass-123')
+    
+    def test_save_meal_plan_writes_plan_and_meals(self):
+        meal_plan = save_meal_plan(self.user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        
+        self.assertEqual(meal_plan.temperature, WEATHER_DATA['temperature'])
+        self.assertIsNotNone(meal_plan.created_at)
+        self.assertEqual(
+            sorted(meal_plan.meals.values_list('meal_type', flat=True)),
+            ['breakfast', 'dinner', 'lunch', 'snack']
+        )
+    
+    def test_batched_save_uses_constant_queries(self):
+        entry = (self.user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        
+        # Savepoint, plan INSERT, meals INSERT, release - regardless of batch size
+        with self.assertNumQueries(4):
+            save_meal_plans([entry])
+        with self.assertNumQueries(4):
+            meal_plans = save_meal_plans([entry] * 10)
+        
+        self.assertEqual(len({meal_plan.id for meal_plan in meal_plans}), 10)
+        self.assertEqual(Meal.objects.filter(meal_plan__in=meal_plans).count(), 40)
+    
+    def test_failed_meal_insert_rolls_back_plan(self):
+        broken = dict(MEAL_PLAN_DATA, lunch={'name': 'Missing fields'})
+        
+        with self.assertRaises(KeyError):
+            save_meal_plan(self.user, 'Dublin', WEATHER_DATA, FITNESS_DATA, broken)
+        self.assertFalse(MealPlan.objects.filter(user=self.user).exists())
+
+
+class MealPlanQueryCountTests(TestCase):
+    """
+    Reading meal plans must cost a constant number of queries, however many plans
+    or meals are involved (one for the plans with their user, one for all meals)
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='erin', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def create_plans(self, count):
+        entry = (self.user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        return save_meal_plans([entry] * count)
+    
+    def test_list_query_count_is_constant(self):
+        self.create_plans(1)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meal-plans/')
+        self.assertEqual(len(response.data['results']), 1)
+        
+        self.create_plans(9)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meal-plans/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(response.data['results'][0]['meals']), 4)
+        self.assertEqual(response.data['results'][0]['username'], 'erin')
+    
+    def test_latest_query_count(self):
+        self.create_plans(5)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meal-plans/latest/')
+        self.assertEqual(len(response.data['meals']), 4)
+    
+    def test_detail_query_count(self):
+        meal_plan = self.create_plans(3)[0]
+        with self.assertNumQueries(2):
+            self.client.get(f'/api/meal-plans/{meal_plan.id}/')
+    
+    def test_public_meal_plan_query_count(self):
+        meal_plan = self.create_plans(3)[0]
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/public/users/{self.user.id}/meal-plans/{meal_plan.id}/')
+        self.assertEqual(response.data['username'], 'erin')
+
+
+class MealPlanExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='hana', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        entry = (self.user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        self.meal_plans = save_meal_plans([entry] * 5)
+        other = User.objects.create_user(username='ivan')
+        save_meal_plan(other, 'Cork', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+    
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_export_streams_plans_in_chunks(self):
+        response = self.client.get('/api/meal-plans/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        
+        # One plan query, then one meal query per chunk of 2 plans
+        with self.assertNumQueries(4):
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        
+        plans = [json.loads(line) for line in lines]
+        self.assertEqual([plan['id'] for plan in plans], sorted((plan.id for plan in self.meal_plans), reverse=True))
+        self.assertTrue(all(len(plan['meals']) == 4 and plan['username'] == 'hana' for plan in plans))
+    
+    def test_csv_export_has_a_row_per_meal(self):
+        response = self.client.get('/api/meal-plans/export/', {'type': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('meal-plans-hana.csv', response['Content-Disposition'])
+        
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual({row['location'] for row in rows}, {'Dublin'})
+        self.assertEqual(rows[0]['meal_name'], MEAL_PLAN_DATA[rows[0]['meal_meal_type']]['name'])
+    
+    def test_unknown_export_type(self):
+        self.assertEqual(self.client.get('/api/meal-plans/export/', {'type': 'xml'}).status_code, 400)
+
+
+class MealPlanCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        meal_plan_cache.clear_local()
+        self.user = User.objects.create_user(username='gina', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.entry = (self.user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        self.meal_plan = save_meal_plan(*self.entry)
+    
+    def test_latest_is_served_from_cache(self):
+        self.client.get('/api/meal-plans/latest/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/meal-plans/latest/')
+        
+        self.assertEqual(response.data['id'], self.meal_plan.id)
+        self.assertEqual(len(response.data['meals']), 4)
+    
+    def test_new_and_deleted_plans_update_latest(self):
+        self.client.get('/api/meal-plans/latest/')
+        newer = save_meal_plan(*self.entry)
+        self.assertEqual(self.client.get('/api/meal-plans/latest/').data['id'], newer.id)
+        
+        self.client.delete(f'/api/meal-plans/{newer.id}/')
+        self.assertEqual(self.client.get('/api/meal-plans/latest/').data['id'], self.meal_plan.id)
+        
+        self.meal_plan.delete()
+        self.assertEqual(self.client.get('/api/meal-plans/latest/').status_code, 404)
+    
+    def test_save_points_latest_at_new_plan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = save_meal_plan(*self.entry)
+        
+        self.assertEqual(get_latest_meal_plan_id(self.user.id), newer.id)
+        self.assertEqual(self.client.get('/api/meal-plans/latest/').data['id'], newer.id)
+    
+    def test_reader_racing_a_save_keeps_new_plan_latest(self):
+        # A save commits between the reader loading the old plan and caching its id
+        add_latest_meal_plan_id = views.add_latest_meal_plan_id
+        
+        def save_then_add(user_id, meal_plan_id):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.newer = save_meal_plan(*self.entry)
+            add_latest_meal_plan_id(user_id, meal_plan_id)
+        
+        with mock.patch.object(views, 'add_latest_meal_plan_id', side_effect=save_then_add):
+            self.assertEqual(self.client.get('/api/meal-plans/latest/').data['id'], self.meal_plan.id)
+        
+        self.assertEqual(self.client.get('/api/meal-plans/latest/').data['id'], self.newer.id)
+    
+    def test_meal_change_invalidates_cached_plan(self):
+        self.client.get(f'/api/meal-plans/{self.meal_plan.id}/')
+        meal = self.meal_plan.meals.get(meal_type='lunch')
+        meal.name = 'Renamed lunch'
+        meal.save()
+        
+        response = self.client.get(f'/api/meal-plans/{self.meal_plan.id}/meals/{meal.id}/')
+        self.assertEqual(response.data['name'], 'Renamed lunch')
+    
+    def test_etag_revalidation_returns_not_modified(self):
+        response = self.client.get(f'/api/meal-plans/{self.meal_plan.id}/')
+        self.assertIn('private', response['Cache-Control'])
+        
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(f'/api/meal-plans/{self.meal_plan.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+    
+    def test_edited_plan_is_not_revalidated(self):
+        response = self.client.get(f'/api/meal-plans/{self.meal_plan.id}/')
+        self.assertNotIn('Last-Modified', response)
+        
+        self.client.patch(f'/api/meal-plans/{self.meal_plan.id}/', {'location': 'Cork'}, format='json')
+        edited = self.client.get(f'/api/meal-plans/{self.meal_plan.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(edited.status_code, 200)
+        self.assertEqual(edited.data['location'], 'Cork')
+    
+    def test_non_numeric_id_is_not_found(self):
+        self.assertEqual(self.client.get('/api/meal-plans/abc/').status_code, 404)
+    
+    def test_cached_plans_are_scoped_to_owner(self):
+        self.client.get(f'/api/meal-plans/{self.meal_plan.id}/')
+        other = User.objects.create_user(username='hank', password='secret-pass-123')
+        self.client.force_authenticate(other)
+        
+        self.assertEqual(self.client.get(f'/api/meal-plans/{self.meal_plan.id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/meal-plans/{self.meal_plan.id}/meals/').status_code, 404)
+        self.assertEqual(self.client.get('/api/meal-plans/latest/').status_code, 404)
+
+
+class MealPlanListingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='frank', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        entry = (self.user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        self.meal_plans = save_meal_plans([entry] * 5)
+    
+    def test_cursor_pagination_walks_all_plans_newest_first(self):
+        seen = []
+        url = '/api/meal-plans/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen.extend(plan['id'] for plan in response.data['results'])
+            url = response.data['next']
+        
+        self.assertEqual(seen, sorted((plan.id for plan in self.meal_plans), reverse=True))
+    
+    def test_summary_skips_nested_meals(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/meal-plans/?summary=1')
+        
+        plan = response.data['results'][0]
+        self.assertNotIn('meals', plan)
+        self.assertEqual(plan['location'], 'Dublin')
+    
+    def test_fields_and_meal_fields_projection(self):
+        response = self.client.get('/api/meal-plans/?fields=id,created_at,meals&meal_fields=meal_type,name,calories')
+        
+        plan = response.data['results'][0]
+        self.assertEqual(set(plan), {'id', 'created_at', 'meals'})
+        self.assertEqual(set(plan['meals'][0]), {'meal_type', 'name', 'calories'})
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MealPlanViewSet, MealAPIView, PublicMealPlanAPI
-from . import views
+from .views import MealPlanViewSet, MealAPIView, PublicMealPlanAPI, CacheStatsAPI
+from . import views, async_views
 
 # router and register our viewsets
 router = DefaultRouter()
@@ -13,5 +13,11 @@ urlpatterns = [
     path('meal-plans/<int:meal_plan_id>/meals/<int:meal_id>/', MealAPIView.as_view(), name='meal-detail'),
     # Public API endpoint for other applications
     path('public/users/<int:user_id>/meal-plans/<int:meal_plan_id>/', PublicMealPlanAPI.as_view(), name='public-meal-plan'),
+    path('cache-stats/', CacheStatsAPI.as_view(), name='cache-stats'),
+    # Async versions for ASGI deployments (see api/async_views.py)
+    path('async/meal-plans/generate/', async_views.generate_meal_plan, name='async-meal-plan-generate'),
+    path('async/meal-plans/latest/', async_views.latest_meal_plan, name='async-meal-plan-latest'),
+    path('async/meal-plans/<int:meal_plan_id>/meals/', async_views.meals, name='async-meals-list'),
+    path('async/meal-plans/<int:meal_plan_id>/meals/<int:meal_id>/', async_views.meals, name='async-meal-detail'),
     #path('test/', views.test_api, name='test-api'),
 ]
\ No newline at end of file
@@ -1,13 +1,64 @@
+import logging
 from rest_framework import viewsets, status, generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import action
+from rest_framework.reverse import reverse
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import MealPlan, Meal
-from .serializers import MealPlanSerializer, MealSerializer
-from .tasks import generate_meal_plan_task
+from django.utils.cache import get_conditional_response, patch_cache_control
+from .models import MealPlan, Meal, MealPlanJob
+from .serializers import MealPlanSerializer, MealSerializer, MealPlanJobSerializer
+from .tasks import generate_meal_plan_task, generate_meal_plan_job
 from .services import get_weather_data, get_fitness_data, generate_meal_plan
+from .cache import get_cache_stats
+from .export import EXPORT_FORMATS, export_meal_plans
+from .idempotency import (
+    get_generate_request_keys, find_generate_result, reserve_generate_request,
+    release_generate_request, remember_generate_result
+)
+from .pagination import MealPlanCursorPagination
+from .plan_cache import (
+    get_meal_plan_entry, set_meal_plan_entry, get_latest_meal_plan_id, set_latest_meal_plan_id,
+    add_latest_meal_plan_id, NO_MEAL_PLAN
+)
+
+logger = logging.getLogger(__name__)
+
+def get_user_meal_plan_entry(user, meal_plan_id):
+    """
+    Return the cached serialized meal plan if it belongs to user, otherwise None
+    """
+    def load():
+        meal_plan = MealPlan.objects.select_related('user').prefetch_related('meals').filter(id=meal_plan_id).first()
+        if meal_plan is None:
+            return None
+        return MealPlanSerializer(meal_plan).data
+    
+    entry = get_meal_plan_entry(meal_plan_id, load)
+    if entry is None or entry['data']['user'] != user.id:
+        return None
+    return entry
+
+def cached_response(request, entry, data, response_class=Response):
+    """
+    Response for data from a cached meal plan entry, with an ETag validator;
+    304 Not Modified if the client's copy is still current
+    
+    There is no Last-Modified: plans can be edited and have no updated timestamp,
+    so only the content hash tells whether a copy is current.
+    """
+    response = get_conditional_response(request, etag=entry['etag'])
+    if response is None:
+        response = response_class(data)
+    
+    response['ETag'] = entry['etag']
+    # Let browsers keep the body but revalidate before each use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 class MealPlanViewSet(viewsets.ModelViewSet):
     """
@@ -15,21 +66,105 @@ class MealPlanViewSet(viewsets.ModelViewSet):
     """
     serializer_class = MealPlanSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MealPlanCursorPagination
+    
+    # Plan fields returned with ?summary=1 (no nested meals)
+    SUMMARY_FIELDS = ['id', 'user', 'username', 'created_at', 'location',
+                      'temperature', 'weather_condition', 'calories_burned', 'steps']
+    
+    def get_projection(self):
+        """
+        Return the (fields, meal_fields) requested through ?summary=1,
+        ?fields=a,b and ?meal_fields=c,d, or None for each when not limited
+        """
+        if self.request.method != 'GET':
+            return None, None
+        
+        params = self.request.query_params
+        fields = meal_fields = None
+        
+        if params.get('summary') in ('1', 'true'):
+            fields = self.SUMMARY_FIELDS
+        elif params.get('fields'):
+            fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+        
+        if params.get('meal_fields'):
+            meal_fields = [field.strip() for field in params['meal_fields'].split(',') if field.strip()]
+        
+        return fields, meal_fields
     
     def get_queryset(self):
         """
         This view returns meal plans for the currently authenticated user
         """
         user = self.request.user
-        return MealPlan.objects.filter(user=user).order_by('-created_at')
+        fields, meal_fields = self.get_projection()
+        queryset = MealPlan.objects.filter(user=user).select_related('user').order_by('-created_at')
+        
+        if fields is None or 'meals' in fields:
+            # Load all nested meals up front instead of once per plan, skipping
+            # columns (e.g. ingredients, preparation) that weren't asked for
+            meals = Meal.objects.all()
+            if meal_fields is not None:
+                valid_fields = {field.name for field in Meal._meta.get_fields()}
+                meals = meals.only('meal_plan', *(set(meal_fields) & valid_fields))
+            queryset = queryset.prefetch_related(Prefetch('meals', queryset=meals))
+        
+        return queryset
+    
+    def get_serializer(self, *args, **kwargs):
+        fields, meal_fields = self.get_projection()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if meal_fields is not None:
+            kwargs.setdefault('meal_fields', meal_fields)
+        return super().get_serializer(*args, **kwargs)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Get a meal plan, served from the meal plan cache unless fields are projected
+        """
+        if self.get_projection() != (None, None):
+            return super().retrieve(request, *args, **kwargs)
+        
+        try:
+            meal_plan_id = int(kwargs['pk'])
+        except ValueError:
+            raise Http404
+        
+        entry = get_user_meal_plan_entry(request.user, meal_plan_id)
+        if entry is None:
+            raise Http404
+        return cached_response(request, entry, entry['data'])
+    
+    def generated_response(self, meal_plan_id, warnings, headers=None):
+        return Response({
+            'message': 'Meal plan generated successfully',
+            'meal_plan_id': meal_plan_id,
+            'warnings': warnings
+        }, status=status.HTTP_201_CREATED, headers=headers)
+    
+    def job_response(self, job, headers=None):
+        return Response({
+            'message': 'Meal plan generation started',
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': reverse('meal-plan-job-status', kwargs={'job_id': job.id}, request=self.request)
+        }, status=status.HTTP_202_ACCEPTED, headers=headers)
+    
     @action(detail=False, methods=['post'])
     def generate(self, request):
         """
         Generate a new meal plan based on user location and fitness data
+        
+        Repeating a request (same location, manual fitness data and profile) within
+        MEAL_PLAN_GENERATE_WINDOW seconds, or retrying with the same Idempotency-Key
+        header, returns the earlier meal plan (or job) instead of generating another.
+        A retry while the first request is still generating gets 409, and reusing a
+        key for a different request 422.
         """
         location = request.data.get('location')
         if not location:
@@ -41,6 +176,42 @@ class MealPlanViewSet(viewsets.ModelViewSet):
         # Check if manual fitness data was provided
         manual_fitness_data = request.data.get('manual_fitness_data')
         
+        request_keys = get_generate_request_keys(
+            request.user, location, manual_fitness_data,
+            idempotency_key=request.headers.get('Idempotency-Key')
+        )
+        previous = find_generate_result(request.user, request_keys)
+        if previous is not None:
+            headers = {'Idempotent-Replayed': 'true'}
+            if 'job' in previous:
+                return self.job_response(previous['job'], headers=headers)
+            return self.generated_response(previous['meal_plan_id'], previous['warnings'], headers=headers)
+        reserve_generate_request(request_keys)
+        
+        run_async = request.data.get('async', settings.MEAL_PLAN_ASYNC_GENERATION)
+        if str(run_async).lower() in ('1', 'true', 'yes'):
+            # Queue the generation as a Celery job and let the client poll for the result
+            job = MealPlanJob.objects.create(
+                user=request.user,
+                location=location,
+                manual_fitness_data=manual_fitness_data
+            )
+            try:
+                generate_meal_plan_job.delay(str(job.id))
+            except Exception as e:
+                # e.g. the broker is down: don't leave a job that will never run as pending
+                logger.error(f"Could not queue meal plan job {job.id}: {str(e)}")
+                job.status = 'failed'
+                job.save(update_fields=['status', 'updated_at'])
+                release_generate_request(request_keys)
+                return Response({
+                    'error': 'Meal plan generation is temporarily unavailable. Please try again later.'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            remember_generate_result(request_keys, job_id=job.id)
+            job.refresh_from_db()
+            
+            return self.job_response(job)
+        
         # Run synchronously instead of as a Celery task
         result = generate_meal_plan_task(
             request.user.id, 
@@ -49,6 +220,7 @@ class MealPlanViewSet(viewsets.ModelViewSet):
         )
         
         if not result:
+            release_generate_request(request_keys)
             return Response({
                 'error': 'Failed to generate meal plan'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -57,30 +229,79 @@ class MealPlanViewSet(viewsets.ModelViewSet):
         warnings = result.get('warnings', [])
         
         if meal_plan_id:
-            return Response({
-                'message': 'Meal plan generated successfully',
-                'meal_plan_id': meal_plan_id,
-                'warnings': warnings
-            }, status=status.HTTP_201_CREATED)
+            remember_generate_result(request_keys, meal_plan_id=meal_plan_id, warnings=warnings)
+            return self.generated_response(meal_plan_id, warnings)
         else:
+            release_generate_request(request_keys)
             return Response({
                 'error': 'Failed to generate meal plan',
                 'warnings': warnings
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})', url_name='job-status')
+    def job_status(self, request, job_id=None):
+        """
+        Get the status of a queued meal plan generation job
+        """
+        job = get_object_or_404(MealPlanJob, id=job_id, user=request.user)
+        serializer = MealPlanJobSerializer(job)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the user's whole meal plan history as NDJSON (default) or ?type=csv
+        """
+        export_format = request.query_params.get('type', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({
+                'error': f"Export type must be one of: {', '.join(EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(export_meal_plans(request.user, export_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="meal-plans-{request.user.username}.{extension}"'
+        return response
+    
     @action(detail=False, methods=['get'])
     def latest(self, request):
         """
         Get the latest meal plan for the current user
         """
-        try:
-            meal_plan = MealPlan.objects.filter(user=request.user).latest('created_at')
-            serializer = self.get_serializer(meal_plan)
-            return Response(serializer.data)
-        except MealPlan.DoesNotExist:
-            return Response({
-                'message': 'No meal plans found for this user'
-            }, status=status.HTTP_404_NOT_FOUND)
+        if self.get_projection() != (None, None):
+            try:
+                meal_plan = self.get_queryset().latest('created_at')
+                serializer = self.get_serializer(meal_plan)
+                return Response(serializer.data)
+            except MealPlan.DoesNotExist:
+                return self.no_meal_plans_response()
+        
+        meal_plan_id = get_latest_meal_plan_id(request.user.id)
+        if meal_plan_id == NO_MEAL_PLAN:
+            return self.no_meal_plans_response()
+        if meal_plan_id is not None:
+            entry = get_user_meal_plan_entry(request.user, meal_plan_id)
+            if entry is not None:
+                return cached_response(request, entry, entry['data'])
+        
+        # Not cached (or the cached id's plan is gone): load the latest plan with its
+        # meals and cache both the id and the plan. A missing id is only added, so a
+        # newer one stored by a save that committed meanwhile isn't overwritten.
+        meal_plan = self.get_queryset().order_by('-created_at', '-id').first()
+        if meal_plan_id is None:
+            add_latest_meal_plan_id(request.user.id, meal_plan.id if meal_plan else None)
+        else:
+            set_latest_meal_plan_id(request.user.id, meal_plan.id if meal_plan else None)
+        if meal_plan is None:
+            return self.no_meal_plans_response()
+        
+        entry = set_meal_plan_entry(meal_plan.id, self.get_serializer(meal_plan).data)
+        return cached_response(request, entry, entry['data'])
+    
+    def no_meal_plans_response(self):
+        return Response({
+            'message': 'No meal plans found for this user'
+        }, status=status.HTTP_404_NOT_FOUND)
 
 class MealAPIView(APIView):
     """
@@ -89,19 +310,21 @@ class MealAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, meal_plan_id, meal_id=None):
-        # Check if the meal plan belongs to the current user
-        meal_plan = get_object_or_404(MealPlan, id=meal_plan_id, user=request.user)
+        # Meals are read from the cached meal plan, which also checks it belongs to the current user
+        entry = get_user_meal_plan_entry(request.user, meal_plan_id)
+        if entry is None:
+            raise Http404
+        meals = entry['data']['meals']
         
         if meal_id:
             # Get a specific meal
-            meal = get_object_or_404(Meal, id=meal_id, meal_plan=meal_plan)
-            serializer = MealSerializer(meal)
-            return Response(serializer.data)
+            meal = next((meal for meal in meals if meal['id'] == meal_id), None)
+            if meal is None:
+                raise Http404
+            return cached_response(request, entry, meal)
         else:
             # Get all meals for the meal plan
-            meals = Meal.objects.filter(meal_plan=meal_plan)
-            serializer = MealSerializer(meals, many=True)
-            return Response(serializer.data)
+            return cached_response(request, entry, meals)
 
 # Public API for other applications to access meal plans
 class PublicMealPlanAPI(generics.RetrieveAPIView):
@@ -117,4 +340,14 @@ class PublicMealPlanAPI(generics.RetrieveAPIView):
         user_id = self.kwargs.get('user_id')
         meal_plan_id = self.kwargs.get('meal_plan_id')
         
-        return get_object_or_404(MealPlan, id=meal_plan_id, user__id=user_id)
\ No newline at end of file
+        queryset = MealPlan.objects.select_related('user').prefetch_related('meals')
+        return get_object_or_404(queryset, id=meal_plan_id, user__id=user_id)
+
+class CacheStatsAPI(APIView):
+    """
+    Hit/miss counters for the in-process caches of this worker (staff only)
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response(get_cache_stats())
@@ -0,0 +1,134 @@
+"""
+Load test per-request latency with and without persistent database connections
+
+Creates a throwaway test database with a few users and meal plans, then sends
+requests for the meal plan list through the Django test client from several
+threads (like WSGI worker threads), once per CONN_MAX_AGE setting. The test
+client disconnects close_old_connections() from the request_started/
+request_finished signals, so each worker calls it around every request the way
+those handlers do in production; the difference is the cost of connecting per
+request. The number of connections opened in each run is reported too.
+
+Point it at a local Postgres with the same variables as production, e.g.
+    RDS_HOSTNAME=localhost RDS_PORT=5432 RDS_DB_NAME=dietplanner \\
+    RDS_USERNAME=postgres RDS_PASSWORD=postgres \\
+    python benchmarks/db_connections.py [--threads 8] [--requests 200]
+(from the backend directory). Against SQLite connecting is almost free.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dietplanner.settings')
+
+import django
+django.setup()
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from api.services import save_meal_plans
+
+WEATHER_DATA = {'temperature': 15.0, 'weather_condition': 'Clouds', 'humidity': 70}
+FITNESS_DATA = {'calories_burned': 400, 'steps': 7000, 'active_minutes': 35}
+MEAL_PLAN_DATA = {
+    meal_type: {
+        'name': f'Benchmark {meal_type}',
+        'description': 'Seeded meal',
+        'calories': 500,
+        'protein': 25.0,
+        'carbs': 50.0,
+        'fat': 15.0,
+        'ingredients': 'Ingredient list',
+        'preparation': 'Preparation steps'
+    }
+    for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']
+}
+
+
+opened_connections = []
+
+
+def count_connection(sender, connection, **kwargs):
+    opened_connections.append(connection.alias)
+
+
+def seed(users):
+    tokens = []
+    for i in range(users):
+        user = User.objects.create_user(username=f'bench-{i}')
+        save_meal_plans([(user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)] * 5)
+        tokens.append(Token.objects.create(user=user).key)
+    return tokens
+
+
+def worker(token, requests, samples):
+    client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+    for _ in range(requests):
+        start = time.perf_counter()
+        # What the request_started/request_finished handlers do under WSGI
+        close_old_connections()
+        response = client.get('/api/meal-plans/')
+        close_old_connections()
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    # Persistent connections belong to the worker thread
+    connections.close_all()
+
+
+def run(label, conn_max_age, tokens, threads, requests):
+    connections.settings['default']['CONN_MAX_AGE'] = conn_max_age
+    opened_connections.clear()
+    samples = []
+    workers = [
+        threading.Thread(target=worker, args=(tokens[i % len(tokens)], requests, samples))
+        for i in range(threads)
+    ]
+    
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    samples.sort()
+    print(f"{label:<28} mean {statistics.mean(samples):7.2f} ms   p50 {samples[len(samples) // 2]:7.2f} ms   "
+          f"p95 {samples[int(len(samples) * 0.95)]:7.2f} ms   {len(samples) / elapsed:7.1f} req/s   "
+          f"{len(opened_connections)} connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8, help='concurrent worker threads')
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    parser.add_argument('--conn-max-age', type=int, default=60, help='CONN_MAX_AGE for the persistent run')
+    args = parser.parse_args()
+    
+    print(f"Database: {connection.vendor} ({connection.settings_dict.get('HOST') or connection.settings_dict['NAME']}), "
+          f"{args.threads} threads x {args.requests} requests\n")
+    
+    connection_created.connect(count_connection)
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # Django never closes in-memory SQLite test databases, so use a file
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        tokens = seed(args.threads)
+        connection.close()
+        run('connect per request', 0, tokens, args.threads, args.requests)
+        run(f'persistent ({args.conn_max_age}s)', args.conn_max_age, tokens, args.threads, args.requests)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
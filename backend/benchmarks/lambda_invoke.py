@@ -0,0 +1,85 @@
+"""
+Benchmark meal planner invocation modes
+
+Compares building a new boto3 Lambda client per call (the old behaviour) with
+the shared process-wide client, and times the in-process 'local' mode.
+Pass --remote to also time real RequestResponse invokes (needs AWS credentials).
+
+Usage (from the backend directory):
+    python benchmarks/lambda_invoke.py [--iterations 200] [--remote]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dietplanner.settings')
+
+import django
+django.setup()
+
+import boto3
+from django.conf import settings
+from django.test.utils import override_settings
+from api import lambda_client
+
+PAYLOAD = {
+    'user_data': {
+        'age': 30,
+        'gender': 'female',
+        'height': 165,
+        'weight': 60,
+        'activity_level': 'moderate',
+        'dietary_preference': 'omnivore',
+        'allergies': []
+    },
+    'weather_data': {'temperature': 14.0, 'weather_condition': 'Rain', 'humidity': 80},
+    'fitness_data': {'calories_burned': 450, 'steps': 9000, 'active_minutes': 40}
+}
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<38} mean {statistics.mean(samples):8.3f} ms   "
+          f"p50 {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--remote', action='store_true', help='also time real Lambda invokes')
+    args = parser.parse_args()
+    
+    print(f"Iterations: {args.iterations}\n")
+    
+    report('new boto3 client per call', timed(
+        lambda: boto3.client('lambda', region_name=settings.AWS_REGION), args.iterations))
+    
+    lambda_client.get_lambda_client()
+    report('shared client (get_lambda_client)', timed(lambda_client.get_lambda_client, args.iterations))
+    
+    with override_settings(MEAL_PLANNER_MODE='local'):
+        lambda_client.load_meal_planner_module()
+        report('local mode invoke', timed(
+            lambda: lambda_client.invoke_meal_planner(PAYLOAD), args.iterations))
+    
+    if args.remote:
+        with override_settings(MEAL_PLANNER_MODE='lambda'):
+            report('lambda mode invoke (shared client)', timed(
+                lambda: lambda_client.invoke_meal_planner(PAYLOAD), args.iterations))
+
+
+if __name__ == '__main__':
+    main()
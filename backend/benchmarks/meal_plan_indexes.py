@@ -0,0 +1,123 @@
+"""
+Benchmark the composite meal plan indexes
+
+Seeds a throwaway test database with many users, plans and meals, then shows
+the query plan and timings of the hot meal plan queries with the composite
+indexes from api/migrations/0003_meal_plan_indexes.py and again without them.
+
+Usage (from the backend directory; uses the configured database engine):
+    python benchmarks/meal_plan_indexes.py [--users 200] [--plans 100] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dietplanner.settings')
+
+import django
+django.setup()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from api.models import MealPlan, Meal
+from api.services import save_meal_plans
+
+WEATHER_DATA = {'temperature': 15.0, 'weather_condition': 'Clouds', 'humidity': 70}
+FITNESS_DATA = {'calories_burned': 400, 'steps': 7000, 'active_minutes': 35}
+MEAL_PLAN_DATA = {
+    meal_type: {
+        'name': f'Benchmark {meal_type}',
+        'description': 'Seeded meal',
+        'calories': 500,
+        'protein': 25.0,
+        'carbs': 50.0,
+        'fat': 15.0,
+        'ingredients': 'Ingredient list ' * 10,
+        'preparation': 'Preparation steps ' * 20
+    }
+    for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']
+}
+
+
+def seed(users, plans_per_user):
+    print(f"Seeding {users} users x {plans_per_user} plans...")
+    start = time.perf_counter()
+    User.objects.bulk_create([User(username=f'bench-{i}') for i in range(users)], batch_size=1000)
+    
+    for user in User.objects.filter(username__startswith='bench-'):
+        entry = (user, 'Dublin', WEATHER_DATA, FITNESS_DATA, MEAL_PLAN_DATA)
+        save_meal_plans([entry] * plans_per_user)
+    
+    print(f"Seeded {MealPlan.objects.count()} plans and {Meal.objects.count()} meals "
+          f"in {time.perf_counter() - start:.1f}s\n")
+
+
+def hot_queries():
+    user_ids = list(User.objects.filter(username__startswith='bench-').values_list('id', flat=True))
+    plan_ids = list(MealPlan.objects.values_list('id', flat=True)[:1000])
+    
+    return {
+        'list page (user, -created_at)': lambda: list(
+            MealPlan.objects.filter(user_id=random.choice(user_ids)).order_by('-created_at', '-id')[:20]),
+        'latest plan': lambda: MealPlan.objects.filter(user_id=random.choice(user_ids)).latest('created_at'),
+        'meal by plan and type': lambda: list(
+            Meal.objects.filter(meal_plan_id=random.choice(plan_ids), meal_type='lunch')),
+    }
+
+
+def explain_queries():
+    user_id = User.objects.filter(username__startswith='bench-').values_list('id', flat=True).first()
+    plan_id = MealPlan.objects.values_list('id', flat=True).first()
+    
+    return {
+        'list page (user, -created_at)':
+            MealPlan.objects.filter(user_id=user_id).order_by('-created_at', '-id')[:20],
+        'latest plan': MealPlan.objects.filter(user_id=user_id).order_by('-created_at')[:1],
+        'meal by plan and type': Meal.objects.filter(meal_plan_id=plan_id, meal_type='lunch'),
+    }
+
+
+def run(label, repeat):
+    print(f"=== {label}")
+    for name, queryset in explain_queries().items():
+        print(f"-- {name}\n{queryset.explain()}")
+    
+    print()
+    for name, query in hot_queries().items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<32} mean {statistics.mean(samples):7.3f} ms   p50 {statistics.median(samples):7.3f} ms")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--plans', type=int, default=100, help='plans per user')
+    parser.add_argument('--repeat', type=int, default=200, help='timed runs per query')
+    args = parser.parse_args()
+    
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.users, args.plans)
+        run('with composite indexes', args.repeat)
+        
+        with connection.schema_editor() as editor:
+            for model in (MealPlan, Meal):
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+        run('without composite indexes', args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark the NumPy nutrition engine against the scalar meal planner functions
+
+Generates synthetic users, computes daily calorie targets and per-meal macros
+with both engines, checks the rounded results are identical and reports timings.
+
+Usage (from the backend directory):
+    python benchmarks/nutrition_engine.py [--users 100000] [--seed 42]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dietplanner.settings')
+
+import django
+django.setup()
+
+from api import lambda_client
+
+
+def make_entries(count, rng):
+    activity_levels = ['sedentary', 'light', 'moderate', 'active', 'very_active']
+    return [
+        (
+            {
+                'age': rng.randint(18, 80),
+                'gender': rng.choice(['male', 'female']),
+                'height': round(rng.uniform(150, 200), 1),
+                'weight': round(rng.uniform(45, 130), 1),
+                'activity_level': rng.choice(activity_levels),
+            },
+            {'temperature': round(rng.uniform(-10, 40), 1)},
+            {'steps': rng.randint(0, 20000), 'calories_burned': rng.randint(0, 900)},
+        )
+        for _ in range(count)
+    ]
+
+
+def scalar_macros(planner, entries):
+    results = []
+    for user_data, weather_data, fitness_data in entries:
+        calories = planner.get_base_calorie_needs(user_data)
+        calories *= planner.get_activity_multiplier(user_data.get('activity_level', 'moderate'))
+        calories, _ = planner.adjust_for_weather(calories, weather_data)
+        calories, protein_ratio = planner.adjust_for_fitness(calories, fitness_data)
+        
+        row = []
+        for meal_type in planner.MEAL_TYPES:
+            carb_ratio = planner.get_carb_ratio(meal_type)
+            meal_calories = calories * planner.MEAL_CALORIE_DISTRIBUTION[meal_type]
+            row.append((
+                round(meal_calories),
+                round((meal_calories * protein_ratio) / 4, 1),
+                round((meal_calories * carb_ratio) / 4, 1),
+                round((meal_calories * (1 - protein_ratio - carb_ratio)) / 9, 1),
+            ))
+        results.append(row)
+    return results
+
+
+def vectorized_macros(planner, entries):
+    user_data, weather_data, fitness_data = (list(column) for column in zip(*entries))
+    _, _, macros, _ = planner.nutrition.compute_nutrition(user_data, weather_data, fitness_data)
+    columns = [
+        [macros[meal_type][key].tolist() for key in ('calories', 'protein', 'carbs', 'fat')]
+        for meal_type in planner.MEAL_TYPES
+    ]
+    return [
+        [
+            (round(calories[i]), round(protein[i], 1), round(carbs[i], 1), round(fat[i], 1))
+            for calories, protein, carbs, fat in columns
+        ]
+        for i in range(len(entries))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    planner = lambda_client.load_meal_planner_module()
+    if planner.nutrition.np is None:
+        sys.exit('NumPy is not installed')
+    
+    entries = make_entries(args.users, random.Random(args.seed))
+    
+    start = time.perf_counter()
+    expected = scalar_macros(planner, entries)
+    scalar_seconds = time.perf_counter() - start
+    
+    user_data, weather_data, fitness_data = (list(column) for column in zip(*entries))
+    start = time.perf_counter()
+    planner.nutrition.compute_nutrition(user_data, weather_data, fitness_data)
+    compute_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    actual = vectorized_macros(planner, entries)
+    vectorized_seconds = time.perf_counter() - start
+    
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"users:      {args.users}")
+    print(f"scalar:     {scalar_seconds:.3f}s")
+    print(f"numpy:      {vectorized_seconds:.3f}s ({scalar_seconds / vectorized_seconds:.1f}x, "
+          f"{compute_seconds:.3f}s of it array maths, the rest is building inputs and rounding)")
+    print(f"mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,4 @@
-# Simplified initialization without Celery
\ No newline at end of file
+# Load the Celery app so that @shared_task uses the Django-configured broker
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
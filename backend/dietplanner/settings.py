@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
 from pathlib import Path
+from celery.schedules import crontab
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -81,6 +83,11 @@ WSGI_APPLICATION = 'dietplanner.wsgi.application'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
 if 'RDS_HOSTNAME' in os.environ:
+    # How connections are reused: 'persistent' keeps each worker's connection open
+    # for DB_CONN_MAX_AGE seconds, 'pgbouncer' does the same against a transaction
+    # pooling PgBouncer/RDS Proxy in front of RDS, 'off' connects per request
+    DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'persistent')
+    
     # Production database configuration for Elastic Beanstalk
     DATABASES = {
         'default': {
@@ -90,6 +97,15 @@ if 'RDS_HOSTNAME' in os.environ:
             'PASSWORD': os.environ['RDS_PASSWORD'],
             'HOST': os.environ['RDS_HOSTNAME'],
             'PORT': os.environ['RDS_PORT'],
+            'CONN_MAX_AGE': 0 if DB_POOL_MODE == 'off' else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            # Check reused connections before each request so a dropped one is replaced
+            # instead of failing the request
+            'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+            # Server side cursors don't survive transaction pooling
+            'DISABLE_SERVER_SIDE_CURSORS': DB_POOL_MODE == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+            },
         }
     }
 else:
@@ -101,6 +117,24 @@ else:
         }
     }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+if 'CACHE_REDIS_URL' in os.environ:
+    # Shared cache so all workers see the same cached upstream data
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -130,7 +164,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -138,6 +172,14 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Auth tokens expire this many seconds after they are issued (0 = never)
+TOKEN_EXPIRY = int(os.environ.get('TOKEN_EXPIRY', '0'))
+# Token lookups are cached in the shared cache and, for a shorter time, in-process
+# (a revoked token can still work on other workers for up to TOKEN_AUTH_LOCAL_TTL)
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', '300'))
+TOKEN_AUTH_LOCAL_TTL = int(os.environ.get('TOKEN_AUTH_LOCAL_TTL', '30'))
+TOKEN_AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_AUTH_CACHE_MAX_ENTRIES', '4096'))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Set to False for production
 CORS_ALLOWED_ORIGINS = [
@@ -146,16 +188,65 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # Celery settings
-CELERY_BROKER_URL = os.environ.get('CELERY_BROKER', 'memory://')
-CELERY_RESULT_BACKEND = os.environ.get('CELERY_BACKEND', 'cache')
-CELERY_CACHE_BACKEND = 'memory'
-# Celery settings
-CELERY_BROKER_URL = 'redis://localhost:6379/0' 
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_BACKEND', 'redis://localhost:6379/0')
+# Job progress is tracked on MealPlanJob rows, so task return values are not stored
+CELERY_TASK_IGNORE_RESULT = True
+# Run tasks inline (no broker needed) - useful for local development and tests
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+
+# Cache prewarming ahead of the morning peak, run by Celery beat (celery -A dietplanner beat).
+# Every PREWARM_WEATHER_INTERVAL minutes during PREWARM_HOURS (UTC, crontab syntax) the
+# weather of profile locations with less than PREWARM_WEATHER_MIN_TTL seconds left
+# is refreshed, PREWARM_CONCURRENCY fetches at a time and using at most
+# PREWARM_WEATHER_BUDGET_SHARE of the weather API budget (PROVIDER_RATE_LIMITS), so
+# users' own lookups still get through. With PREWARM_MEAL_PLANS, today's
+# plans for users active in the last PREWARM_ACTIVE_DAYS days are memoized daily at
+# PREWARM_MEAL_PLANS_HOUR.
+PREWARM_HOURS = os.environ.get('PREWARM_HOURS', '5-9')
+PREWARM_WEATHER_INTERVAL = int(os.environ.get('PREWARM_WEATHER_INTERVAL', '5'))
+PREWARM_WEATHER_MIN_TTL = int(os.environ.get('PREWARM_WEATHER_MIN_TTL', str(PREWARM_WEATHER_INTERVAL * 60 + 60)))
+PREWARM_CONCURRENCY = int(os.environ.get('PREWARM_CONCURRENCY', '8'))
+PREWARM_WEATHER_BUDGET_SHARE = float(os.environ.get('PREWARM_WEATHER_BUDGET_SHARE', '0.5'))
+PREWARM_MEAL_PLANS = os.environ.get('PREWARM_MEAL_PLANS', 'False') == 'True'
+PREWARM_MEAL_PLANS_HOUR = int(os.environ.get('PREWARM_MEAL_PLANS_HOUR', '5'))
+PREWARM_ACTIVE_DAYS = int(os.environ.get('PREWARM_ACTIVE_DAYS', '7'))
+
+CELERY_BEAT_SCHEDULE = {
+    'prewarm-weather': {
+        'task': 'api.tasks.prewarm_weather_task',
+        'schedule': crontab(minute=f'*/{PREWARM_WEATHER_INTERVAL}', hour=PREWARM_HOURS),
+    },
+}
+if PREWARM_MEAL_PLANS:
+    CELERY_BEAT_SCHEDULE['prewarm-meal-plans'] = {
+        'task': 'api.tasks.prewarm_meal_plans_task',
+        'schedule': crontab(minute=0, hour=PREWARM_MEAL_PLANS_HOUR),
+    }
+
+# Queue meal plan generation as a Celery job and return 202 with a job id
+MEAL_PLAN_ASYNC_GENERATION = os.environ.get('MEAL_PLAN_ASYNC_GENERATION', 'False') == 'True'
+# Identical generate requests within this many seconds return the earlier meal plan,
+# and results are kept this long for requests sent with an Idempotency-Key header
+MEAL_PLAN_GENERATE_WINDOW = int(os.environ.get('MEAL_PLAN_GENERATE_WINDOW', '60'))
+MEAL_PLAN_IDEMPOTENCY_KEY_TTL = int(os.environ.get('MEAL_PLAN_IDEMPOTENCY_KEY_TTL', '86400'))
+# An Idempotency-Key is claimed while its request generates, for at most this many seconds
+MEAL_PLAN_IDEMPOTENCY_LOCK_TTL = int(os.environ.get('MEAL_PLAN_IDEMPOTENCY_LOCK_TTL', '300'))
 
 # AWS settings
 AWS_REGION = os.environ.get('AWS_REGION', 'eu-west-1')  # Your region
 AWS_LAMBDA_FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'x23293519_fitness_meal')
+AWS_LAMBDA_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_LAMBDA_MAX_POOL_CONNECTIONS', '20'))
+AWS_LAMBDA_CONNECT_TIMEOUT = float(os.environ.get('AWS_LAMBDA_CONNECT_TIMEOUT', '2'))
+AWS_LAMBDA_READ_TIMEOUT = float(os.environ.get('AWS_LAMBDA_READ_TIMEOUT', '10'))
+AWS_LAMBDA_MAX_ATTEMPTS = int(os.environ.get('AWS_LAMBDA_MAX_ATTEMPTS', '3'))
+
+# Meal planner execution: 'lambda' invokes the AWS Lambda function, 'local' calls
+# lambda_function.lambda_handler in-process (local development and tests)
+MEAL_PLANNER_MODE = os.environ.get('MEAL_PLANNER_MODE', 'lambda')
+MEAL_PLANNER_LOCAL_PATH = os.environ.get('MEAL_PLANNER_LOCAL_PATH', str(BASE_DIR.parent / 'lambda' / 'meal_planner'))
+# Users per meal planner invocation for bulk generation
+MEAL_PLANNER_BATCH_SIZE = int(os.environ.get('MEAL_PLANNER_BATCH_SIZE', '200'))
 
 
 # API Keys
@@ -163,6 +254,76 @@ WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', '')
 FITNESS_API_URL = os.environ.get('FITNESS_API_URL', 'https://l734p4kw4i.execute-api.eu-west-1.amazonaws.com/Prod')
 FITNESS_API_KEY = os.environ.get('FITNESS_API_KEY', '')
 
+# Fitness API flavour: 'daily' fetches /fitness/<id>/daily per user, 'roster' fetches
+# the whole member list (at most every FITNESS_ROSTER_TTL seconds, refreshed in the
+# background for FITNESS_ROSTER_STALE_TTL more) and looks members up in memory
+FITNESS_API_MODE = os.environ.get('FITNESS_API_MODE', 'daily')
+FITNESS_ROSTER_URL = os.environ.get('FITNESS_ROSTER_URL', FITNESS_API_URL)
+FITNESS_ROSTER_TTL = int(os.environ.get('FITNESS_ROSTER_TTL', '300'))
+FITNESS_ROSTER_STALE_TTL = int(os.environ.get('FITNESS_ROSTER_STALE_TTL', '600'))
+FITNESS_ROSTER_RETRY_INTERVAL = int(os.environ.get('FITNESS_ROSTER_RETRY_INTERVAL', '30'))
+
+# HTTP clients for upstream providers: pooled keep-alive connections, timeouts (seconds),
+# retries with jittered backoff and a circuit breaker that falls back to default values
+PROVIDER_POOL_MAXSIZE = int(os.environ.get('PROVIDER_POOL_MAXSIZE', '10'))
+PROVIDER_CONNECT_TIMEOUT = float(os.environ.get('PROVIDER_CONNECT_TIMEOUT', '3.05'))
+PROVIDER_READ_TIMEOUT = float(os.environ.get('PROVIDER_READ_TIMEOUT', '5'))
+PROVIDER_MAX_RETRIES = int(os.environ.get('PROVIDER_MAX_RETRIES', '2'))
+PROVIDER_BACKOFF_BASE = float(os.environ.get('PROVIDER_BACKOFF_BASE', '0.2'))
+PROVIDER_BACKOFF_MAX = float(os.environ.get('PROVIDER_BACKOFF_MAX', '2'))
+PROVIDER_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('PROVIDER_BREAKER_FAILURE_THRESHOLD', '5'))
+PROVIDER_BREAKER_RESET_TIMEOUT = float(os.environ.get('PROVIDER_BREAKER_RESET_TIMEOUT', '30'))
+
+# Client-side request budgets per provider as (calls per second, burst), shared by all
+# workers through the cache (0 = unlimited). The weather default matches the
+# OpenWeatherMap free tier of 60 calls a minute. Calls over budget wait up to
+# PROVIDER_RATE_LIMIT_MAX_WAIT seconds, then fall back to cached or default data
+PROVIDER_RATE_LIMITS = {
+    'weather': (float(os.environ.get('WEATHER_RATE_LIMIT', '1')), int(os.environ.get('WEATHER_RATE_LIMIT_BURST', '60'))),
+    'fitness': (float(os.environ.get('FITNESS_RATE_LIMIT', '0')), int(os.environ.get('FITNESS_RATE_LIMIT_BURST', '10'))),
+}
+PROVIDER_RATE_LIMIT_MAX_WAIT = float(os.environ.get('PROVIDER_RATE_LIMIT_MAX_WAIT', '1'))
+
+# Weather and fitness lookups run concurrently, each within its own timeout budget (seconds)
+CONTEXT_PROVIDER_TIMEOUTS = {
+    'weather': float(os.environ.get('WEATHER_PROVIDER_TIMEOUT', '5')),
+    'fitness': float(os.environ.get('FITNESS_PROVIDER_TIMEOUT', '5')),
+}
+CONTEXT_PROVIDER_MAX_WORKERS = int(os.environ.get('CONTEXT_PROVIDER_MAX_WORKERS', '8'))
+
+# Weather cache (seconds): fresh TTL, extra window served stale while refreshing,
+# how long failed lookups are remembered, and how long the last successful lookup is
+# kept to serve instead of the default weather when the API can't be called
+# (rate limited, circuit open, down)
+WEATHER_CACHE_TTL = int(os.environ.get('WEATHER_CACHE_TTL', '600'))
+WEATHER_CACHE_STALE_TTL = int(os.environ.get('WEATHER_CACHE_STALE_TTL', '300'))
+WEATHER_CACHE_NEGATIVE_TTL = int(os.environ.get('WEATHER_CACHE_NEGATIVE_TTL', '60'))
+WEATHER_CACHE_FALLBACK_TTL = int(os.environ.get('WEATHER_CACHE_FALLBACK_TTL', '86400'))
+WEATHER_CACHE_MAX_ENTRIES = int(os.environ.get('WEATHER_CACHE_MAX_ENTRIES', '1024'))
+
+# Concurrent identical weather/fitness lookups in a process share one upstream call.
+# With SINGLE_FLIGHT_CACHE_LOCK the first worker to miss a location also takes a
+# cache lock (held at most SINGLE_FLIGHT_LOCK_TIMEOUT seconds) and other workers
+# wait up to SINGLE_FLIGHT_LOCK_WAIT seconds for its result to be cached
+SINGLE_FLIGHT_CACHE_LOCK = os.environ.get('SINGLE_FLIGHT_CACHE_LOCK', 'False') == 'True'
+SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.environ.get('SINGLE_FLIGHT_LOCK_TIMEOUT', '10'))
+SINGLE_FLIGHT_LOCK_WAIT = float(os.environ.get('SINGLE_FLIGHT_LOCK_WAIT', '5'))
+
+# Meal plan memoization: generated plans are reused for the same day when the
+# diet, calorie target (in buckets of MEAL_PLAN_MEMO_CALORIE_BUCKET kcal), weather
+# class and fitness level match, without invoking the meal planner
+MEAL_PLAN_MEMO_ENABLED = os.environ.get('MEAL_PLAN_MEMO_ENABLED', 'True') == 'True'
+MEAL_PLAN_MEMO_TTL = int(os.environ.get('MEAL_PLAN_MEMO_TTL', '86400'))
+MEAL_PLAN_MEMO_CALORIE_BUCKET = int(os.environ.get('MEAL_PLAN_MEMO_CALORIE_BUCKET', '50'))
+MEAL_PLAN_MEMO_MAX_ENTRIES = int(os.environ.get('MEAL_PLAN_MEMO_MAX_ENTRIES', '4096'))
+
+# Serialized meal plans and each user's latest plan id (invalidated on change)
+MEAL_PLAN_CACHE_TTL = int(os.environ.get('MEAL_PLAN_CACHE_TTL', '3600'))
+MEAL_PLAN_CACHE_MAX_ENTRIES = int(os.environ.get('MEAL_PLAN_CACHE_MAX_ENTRIES', '4096'))
+
+# Meal plans read per database round trip when streaming an export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '500'))
+
 # static files
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -172,6 +333,7 @@ STATICFILES_DIRS = [
 
 # CORS settings
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 CSRF_TRUSTED_ORIGINS = [
     'https://0244711f62e247409045af2e587a4092.vfs.cloud9.eu-west-1.amazonaws.com', 'http://diet-planner.eba-npsheumz.eu-west-1.elasticbeanstalk.com/', 'http://ai-diet-planner-x23293519.s3-website-eu-west-1.amazonaws.com/',
@@ -0,0 +1,113 @@
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from api.cache import TieredCache, LRUCache, CacheStats
+
+# User columns kept in the token cache. The password hash is left out (deferred)
+# and only loaded if something asks for it.
+CACHED_USER_FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+
+# Token -> (user values, token created), shared by all workers, with a short-lived
+# in-process tier in front so most requests don't leave the process at all
+token_cache = TieredCache('auth_token', maxsize=settings.TOKEN_AUTH_CACHE_MAX_ENTRIES)
+local_token_cache = LRUCache(maxsize=settings.TOKEN_AUTH_CACHE_MAX_ENTRIES)
+token_cache_stats = CacheStats('auth_token')
+
+
+def get_token_cache_key(key):
+    # Hash the token so raw credentials never end up in the cache
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_expires_at(created):
+    """
+    Return when a token created at `created` expires, or None if tokens don't expire
+    """
+    if not settings.TOKEN_EXPIRY:
+        return None
+    return created + timedelta(seconds=settings.TOKEN_EXPIRY)
+
+
+def token_expired(token):
+    expires_at = token_expires_at(token.created)
+    return expires_at is not None and expires_at <= timezone.now()
+
+
+def get_or_refresh_token(user):
+    """
+    Return the user's auth token, replacing it if it has expired
+    """
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and token_expired(token):
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+def invalidate_token(key):
+    cache_key = get_token_cache_key(key)
+    local_token_cache.delete(cache_key)
+    token_cache.delete(cache_key)
+
+
+def invalidate_user_tokens(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that caches the token's user instead of querying it on every request
+    
+    Lookups go to an in-process LRU (TOKEN_AUTH_LOCAL_TTL seconds), then the shared
+    cache (TOKEN_AUTH_CACHE_TTL seconds), then the database. Deleting a token or
+    saving its user (e.g. deactivating them) invalidates it; other workers may keep
+    using their in-process copy for up to TOKEN_AUTH_LOCAL_TTL seconds.
+    Tokens older than TOKEN_EXPIRY seconds are rejected and deleted.
+    """
+    def authenticate_credentials(self, key):
+        cache_key = get_token_cache_key(key)
+        cached = local_token_cache.get(cache_key)
+        if cached is None:
+            cached = token_cache.get(cache_key)
+            if cached is not None:
+                local_token_cache.set(cache_key, cached, settings.TOKEN_AUTH_LOCAL_TTL)
+        
+        if cached is not None:
+            token_cache_stats.incr('hits')
+            user_values, created = cached
+        else:
+            token_cache_stats.incr('misses')
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            
+            user_values = [getattr(token.user, field) for field in CACHED_USER_FIELDS]
+            created = token.created
+            timeout = settings.TOKEN_AUTH_CACHE_TTL
+            expires_at = token_expires_at(created)
+            if expires_at is not None:
+                timeout = max(0, min(timeout, int((expires_at - timezone.now()).total_seconds())))
+            
+            token_cache.set(cache_key, (user_values, created), timeout)
+            local_token_cache.set(cache_key, (user_values, created), min(timeout, settings.TOKEN_AUTH_LOCAL_TTL))
+        
+        # A fresh instance per request, so requests never share a mutable User
+        user = User.from_db('default', CACHED_USER_FIELDS, user_values)
+        token = Token.from_db('default', ['key', 'user_id', 'created'], [key, user.pk, created])
+        token.user = user
+        
+        if token_expired(token):
+            token.delete()
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        
+        return user, token
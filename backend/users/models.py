@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token, invalidate_user_tokens
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -31,6 +33,66 @@ class UserProfile(models.Model):
     fitness_api_id = models.CharField(max_length=100, blank=True, help_text="ID for the fitness tracker API")
     location = models.CharField(max_length=100, blank=True, help_text="City, Country")
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def _snapshot(self, attnames):
+        # Record the database values of these fields, for get_dirty_fields()
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            loaded_values = self._loaded_values = {}
+        for attname in attnames:
+            if attname in self.__dict__:
+                loaded_values[attname] = self.__dict__[attname]
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Also how deferred fields are loaded on first access
+        if fields is None:
+            self._snapshot(field.attname for field in self._meta.concrete_fields)
+        else:
+            self._snapshot(self._meta.get_field(name).attname for name in fields)
+    
+    def get_dirty_fields(self):
+        """
+        Names of the fields changed since the profile was loaded or last saved,
+        or None if it isn't tracked (not saved yet)
+        
+        Fields set without having been loaded (deferred with only()/defer())
+        count as changed.
+        """
+        loaded_values = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded_values is None:
+            return None
+        return [
+            field.attname for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (
+                field.attname not in loaded_values or self.__dict__[field.attname] != loaded_values[field.attname]
+            )
+        ]
+    
+    def save(self, *args, **kwargs):
+        """
+        Save the profile, writing only the fields that changed (nothing at all if
+        none did) unless update_fields is given
+        """
+        if kwargs.get('update_fields') is None:
+            dirty_fields = self.get_dirty_fields()
+            if dirty_fields is not None:
+                if not dirty_fields:
+                    return
+                kwargs['update_fields'] = dirty_fields
+        
+        super().save(*args, **kwargs)
+        # Only the fields written are clean now; other pending changes stay dirty
+        if kwargs.get('update_fields') is None:
+            self._snapshot(field.attname for field in self._meta.concrete_fields)
+        else:
+            self._snapshot(self._meta.get_field(name).attname for name in kwargs['update_fields'])
+    
     def __str__(self):
         return f"{self.user.username}'s profile"
 
@@ -40,5 +102,19 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def save_user_profile(sender, instance, created, **kwargs):
+    # Only a profile already loaded on this user can have unsaved changes;
+    # loading it here would cost a query on every user save (e.g. each login)
+    if not created and User.profile.related.is_cached(instance):
+        instance.profile.save()
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # Cached tokens carry a copy of the user; a last_login bump alone doesn't matter
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_user_tokens(instance.id)
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
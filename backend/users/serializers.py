@@ -25,9 +25,9 @@ class UserSerializer(serializers.ModelSerializer):
         instance.email = validated_data.get('email', instance.email)
         instance.first_name = validated_data.get('first_name', instance.first_name)
         instance.last_name = validated_data.get('last_name', instance.last_name)
-        instance.save()
+        instance.save(update_fields=['username', 'email', 'first_name', 'last_name'])
         
-        # Update UserProfile instance
+        # Update UserProfile instance (only changed fields are written)
         for attr, value in profile_data.items():
             setattr(profile, attr, value)
         profile.save()
@@ -1,3 +1,133 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import local_token_cache
+from .models import UserProfile
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_token_cache.clear()
+        self.user = User.objects.create_user(username='ivy', password='secret-pass-123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+    
+    def test_repeat_requests_skip_token_query(self):
+        self.client.get('/api/meal-plans/jobs/00000000-0000-0000-0000-000000000000/')
+        
+        # Only the job lookup itself hits the database
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/meal-plans/jobs/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+    
+    def test_cached_user_is_a_fresh_instance_without_password(self):
+        self.client.get('/api/users/profile/')
+        response = self.client.get('/api/users/profile/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'ivy')
+        self.assertEqual(response.wsgi_request.user.get_deferred_fields(), {'password'})
+    
+    def test_logout_revokes_cached_token(self):
+        self.client.get('/api/users/profile/')
+        self.assertEqual(self.client.post('/api/users/logout/').status_code, 204)
+        
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, 401)
+    
+    def test_deactivation_revokes_cached_token(self):
+        self.client.get('/api/users/profile/')
+        self.user.is_active = False
+        self.user.save()
+        
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, 401)
+    
+    @override_settings(TOKEN_EXPIRY=3600)
+    def test_expired_token_is_rejected_and_login_issues_new_one(self):
+        Token.objects.filter(key=self.token.key).update(created=self.token.created - timedelta(hours=2))
+        
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, 401)
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        
+        response = APIClient().post('/api/users/login/', {'username': 'ivy', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['token'], self.token.key)
+
+
+class ProfileWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='jack', password='secret-pass-123')
+    
+    def test_login_does_not_touch_profile(self):
+        Token.objects.create(user=self.user)
+        client = APIClient()
+        
+        # User lookup and token lookup - no profile load or write
+        with self.assertNumQueries(2):
+            response = client.post('/api/users/login/', {'username': 'jack', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+    
+    def test_registration_query_count(self):
+        data = {'username': 'kate', 'email': 'kate@example.com', 'password': 'secret-pass-123',
+                'confirm_password': 'secret-pass-123'}
+        
+        # Username uniqueness check, then user, profile and token inserts
+        with self.assertNumQueries(4):
+            response = APIClient().post('/api/users/register/', data)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(UserProfile.objects.filter(user__username='kate').exists())
+    
+    def test_profile_saves_only_changed_fields(self):
+        profile = UserProfile.objects.get(user=self.user)
+        with self.assertNumQueries(0):
+            profile.save()
+        
+        profile.weight = 72.5
+        with self.assertNumQueries(1) as queries:
+            profile.save()
+        self.assertIn('"weight"', queries.captured_queries[0]['sql'])
+        self.assertNotIn('"allergies"', queries.captured_queries[0]['sql'])
+        self.assertEqual(UserProfile.objects.get(user=self.user).weight, 72.5)
+    
+    def test_deferred_fields_are_saved_when_set(self):
+        profile = UserProfile.objects.only('location').get(user=self.user)
+        profile.age = 55
+        profile.save()
+        
+        self.assertEqual(UserProfile.objects.get(user=self.user).age, 55)
+        
+        # Loading a deferred field doesn't make it dirty
+        profile = UserProfile.objects.only('location').get(user=self.user)
+        self.assertEqual(profile.weight, None)
+        with self.assertNumQueries(0):
+            profile.save()
+    
+    def test_explicit_update_fields_keeps_other_changes_dirty(self):
+        profile = UserProfile.objects.get(user=self.user)
+        profile.age = 41
+        profile.location = 'Dublin'
+        profile.save(update_fields=['location'])
+        profile.save()
+        
+        saved = UserProfile.objects.get(user=self.user)
+        self.assertEqual((saved.age, saved.location), (41, 'Dublin'))
+    
+    def test_profile_update_writes_profile_once(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(id=self.user.id))
+        
+        # Profile load, user update, cached token invalidation and profile update
+        with self.assertNumQueries(4) as queries:
+            response = client.patch('/api/users/profile/', {'profile': {'age': 41}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        
+        profile_updates = [query for query in queries.captured_queries
+                           if query['sql'].startswith('UPDATE "users_userprofile"')]
+        self.assertEqual(len(profile_updates), 1)
+        self.assertEqual(UserProfile.objects.get(user=self.user).age, 41)
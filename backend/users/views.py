@@ -5,6 +5,7 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from .serializers import UserSerializer, UserRegistrationSerializer
+from .authentication import get_or_refresh_token
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
 from django.views import View
@@ -21,7 +22,7 @@ class UserRegistrationView(APIView):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            token, created = Token.objects.get_or_create(user=user)
+            token = Token.objects.create(user=user)
             return Response({
                 'token': token.key,
                 'user_id': user.id,
@@ -40,7 +41,7 @@ class UserLoginView(APIView):
         
         user = authenticate(username=username, password=password)
         if user:
-            token, created = Token.objects.get_or_create(user=user)
+            token = get_or_refresh_token(user)
             return Response({
                 'token': token.key,
                 'user_id': user.id,
@@ -53,8 +54,8 @@ class UserLogoutView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        # Delete the token to logout
-        request.user.auth_token.delete()
+        # Delete the token to logout (this also drops it from the token cache)
+        Token.objects.filter(user=request.user).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
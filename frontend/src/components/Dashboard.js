@@ -1,9 +1,22 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
 import { API_BASE_URL } from '../config';
 
+// crypto.randomUUID() only exists in secure contexts (HTTPS or localhost), and the
+// S3 website endpoint is plain HTTP, so fall back to a v4 UUID from getRandomValues
+const createIdempotencyKey = () => {
+  if (window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+  bytes[6] = (bytes[6] & 0x0f) | 0x40;
+  bytes[8] = (bytes[8] & 0x3f) | 0x80;
+  const hex = Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+};
+
 const Dashboard = () => {
   const { currentUser } = useAuth();
   const [mealPlans, setMealPlans] = useState([]);
@@ -20,13 +33,17 @@ const Dashboard = () => {
     steps: 5000,
     active_minutes: 30
   });
+  // Idempotency-Key (and request body) of the current generate attempt, reused if
+  // the same request is retried
+  const idempotencyKey = useRef(null);
   
   // Fetch meal plans on component mount
   useEffect(() => {
     const fetchMealPlans = async () => {
       try {
-        const response = await axios.get(`${API_BASE_URL}/api/meal-plans/`);
-        setMealPlans(response.data);
+        // The history list only needs plan summaries, not the nested meals
+        const response = await axios.get(`${API_BASE_URL}/api/meal-plans/?summary=1`);
+        setMealPlans(response.data.results);
         
         // Try to get the latest meal plan
         const latestResponse = await axios.get(`${API_BASE_URL}/api/meal-plans/latest/`);
@@ -74,13 +91,28 @@ const Dashboard = () => {
         requestData.manual_fitness_data = manualFitnessData;
       }
       
-      const response = await axios.post(`${API_BASE_URL}/api/meal-plans/generate/`, requestData);
+      // The server rejects a key reused for a different request, so a changed form gets a new one
+      const requestBody = JSON.stringify(requestData);
+      if (!idempotencyKey.current || idempotencyKey.current.body !== requestBody) {
+        idempotencyKey.current = { key: createIdempotencyKey(), body: requestBody };
+      }
+      const response = await axios.post(`${API_BASE_URL}/api/meal-plans/generate/`, requestData, {
+        headers: { 'Idempotency-Key': idempotencyKey.current.key }
+      });
+      idempotencyKey.current = null;
       
       // Check for warnings
       if (response.data.warnings && response.data.warnings.length > 0) {
         setWarnings(response.data.warnings);
       }
       
+      // A repeated request returns the meal plan we already have
+      if (latestMealPlan && response.data.meal_plan_id === latestMealPlan.id) {
+        setGenerating(false);
+        setGenerationMessage('');
+        return;
+      }
+      
       setGenerationMessage('Your meal plan is being generated! It will appear here shortly.');
       
       // Poll for the new meal plan
@@ -113,7 +145,16 @@ const Dashboard = () => {
       
     } catch (error) {
       console.error('Error generating meal plan:', error);
-      setError('Failed to generate meal plan. Please try again later.');
+      // Keep the key for a retry if the request never got a response, or if the
+      // first request with it is still generating (409)
+      if (error.response && error.response.status !== 409) {
+        idempotencyKey.current = null;
+      }
+      if (error.response && error.response.status === 409) {
+        setError('Your meal plan is still being generated. Please try again in a moment.');
+      } else {
+        setError('Failed to generate meal plan. Please try again later.');
+      }
       setGenerating(false);
       setGenerationMessage('');
       
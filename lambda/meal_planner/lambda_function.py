@@ -1,5 +1,24 @@
 import json
 import random
+from types import MappingProxyType
+
+import nutrition
+from nutrition import MEAL_TYPES, ACTIVITY_MULTIPLIERS, MEAL_CALORIE_DISTRIBUTION, get_carb_ratio
+
+# Preferred meal name prefixes by weather
+COMFORT_MEAL_PREFERENCES = MappingProxyType({
+    'breakfast': ('Oatmeal', 'Warm Breakfast Bowl'),
+    'lunch': ('Hearty Soup', 'Stew'),
+    'dinner': ('Casserole', 'Warm Bowl'),
+    'snack': ('Hot Chocolate', 'Warm Nuts')
+})
+
+REGULAR_MEAL_PREFERENCES = MappingProxyType({
+    'breakfast': ('Smoothie Bowl', 'Egg Breakfast'),
+    'lunch': ('Salad Bowl', 'Sandwich'),
+    'dinner': ('Grilled Protein', 'Rice Bowl'),
+    'snack': ('Fruit Plate', 'Yogurt')
+})
 
 def get_base_calorie_needs(user_data):
     """Calculate base calorie needs using the Harris-Benedict equation"""
@@ -17,19 +36,23 @@ def get_base_calorie_needs(user_data):
 
 def get_activity_multiplier(activity_level):
     """Return activity multiplier based on user's activity level"""
-    multipliers = {
-        'sedentary': 1.2,
-        'light': 1.375,
-        'moderate': 1.55,
-        'active': 1.725,
-        'very_active': 1.9
-    }
-    return multipliers.get(activity_level, 1.55)
+    return ACTIVITY_MULTIPLIERS.get(activity_level, 1.55)
+
+def get_plan_inputs(user_data, weather_data, fitness_data):
+    """Return the calorie target, protein ratio and weather meal preferences for a user"""
+    # Adjust base calorie needs for activity level, weather and fitness data
+    calories = get_base_calorie_needs(user_data) * get_activity_multiplier(user_data.get('activity_level', 'moderate'))
+    calories, meal_preferences = adjust_for_weather(calories, weather_data)
+    calories, protein_ratio = adjust_for_fitness(calories, fitness_data)
+    return calories, protein_ratio, meal_preferences
+
+def get_rng(seed=None):
+    """Random generator for meal selection - seeded plans are reproducible"""
+    return random if seed is None else random.Random(seed)
 
 def adjust_for_weather(calories, weather_data):
     """Adjust calories based on weather conditions"""
     temperature = weather_data.get('temperature', 20)
-    condition = weather_data.get('weather_condition', 'Clear').lower()
     
     # Temperature adjustments
     if temperature < 10:  # Cold weather
@@ -37,25 +60,18 @@ def adjust_for_weather(calories, weather_data):
     elif temperature > 30:  # Hot weather
         calories *= 0.95  # Decrease by 5% for hot weather
     
+    return calories, get_weather_meal_preferences(weather_data)
+
+def get_weather_meal_preferences(weather_data):
+    """Preferred meal name prefixes for the weather conditions"""
+    condition = weather_data.get('weather_condition', 'Clear').lower()
+    
     # Weather condition adjustments
     if 'rain' in condition or 'snow' in condition:
         # Comfort foods for rainy/snowy days
-        meal_preferences = {
-            'breakfast': ['Oatmeal', 'Warm Breakfast Bowl'],
-            'lunch': ['Hearty Soup', 'Stew'],
-            'dinner': ['Casserole', 'Warm Bowl'],
-            'snack': ['Hot Chocolate', 'Warm Nuts']
-        }
-    else:
-        # Regular options
-        meal_preferences = {
-            'breakfast': ['Smoothie Bowl', 'Egg Breakfast'],
-            'lunch': ['Salad Bowl', 'Sandwich'],
-            'dinner': ['Grilled Protein', 'Rice Bowl'],
-            'snack': ['Fruit Plate', 'Yogurt']
-        }
-    
-    return calories, meal_preferences
+        return COMFORT_MEAL_PREFERENCES
+    # Regular options
+    return REGULAR_MEAL_PREFERENCES
 
 def adjust_for_fitness(calories, fitness_data):
     """Adjust calories based on fitness activity"""
@@ -71,236 +87,276 @@ def adjust_for_fitness(calories, fitness_data):
     
     return calories, protein_ratio
 
-def generate_meal(meal_type, calories, protein_ratio, dietary_preference, meal_name_preference=None):
+# Meal database, built once per container. Entries are read-only; selection returns copies.
+MEAL_OPTIONS = {
+    'omnivore': {
+        'breakfast': [
+            {
+                'name': 'Scrambled Eggs with Toast',
+                'description': 'Fluffy scrambled eggs with whole grain toast and avocado',
+                'ingredients': 'Eggs, Whole grain bread, Avocado, Salt, Pepper',
+                'preparation': 'Whisk eggs with salt and pepper. Scramble in a non-stick pan. Toast bread and serve with sliced avocado.'
+            },
+            {
+                'name': 'Greek Yogurt Parfait',
+                'description': 'Creamy Greek yogurt with mixed berries and granola',
+                'ingredients': 'Greek yogurt, Mixed berries, Granola, Honey',
+                'preparation': 'Layer yogurt, berries, and granola in a bowl. Drizzle with honey.'
+            }
+        ],
+        'lunch': [
+            {
+                'name': 'Grilled Chicken Salad',
+                'description': 'Grilled chicken breast over mixed greens with vinaigrette',
+                'ingredients': 'Chicken breast, Mixed greens, Cherry tomatoes, Cucumber, Olive oil, Balsamic vinegar',
+                'preparation': 'Grill chicken. Toss vegetables with olive oil and vinegar. Serve chicken over greens.'
+            },
+            {
+                'name': 'Turkey and Avocado Wrap',
+                'description': 'Lean turkey with avocado and vegetables in a whole grain wrap',
+                'ingredients': 'Turkey slices, Avocado, Whole grain wrap, Lettuce, Tomato, Mustard',
+                'preparation': 'Lay out wrap. Layer with turkey, avocado, and vegetables. Roll up and slice.'
+            }
+        ],
+        'dinner': [
+            {
+                'name': 'Baked Salmon with Quinoa',
+                'description': 'Herb-baked salmon fillet with fluffy quinoa and steamed vegetables',
+                'ingredients': 'Salmon fillet, Quinoa, Broccoli, Lemon, Herbs, Olive oil',
+                'preparation': 'Bake salmon with herbs and lemon. Cook quinoa according to package. Steam broccoli. Serve together.'
+            },
+            {
+                'name': 'Lean Beef Stir Fry',
+                'description': 'Lean beef strips stir-fried with colorful vegetables and brown rice',
+                'ingredients': 'Lean beef, Brown rice, Bell peppers, Broccoli, Carrots, Soy sauce, Ginger, Garlic',
+                'preparation': 'Cook brown rice. Stir-fry beef with garlic and ginger. Add vegetables and soy sauce. Serve over rice.'
+            }
+        ],
+        'snack': [
+            {
+                'name': 'Apple with Almond Butter',
+                'description': 'Crisp apple slices with creamy almond butter',
+                'ingredients': 'Apple, Almond butter',
+                'preparation': 'Slice apple and serve with a side of almond butter for dipping.'
+            },
+            {
+                'name': 'Mixed Nuts and Dried Fruit',
+                'description': 'Energy-boosting mix of nuts and dried fruit',
+                'ingredients': 'Almonds, Walnuts, Cashews, Dried cranberries, Dried apricots',
+                'preparation': 'Mix all ingredients in a small container.'
+            }
+        ]
+    },
+    'vegetarian': {
+        # Similar structure with vegetarian options
+        'breakfast': [
+            {
+                'name': 'Veggie Omelette',
+                'description': 'Fluffy omelette with sautéed vegetables and cheese',
+                'ingredients': 'Eggs, Bell peppers, Spinach, Onion, Cheese, Salt, Pepper',
+                'preparation': 'Whisk eggs. Sauté vegetables. Pour eggs over vegetables and cook. Fold in half and serve.'
+            }
+        ],
+        'lunch': [
+            {
+                'name': 'Mediterranean Quinoa Bowl',
+                'description': 'Protein-rich quinoa with Mediterranean vegetables and feta cheese',
+                'ingredients': 'Quinoa, Cucumber, Cherry tomatoes, Olives, Feta cheese, Olive oil, Lemon juice',
+                'preparation': 'Cook quinoa. Chop vegetables. Mix all ingredients with olive oil and lemon juice.'
+            }
+        ],
+        'dinner': [
+            {
+                'name': 'Vegetable Stir Fry with Tofu',
+                'description': 'Crispy tofu with colorful vegetables in a savory sauce',
+                'ingredients': 'Tofu, Brown rice, Mixed vegetables, Soy sauce, Ginger, Garlic',
+                'preparation': 'Press and cube tofu. Cook rice. Stir-fry tofu until crispy. Add vegetables and sauce.'
+            }
+        ],
+        'snack': [
+            {
+                'name': 'Hummus with Veggie Sticks',
+                'description': 'Creamy hummus with fresh vegetable sticks',
+                'ingredients': 'Hummus, Carrots, Celery, Bell peppers',
+                'preparation': 'Cut vegetables into sticks. Serve with a side of hummus.'
+            }
+        ]
+    },
+    'vegan': {
+        # Vegan meal options
+        'breakfast': [
+            {
+                'name': 'Vegan Smoothie Bowl',
+                'description': 'Thick fruit smoothie topped with granola and seeds',
+                'ingredients': 'Banana, Berries, Almond milk, Maple syrup, Granola, Chia seeds',
+                'preparation': 'Blend fruit with almond milk. Pour into bowl. Top with granola and seeds.'
+            }
+        ],
+        'lunch': [
+            {
+                'name': 'Chickpea Avocado Sandwich',
+                'description': 'Mashed chickpea and avocado on whole grain bread',
+                'ingredients': 'Chickpeas, Avocado, Whole grain bread, Lettuce, Tomato, Lemon juice',
+                'preparation': 'Mash chickpeas and avocado with lemon juice. Spread on bread. Add vegetables.'
+            }
+        ],
+        'dinner': [
+            {
+                'name': 'Lentil Curry with Brown Rice',
+                'description': 'Spiced lentil curry with fluffy brown rice',
+                'ingredients': 'Lentils, Brown rice, Coconut milk, Curry spices, Onion, Garlic, Vegetables',
+                'preparation': 'Cook lentils. Sauté vegetables with spices. Add coconut milk. Serve over rice.'
+            }
+        ],
+        'snack': [
+            {
+                'name': 'Energy Balls',
+                'description': 'No-bake energy balls with dates and nuts',
+                'ingredients': 'Dates, Nuts, Oats, Coconut flakes, Cocoa powder',
+                'preparation': 'Process dates and nuts. Mix with other ingredients. Roll into balls. Refrigerate.'
+            }
+        ]
+    },
+    'keto': {
+        # Keto meal options
+        'breakfast': [
+            {
+                'name': 'Avocado and Bacon Eggs',
+                'description': 'Fried eggs with avocado and crispy bacon',
+                'ingredients': 'Eggs, Avocado, Bacon, Butter, Salt, Pepper',
+                'preparation': 'Fry bacon until crispy. Cook eggs in bacon fat. Serve with sliced avocado.'
+            }
+        ],
+        'lunch': [
+            {
+                'name': 'Keto Cobb Salad',
+                'description': 'Low-carb salad with avocado, eggs, bacon, and blue cheese',
+                'ingredients': 'Lettuce, Avocado, Hard-boiled eggs, Bacon, Blue cheese, Olive oil, Vinegar',
+                'preparation': 'Arrange lettuce. Top with chopped eggs, bacon, avocado, and cheese. Dress with oil and vinegar.'
+            }
+        ],
+        'dinner': [
+            {
+                'name': 'Baked Salmon with Asparagus',
+                'description': 'Fatty fish with low-carb vegetables',
+                'ingredients': 'Salmon fillet, Asparagus, Butter, Lemon, Herbs, Salt, Pepper',
+                'preparation': 'Bake salmon and asparagus with butter, lemon, and herbs until fish flakes easily.'
+            }
+        ],
+        'snack': [
+            {
+                'name': 'Cheese and Olive Plate',
+                'description': 'Assorted cheeses with olives and nuts',
+                'ingredients': 'Cheese varieties, Olives, Almonds',
+                'preparation': 'Arrange cheese, olives, and nuts on a plate.'
+            }
+        ]
+    },
+    'paleo': {
+        # Paleo meal options
+        'breakfast': [
+            {
+                'name': 'Sweet Potato Hash with Eggs',
+                'description': 'Sweet potato hash with fried eggs',
+                'ingredients': 'Sweet potato, Eggs, Onion, Bell pepper, Olive oil, Herbs',
+                'preparation': 'Sauté diced sweet potato with vegetables until soft. Top with fried eggs.'
+            }
+        ],
+        'lunch': [
+            {
+                'name': 'Tuna Avocado Lettuce Wraps',
+                'description': 'Tuna salad wrapped in lettuce leaves',
+                'ingredients': 'Tuna, Avocado, Lettuce leaves, Red onion, Olive oil, Lemon juice',
+                'preparation': 'Mix tuna with mashed avocado, diced onion, olive oil, and lemon juice. Wrap in lettuce leaves.'
+            }
+        ],
+        'dinner': [
+            {
+                'name': 'Grilled Steak with Roasted Vegetables',
+                'description': 'Grass-fed steak with colorful roasted vegetables',
+                'ingredients': 'Steak, Zucchini, Bell peppers, Carrots, Olive oil, Herbs',
+                'preparation': 'Grill steak to desired doneness. Roast vegetables with olive oil and herbs.'
+            }
+        ],
+        'snack': [
+            {
+                'name': 'Apple Slices with Almond Butter',
+                'description': 'Fresh apple with natural almond butter',
+                'ingredients': 'Apple, Almond butter',
+                'preparation': 'Slice apple and serve with a side of almond butter.'
+            }
+        ]
+    }
+}
+
+def _freeze_catalog(options):
+    """Make the meal database read-only so warm invocations can't mutate shared state"""
+    return MappingProxyType({
+        diet: MappingProxyType({
+            meal_type: tuple(MappingProxyType(dict(meal)) for meal in meals)
+            for meal_type, meals in meals_by_type.items()
+        })
+        for diet, meals_by_type in options.items()
+    })
+
+MEAL_CATALOG = _freeze_catalog(MEAL_OPTIONS)
+del MEAL_OPTIONS
+
+def _filter_by_name_preference(options, meal_name_preference):
+    """Options whose name starts with one of the preferred prefixes, or all options if none match"""
+    if meal_name_preference:
+        filtered = tuple(meal for meal in options if any(meal['name'].startswith(pref) for pref in meal_name_preference))
+        if filtered:
+            return filtered
+    return options
+
+def _build_options_index():
+    """Precompute the options for every diet x meal type x weather preference combination"""
+    index = {}
+    for diet, meals_by_type in MEAL_CATALOG.items():
+        for meal_type, options in meals_by_type.items():
+            index[(diet, meal_type, ())] = options
+            for preferences in (COMFORT_MEAL_PREFERENCES, REGULAR_MEAL_PREFERENCES):
+                prefixes = preferences[meal_type]
+                index[(diet, meal_type, prefixes)] = _filter_by_name_preference(options, prefixes)
+    return index
+
+def get_meal_options(dietary_preference, meal_type, meal_name_preference=None):
+    """Return the candidate meals for a diet and meal type, narrowed by name preference"""
+    if dietary_preference not in MEAL_CATALOG:
+        dietary_preference = 'omnivore'
+    prefixes = tuple(meal_name_preference or ())
+    
+    options = _OPTIONS_INDEX.get((dietary_preference, meal_type, prefixes))
+    if options is None:
+        options = _filter_by_name_preference(MEAL_CATALOG[dietary_preference][meal_type], prefixes)
+    return options
+
+_OPTIONS_INDEX = _build_options_index()
+
+def generate_meal(meal_type, calories, protein_ratio, dietary_preference, meal_name_preference=None, rng=random):
     """Generate a meal based on type, calories, and dietary preference"""
-    carb_ratio = 0.5 if meal_type == 'breakfast' else 0.4
+    carb_ratio = get_carb_ratio(meal_type)
     fat_ratio = 1 - protein_ratio - carb_ratio
     
-    # Calorie distribution across meals
-    meal_calorie_distribution = {
-        'breakfast': 0.25,
-        'lunch': 0.35,
-        'dinner': 0.3,
-        'snack': 0.1
-    }
-    
-    meal_calories = calories * meal_calorie_distribution[meal_type]
+    meal_calories = calories * MEAL_CALORIE_DISTRIBUTION[meal_type]
     
     # Calculate macros
     protein_grams = (meal_calories * protein_ratio) / 4  # 4 calories per gram of protein
     carb_grams = (meal_calories * carb_ratio) / 4  # 4 calories per gram of carb
     fat_grams = (meal_calories * fat_ratio) / 9  # 9 calories per gram of fat
     
-    # Meal database
-    meal_options = {
-        'omnivore': {
-            'breakfast': [
-                {
-                    'name': 'Scrambled Eggs with Toast',
-                    'description': 'Fluffy scrambled eggs with whole grain toast and avocado',
-                    'ingredients': 'Eggs, Whole grain bread, Avocado, Salt, Pepper',
-                    'preparation': 'Whisk eggs with salt and pepper. Scramble in a non-stick pan. Toast bread and serve with sliced avocado.'
-                },
-                {
-                    'name': 'Greek Yogurt Parfait',
-                    'description': 'Creamy Greek yogurt with mixed berries and granola',
-                    'ingredients': 'Greek yogurt, Mixed berries, Granola, Honey',
-                    'preparation': 'Layer yogurt, berries, and granola in a bowl. Drizzle with honey.'
-                }
-            ],
-            'lunch': [
-                {
-                    'name': 'Grilled Chicken Salad',
-                    'description': 'Grilled chicken breast over mixed greens with vinaigrette',
-                    'ingredients': 'Chicken breast, Mixed greens, Cherry tomatoes, Cucumber, Olive oil, Balsamic vinegar',
-                    'preparation': 'Grill chicken. Toss vegetables with olive oil and vinegar. Serve chicken over greens.'
-                },
-                {
-                    'name': 'Turkey and Avocado Wrap',
-                    'description': 'Lean turkey with avocado and vegetables in a whole grain wrap',
-                    'ingredients': 'Turkey slices, Avocado, Whole grain wrap, Lettuce, Tomato, Mustard',
-                    'preparation': 'Lay out wrap. Layer with turkey, avocado, and vegetables. Roll up and slice.'
-                }
-            ],
-            'dinner': [
-                {
-                    'name': 'Baked Salmon with Quinoa',
-                    'description': 'Herb-baked salmon fillet with fluffy quinoa and steamed vegetables',
-                    'ingredients': 'Salmon fillet, Quinoa, Broccoli, Lemon, Herbs, Olive oil',
-                    'preparation': 'Bake salmon with herbs and lemon. Cook quinoa according to package. Steam broccoli. Serve together.'
-                },
-                {
-                    'name': 'Lean Beef Stir Fry',
-                    'description': 'Lean beef strips stir-fried with colorful vegetables and brown rice',
-                    'ingredients': 'Lean beef, Brown rice, Bell peppers, Broccoli, Carrots, Soy sauce, Ginger, Garlic',
-                    'preparation': 'Cook brown rice. Stir-fry beef with garlic and ginger. Add vegetables and soy sauce. Serve over rice.'
-                }
-            ],
-            'snack': [
-                {
-                    'name': 'Apple with Almond Butter',
-                    'description': 'Crisp apple slices with creamy almond butter',
-                    'ingredients': 'Apple, Almond butter',
-                    'preparation': 'Slice apple and serve with a side of almond butter for dipping.'
-                },
-                {
-                    'name': 'Mixed Nuts and Dried Fruit',
-                    'description': 'Energy-boosting mix of nuts and dried fruit',
-                    'ingredients': 'Almonds, Walnuts, Cashews, Dried cranberries, Dried apricots',
-                    'preparation': 'Mix all ingredients in a small container.'
-                }
-            ]
-        },
-        'vegetarian': {
-            # Similar structure with vegetarian options
-            'breakfast': [
-                {
-                    'name': 'Veggie Omelette',
-                    'description': 'Fluffy omelette with sautéed vegetables and cheese',
-                    'ingredients': 'Eggs, Bell peppers, Spinach, Onion, Cheese, Salt, Pepper',
-                    'preparation': 'Whisk eggs. Sauté vegetables. Pour eggs over vegetables and cook. Fold in half and serve.'
-                }
-            ],
-            'lunch': [
-                {
-                    'name': 'Mediterranean Quinoa Bowl',
-                    'description': 'Protein-rich quinoa with Mediterranean vegetables and feta cheese',
-                    'ingredients': 'Quinoa, Cucumber, Cherry tomatoes, Olives, Feta cheese, Olive oil, Lemon juice',
-                    'preparation': 'Cook quinoa. Chop vegetables. Mix all ingredients with olive oil and lemon juice.'
-                }
-            ],
-            'dinner': [
-                {
-                    'name': 'Vegetable Stir Fry with Tofu',
-                    'description': 'Crispy tofu with colorful vegetables in a savory sauce',
-                    'ingredients': 'Tofu, Brown rice, Mixed vegetables, Soy sauce, Ginger, Garlic',
-                    'preparation': 'Press and cube tofu. Cook rice. Stir-fry tofu until crispy. Add vegetables and sauce.'
-                }
-            ],
-            'snack': [
-                {
-                    'name': 'Hummus with Veggie Sticks',
-                    'description': 'Creamy hummus with fresh vegetable sticks',
-                    'ingredients': 'Hummus, Carrots, Celery, Bell peppers',
-                    'preparation': 'Cut vegetables into sticks. Serve with a side of hummus.'
-                }
-            ]
-        },
-        'vegan': {
-            # Vegan meal options
-            'breakfast': [
-                {
-                    'name': 'Vegan Smoothie Bowl',
-                    'description': 'Thick fruit smoothie topped with granola and seeds',
-                    'ingredients': 'Banana, Berries, Almond milk, Maple syrup, Granola, Chia seeds',
-                    'preparation': 'Blend fruit with almond milk. Pour into bowl. Top with granola and seeds.'
-                }
-            ],
-            'lunch': [
-                {
-                    'name': 'Chickpea Avocado Sandwich',
-                    'description': 'Mashed chickpea and avocado on whole grain bread',
-                    'ingredients': 'Chickpeas, Avocado, Whole grain bread, Lettuce, Tomato, Lemon juice',
-                    'preparation': 'Mash chickpeas and avocado with lemon juice. Spread on bread. Add vegetables.'
-                }
-            ],
-            'dinner': [
-                {
-                    'name': 'Lentil Curry with Brown Rice',
-                    'description': 'Spiced lentil curry with fluffy brown rice',
-                    'ingredients': 'Lentils, Brown rice, Coconut milk, Curry spices, Onion, Garlic, Vegetables',
-                    'preparation': 'Cook lentils. Sauté vegetables with spices. Add coconut milk. Serve over rice.'
-                }
-            ],
-            'snack': [
-                {
-                    'name': 'Energy Balls',
-                    'description': 'No-bake energy balls with dates and nuts',
-                    'ingredients': 'Dates, Nuts, Oats, Coconut flakes, Cocoa powder',
-                    'preparation': 'Process dates and nuts. Mix with other ingredients. Roll into balls. Refrigerate.'
-                }
-            ]
-        },
-        'keto': {
-            # Keto meal options
-            'breakfast': [
-                {
-                    'name': 'Avocado and Bacon Eggs',
-                    'description': 'Fried eggs with avocado and crispy bacon',
-                    'ingredients': 'Eggs, Avocado, Bacon, Butter, Salt, Pepper',
-                    'preparation': 'Fry bacon until crispy. Cook eggs in bacon fat. Serve with sliced avocado.'
-                }
-            ],
-            'lunch': [
-                {
-                    'name': 'Keto Cobb Salad',
-                    'description': 'Low-carb salad with avocado, eggs, bacon, and blue cheese',
-                    'ingredients': 'Lettuce, Avocado, Hard-boiled eggs, Bacon, Blue cheese, Olive oil, Vinegar',
-                    'preparation': 'Arrange lettuce. Top with chopped eggs, bacon, avocado, and cheese. Dress with oil and vinegar.'
-                }
-            ],
-            'dinner': [
-                {
-                    'name': 'Baked Salmon with Asparagus',
-                    'description': 'Fatty fish with low-carb vegetables',
-                    'ingredients': 'Salmon fillet, Asparagus, Butter, Lemon, Herbs, Salt, Pepper',
-                    'preparation': 'Bake salmon and asparagus with butter, lemon, and herbs until fish flakes easily.'
-                }
-            ],
-            'snack': [
-                {
-                    'name': 'Cheese and Olive Plate',
-                    'description': 'Assorted cheeses with olives and nuts',
-                    'ingredients': 'Cheese varieties, Olives, Almonds',
-                    'preparation': 'Arrange cheese, olives, and nuts on a plate.'
-                }
-            ]
-        },
-        'paleo': {
-            # Paleo meal options
-            'breakfast': [
-                {
-                    'name': 'Sweet Potato Hash with Eggs',
-                    'description': 'Sweet potato hash with fried eggs',
-                    'ingredients': 'Sweet potato, Eggs, Onion, Bell pepper, Olive oil, Herbs',
-                    'preparation': 'Sauté diced sweet potato with vegetables until soft. Top with fried eggs.'
-                }
-            ],
-            'lunch': [
-                {
-                    'name': 'Tuna Avocado Lettuce Wraps',
-                    'description': 'Tuna salad wrapped in lettuce leaves',
-                    'ingredients': 'Tuna, Avocado, Lettuce leaves, Red onion, Olive oil, Lemon juice',
-                    'preparation': 'Mix tuna with mashed avocado, diced onion, olive oil, and lemon juice. Wrap in lettuce leaves.'
-                }
-            ],
-            'dinner': [
-                {
-                    'name': 'Grilled Steak with Roasted Vegetables',
-                    'description': 'Grass-fed steak with colorful roasted vegetables',
-                    'ingredients': 'Steak, Zucchini, Bell peppers, Carrots, Olive oil, Herbs',
-                    'preparation': 'Grill steak to desired doneness. Roast vegetables with olive oil and herbs.'
-                }
-            ],
-            'snack': [
-                {
-                    'name': 'Apple Slices with Almond Butter',
-                    'description': 'Fresh apple with natural almond butter',
-                    'ingredients': 'Apple, Almond butter',
-                    'preparation': 'Slice apple and serve with a side of almond butter.'
-                }
-            ]
-        }
-    }
-    
+    return select_meal(meal_type, dietary_preference, meal_name_preference,
+                       meal_calories, protein_grams, carb_grams, fat_grams, rng)
+
+def select_meal(meal_type, dietary_preference, meal_name_preference, meal_calories, protein_grams, carb_grams, fat_grams,
+                rng=random):
+    """Pick a meal from the catalog and set its calories and macros"""
     # Select a meal preferentially from the weather-based preferences if available
-    options = meal_options.get(dietary_preference, meal_options['omnivore'])[meal_type]
+    options = get_meal_options(dietary_preference, meal_type, meal_name_preference)
     
-    if meal_name_preference and any(meal['name'].startswith(pref) for pref in meal_name_preference for meal in options):
-        filtered_options = [meal for meal in options if any(meal['name'].startswith(pref) for pref in meal_name_preference)]
-        selected_meal = random.choice(filtered_options)
-    else:
-        selected_meal = random.choice(options)
+    # Copy the catalog entry - it is shared by every invocation in this container
+    selected_meal = dict(rng.choice(options))
     
     # Adjust the meal for the calculated calories and macros
     selected_meal['calories'] = round(meal_calories)
@@ -310,8 +366,104 @@ def generate_meal(meal_type, calories, protein_ratio, dietary_preference, meal_n
     
     return selected_meal
 
+def generate_meal_plans_batch(entries):
+    """Generate meal plans for a list of {user_data, weather_data, fitness_data} entries
+    
+    Calorie and macro calculations run across the whole batch at once, with the
+    NumPy engine in nutrition.py when available. If any entry has bad data the
+    batch is redone per entry so only that entry fails.
+    Returns one meal plan (or {'error': ...}) per entry, in order.
+    """
+    try:
+        return _generate_meal_plans(entries)
+    except Exception:
+        plans = []
+        for entry in entries:
+            try:
+                plans.extend(_generate_meal_plans([entry]))
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                plans.append({'error': str(e)})
+        return plans
+
+def _generate_meal_plans(entries):
+    if nutrition.np is not None:
+        return _generate_meal_plans_vectorized(entries)
+    return _generate_meal_plans_scalar(entries)
+
+def _generate_meal_plans_vectorized(entries):
+    user_data = [entry.get('user_data', {}) for entry in entries]
+    weather_data = [entry.get('weather_data', {}) for entry in entries]
+    fitness_data = [entry.get('fitness_data', {}) for entry in entries]
+    
+    _, _, macros, valid = nutrition.compute_nutrition(user_data, weather_data, fitness_data)
+    # Plain Python floats so rounding matches the scalar path exactly
+    macros = {
+        meal_type: {key: values.tolist() for key, values in meal_macros.items()}
+        for meal_type, meal_macros in macros.items()
+    }
+    
+    plans = []
+    for i, (entry, data, weather) in enumerate(zip(entries, user_data, weather_data)):
+        if not valid[i]:
+            plans.append({'error': 'Missing or invalid numeric input'})
+            continue
+        
+        dietary_preference = data.get('dietary_preference', 'omnivore')
+        meal_preferences = get_weather_meal_preferences(weather)
+        rng = get_rng(entry.get('seed'))
+        plans.append({
+            meal_type: select_meal(
+                meal_type, dietary_preference, meal_preferences.get(meal_type),
+                macros[meal_type]['calories'][i], macros[meal_type]['protein'][i],
+                macros[meal_type]['carbs'][i], macros[meal_type]['fat'][i], rng
+            )
+            for meal_type in MEAL_TYPES
+        })
+    return plans
+
+def _generate_meal_plans_scalar(entries):
+    user_data = [entry.get('user_data', {}) for entry in entries]
+    weather_data = [entry.get('weather_data', {}) for entry in entries]
+    fitness_data = [entry.get('fitness_data', {}) for entry in entries]
+    
+    base_calories = [get_base_calorie_needs(data) for data in user_data]
+    adjusted_calories = [
+        calories * get_activity_multiplier(data.get('activity_level', 'moderate'))
+        for calories, data in zip(base_calories, user_data)
+    ]
+    weather_adjusted = [adjust_for_weather(calories, data) for calories, data in zip(adjusted_calories, weather_data)]
+    fitness_adjusted = [
+        adjust_for_fitness(calories, data)
+        for (calories, _), data in zip(weather_adjusted, fitness_data)
+    ]
+    
+    plans = []
+    for entry, data, (_, meal_preferences), (final_calories, protein_ratio) in zip(
+            entries, user_data, weather_adjusted, fitness_adjusted):
+        rng = get_rng(entry.get('seed'))
+        plans.append({
+            meal_type: generate_meal(
+                meal_type, final_calories, protein_ratio,
+                data.get('dietary_preference', 'omnivore'), meal_preferences.get(meal_type), rng
+            )
+            for meal_type in MEAL_TYPES
+        })
+    return plans
+
 def lambda_handler(event, context):
-    """Main Lambda function handler"""
+    """Main Lambda function handler
+    
+    Accepts either a single {user_data, weather_data, fitness_data} event, returning
+    one meal plan, or a batch event {'users': [...]} of such entries, returning
+    {'meal_plans': [...]} in the same order. An entry with a 'seed' always gets
+    the same meals for the same inputs.
+    """
+    if 'users' in event:
+        return {
+            'meal_plans': generate_meal_plans_batch(event.get('users') or [])
+        }
+    
     try:
         # Extract data from the event
         user_data = event.get('user_data', {})
@@ -321,25 +473,18 @@ def lambda_handler(event, context):
         # Get user's dietary preference
         dietary_preference = user_data.get('dietary_preference', 'omnivore')
         
-        # Calculate base calorie needs
-        base_calories = get_base_calorie_needs(user_data)
-        
-        # Adjust for activity level
-        activity_level = user_data.get('activity_level', 'moderate')
-        adjusted_calories = base_calories * get_activity_multiplier(activity_level)
-        
-        # Adjust for weather
-        weather_adjusted_calories, meal_preferences = adjust_for_weather(adjusted_calories, weather_data)
+        # Calculate calorie needs, adjusted for activity level, weather and fitness data
+        final_calories, protein_ratio, meal_preferences = get_plan_inputs(user_data, weather_data, fitness_data)
         
-        # Adjust for fitness data
-        final_calories, protein_ratio = adjust_for_fitness(weather_adjusted_calories, fitness_data)
+        # Seeded events always select the same meals
+        rng = get_rng(event.get('seed'))
         
         # Generate meal plan
         meal_plan = {
-            'breakfast': generate_meal('breakfast', final_calories, protein_ratio, dietary_preference, meal_preferences.get('breakfast')),
-            'lunch': generate_meal('lunch', final_calories, protein_ratio, dietary_preference, meal_preferences.get('lunch')),
-            'dinner': generate_meal('dinner', final_calories, protein_ratio, dietary_preference, meal_preferences.get('dinner')),
-            'snack': generate_meal('snack', final_calories, protein_ratio, dietary_preference, meal_preferences.get('snack'))
+            'breakfast': generate_meal('breakfast', final_calories, protein_ratio, dietary_preference, meal_preferences.get('breakfast'), rng),
+            'lunch': generate_meal('lunch', final_calories, protein_ratio, dietary_preference, meal_preferences.get('lunch'), rng),
+            'dinner': generate_meal('dinner', final_calories, protein_ratio, dietary_preference, meal_preferences.get('dinner'), rng),
+            'snack': generate_meal('snack', final_calories, protein_ratio, dietary_preference, meal_preferences.get('snack'), rng)
         }
         
         # Return the generated meal plan
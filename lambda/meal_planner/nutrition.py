@@ -0,0 +1,111 @@
+"""Nutrition constants and a NumPy-backed engine for computing many users at once
+
+The array functions mirror the scalar functions in lambda_function.py operation
+by operation, so every float they produce is identical to the scalar result.
+NumPy is optional: without it `np` is None and callers use the scalar path.
+"""
+try:
+    import numpy as np
+except ImportError:  # e.g. deployed without the NumPy layer
+    np = None
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+    'very_active': 1.9
+}
+
+# Calorie distribution across meals
+MEAL_CALORIE_DISTRIBUTION = {
+    'breakfast': 0.25,
+    'lunch': 0.35,
+    'dinner': 0.3,
+    'snack': 0.1
+}
+
+def get_carb_ratio(meal_type):
+    """Carbohydrate share of a meal's calories"""
+    return 0.5 if meal_type == 'breakfast' else 0.4
+
+def build_input_arrays(user_data, weather_data, fitness_data):
+    """Turn lists of user/weather/fitness dicts into column arrays, using the scalar defaults
+    
+    Missing numeric values (None) become NaN and show up as non-finite calorie targets.
+    """
+    def column(dicts, key, default):
+        return np.array([data.get(key, default) for data in dicts], dtype=float)
+    
+    return {
+        'age': column(user_data, 'age', 30),
+        'is_male': np.array([data.get('gender', 'male') == 'male' for data in user_data], dtype=bool),
+        'height': column(user_data, 'height', 170),
+        'weight': column(user_data, 'weight', 70),
+        'activity_multiplier': np.array(
+            [ACTIVITY_MULTIPLIERS.get(data.get('activity_level', 'moderate'), 1.55) for data in user_data],
+            dtype=float
+        ),
+        'temperature': column(weather_data, 'temperature', 20),
+        'steps': column(fitness_data, 'steps', 0),
+        'calories_burned': column(fitness_data, 'calories_burned', 0),
+    }
+
+def compute_calorie_targets(age, is_male, height, weight, activity_multiplier,
+                            temperature, steps, calories_burned):
+    """Daily calorie targets and protein ratios for arrays of users
+    
+    Vectorized get_base_calorie_needs -> get_activity_multiplier ->
+    adjust_for_weather -> adjust_for_fitness.
+    """
+    # Harris-Benedict, same operation order as the scalar version
+    bmr = np.where(
+        is_male,
+        88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age),
+        447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+    )
+    calories = bmr * activity_multiplier
+    
+    # Cold weather +5%, hot weather -5%
+    calories = np.where(temperature < 10, calories * 1.05,
+                        np.where(temperature > 30, calories * 0.95, calories))
+    
+    # Very active users get 300 extra calories and a higher protein ratio
+    active = (steps > 10000) | (calories_burned > 500)
+    calories = np.where(active, calories + 300, calories)
+    protein_ratio = np.where(active, 0.3, 0.25)
+    
+    return calories, protein_ratio
+
+def compute_meal_macros(calories, protein_ratio):
+    """Per-meal calories and macro grams (unrounded) for arrays of calorie targets
+    
+    Returns {meal_type: {'calories', 'protein', 'carbs', 'fat'}} of arrays.
+    """
+    macros = {}
+    for meal_type in MEAL_TYPES:
+        carb_ratio = get_carb_ratio(meal_type)
+        fat_ratio = 1 - protein_ratio - carb_ratio
+        meal_calories = calories * MEAL_CALORIE_DISTRIBUTION[meal_type]
+        
+        macros[meal_type] = {
+            'calories': meal_calories,
+            'protein': (meal_calories * protein_ratio) / 4,  # 4 calories per gram of protein
+            'carbs': (meal_calories * carb_ratio) / 4,  # 4 calories per gram of carb
+            'fat': (meal_calories * fat_ratio) / 9,  # 9 calories per gram of fat
+        }
+    return macros
+
+def compute_nutrition(user_data, weather_data, fitness_data):
+    """Calorie targets, protein ratios and per-meal macros for lists of input dicts
+    
+    Returns (calories, protein_ratio, macros, valid) where valid is False for rows
+    with missing numeric inputs (the scalar functions would raise for those).
+    """
+    inputs = build_input_arrays(user_data, weather_data, fitness_data)
+    calories, protein_ratio = compute_calorie_targets(**inputs)
+    valid = (np.isfinite(calories) & np.isfinite(inputs['temperature'])
+             & np.isfinite(inputs['steps']) & np.isfinite(inputs['calories_burned']))
+    return calories, protein_ratio, compute_meal_macros(calories, protein_ratio), valid
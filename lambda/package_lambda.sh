@@ -3,7 +3,9 @@
 # Create a deployment package for our Lambda function
 mkdir -p package
 cd meal_planner
-zip -r ../package/lambda_function.zip lambda_function.py
+# NumPy is not bundled - attach a NumPy layer (e.g. AWSSDKPandas) to use the
+# vectorized nutrition engine, without it the scalar path is used
+zip -r ../package/lambda_function.zip lambda_function.py nutrition.py
 cd ..
 
 echo "Lambda package created at package/lambda_function.zip"